@@ -0,0 +1,260 @@
+class AimsOutputIndex:
+    '''
+    Description
+    Index of the blocks of data in an FHI-aims output, e.g. of a geometry optimisation or MD run.
+    A single streaming pass over the file records the byte offset of every geometry, energy, force, Mulliken
+    and Hirshfeld block, after which any block is read by seeking directly to it. Quantities of every step can
+    then be collected without scanning the file again, in a time depending only on the data requested.
+    The index can be saved next to the output and is reused as long as the output is unchanged.
+
+    The blocks of each kind are numbered in the order they appear, so step n of 'energy' is the n-th energy
+    printed. Mulliken and Hirshfeld analyses are usually only performed at the end of a run.
+    Geometry step n is the structure of energy step n. In a geometry optimisation these are the input geometry
+    followed by each updated structure, which is printed after the energy of the previous structure.
+    In MD each structure is printed after its own energy, so the input geometry, which repeats the first
+    structure, is left out of the geometry steps.
+    '''
+    # Text identifying the first line of each kind of block
+    markers = {
+        'geometry': ('Input geometry:', 'Updated atomic structure:',
+                     'Atomic structure (and velocities) as used in the preceding time step',
+                     'Atomic structure that was used in the preceding time step of the wrapper'),
+        'energy': ('Energy and forces in a compact form:',),
+        'forces': ('Total atomic forces',),
+        'mulliken charge': ('Summary of the per-atom charge analysis:',),
+        'mulliken spin': ('Summary of the per-atom spin analysis:',),
+        'hirshfeld': ('Performing Hirshfeld analysis of fragment charges and moments.',)
+    }
+    # Geometry markers of MD runs, whose structures follow their energies
+    md_markers = ('Atomic structure (and velocities) as used in the preceding time step',
+                  'Atomic structure that was used in the preceding time step of the wrapper')
+    # Lines that may follow an atom within a geometry block
+    atom_continuation = ('velocity', 'constrain_relaxation', 'initial_moment', 'initial_charge')
+
+    def __init__(self, fname, cache=False, chunk_size=2**24):
+        '''
+        Parameters:
+
+        fname: String
+            Filename of the FHI-aims output
+        cache: Boolean
+            Whether to load the index from, or save it to, fname + '.index.npz'
+        chunk_size: Integer
+            Number of bytes read at a time while building the index
+        '''
+        self.fname = fname
+        self.index_name = fname + '.index.npz'
+
+        if not (cache and self.load()):
+            self.build(chunk_size)
+            if cache:
+                self.save()
+
+    def build(self, chunk_size=2**24):
+        '''
+        Description
+        Records the offsets of all blocks and the number of atoms in one pass over the output
+
+        Parameters:
+
+        chunk_size: Integer
+            Number of bytes read at a time
+        '''
+        import numpy as np
+        from carmm.analyse.mulliken import _read_line_chunks
+
+        offsets = {(name, marker): [] for name, markers in self.markers.items() for marker in markers}
+        natoms_line = None
+        position = 0
+        with open(self.fname, 'rb') as read_stream:
+            for chunk in _read_line_chunks(read_stream, chunk_size):
+                for name, markers in self.markers.items():
+                    for marker in markers:
+                        start = chunk.find(marker.encode())
+                        while start >= 0:
+                            offsets[(name, marker)].append(position + chunk.rfind(b"\n", 0, start) + 1)
+                            start = chunk.find(marker.encode(), start + 1)
+
+                if natoms_line is None:
+                    start = chunk.find(b"| Number of atoms")
+                    if start >= 0:
+                        natoms_line = chunk[start:chunk.find(b"\n", start)]
+
+                position += len(chunk)
+
+        if any(offsets[('geometry', marker)] for marker in self.md_markers):
+            offsets[('geometry', 'Input geometry:')] = []
+
+        self.offsets = {name: np.array(sorted(sum([offsets[(name, marker)] for marker in markers], [])),
+                                       dtype=np.int64) for name, markers in self.markers.items()}
+        self.natoms = int(natoms_line.split()[-1]) if natoms_line is not None else 0
+        self._key = self._get_key()
+
+    def save(self):
+        '''
+        Description
+        Writes the index to fname + '.index.npz', with the size and modification time of the output
+        '''
+        import numpy as np
+
+        arrays = {'offsets ' + name: offsets for name, offsets in self.offsets.items()}
+        np.savez(self.index_name, natoms=self.natoms, key=self._key, **arrays)
+
+    def load(self):
+        '''
+        Description
+        Reads the index saved for the output, if there is one matching its current size and modification time
+
+        Returns:
+            True if the index was loaded, False otherwise
+        '''
+        import os
+        import numpy as np
+
+        if not os.path.isfile(self.index_name):
+            return False
+
+        with np.load(self.index_name) as index:
+            if not np.array_equal(index['key'], self._get_key()) or \
+                    any('offsets ' + name not in index for name in self.markers):
+                return False
+
+            self.offsets = {name: index['offsets ' + name] for name in self.markers}
+            self.natoms = int(index['natoms'])
+            self._key = index['key']
+
+        return True
+
+    def get_n_steps(self, name='energy'):
+        '''
+        Description
+        Returns the number of blocks of the kind name (see markers) in the output
+        '''
+        return len(self.offsets[name])
+
+    def get_positions(self, step=-1):
+        '''
+        Description
+        Returns the atomic positions (natoms, 3) in Angstrom of a geometry step, see the class description.
+        The block is read up to its last atom, and a ValueError is raised if it does not hold natoms atoms.
+        '''
+        import numpy as np
+
+        positions = []
+        with open(self.fname, 'rb') as read_stream:
+            read_stream.seek(self.offsets['geometry'][step])
+            read_stream.readline()
+            for line in iter(read_stream.readline, b""):
+                words = line.decode().split()
+                if "Species" in words:
+                    # Input geometry
+                    positions.append(words[-3:])
+                elif words and words[0] == "atom":
+                    positions.append(words[1:4])
+                elif not words or (positions and words[0] not in self.atom_continuation):
+                    break
+
+        if len(positions) != self.natoms:
+            raise ValueError("Geometry step {} holds {} atoms instead of {}".format(step, len(positions),
+                                                                                    self.natoms))
+
+        return np.array(positions, dtype=float)
+
+    def get_energy(self, step=-1, free=False):
+        '''
+        Description
+        Returns the total energy (corrected) in eV of a step, or the electronic free energy if free is True
+        '''
+        lines = self._read_lines('energy', step, 4)
+
+        return float(lines[3 if free else 2].split(':')[1].split()[0])
+
+    def get_forces(self, step=-1):
+        '''
+        Description
+        Returns the forces (natoms, 3) in eV/Angstrom on the atoms of a step
+        '''
+        import numpy as np
+
+        lines = self._read_lines('forces', step, self.natoms, offset=1)
+
+        return np.array([line.split()[2:5] for line in lines], dtype=float)
+
+    def get_mulliken_charges(self, step=-1):
+        '''
+        Description
+        Returns the Mulliken charges (natoms) of an analysis, as extract_mulliken_charge does for the last one
+        '''
+        import numpy as np
+
+        lines = self._read_lines('mulliken charge', step, self.natoms, offset=3)
+
+        return np.array([line.split()[3] for line in lines], dtype=float)
+
+    def get_mulliken_spins(self, step=-1):
+        '''
+        Description
+        Returns the Mulliken spin moments (natoms) of an analysis, as extract_mulliken_spin does for the last one
+        '''
+        import numpy as np
+
+        lines = self._read_lines('mulliken spin', step, self.natoms, offset=3)
+
+        return np.array([line.split()[2] for line in lines], dtype=float)
+
+    def get_hirshfeld(self, step=-1):
+        '''
+        Description
+        Returns all quantities of a Hirshfeld analysis, as parse_hirshfeld does for the last one
+        '''
+        from carmm.analyse.hirshfeld import _read_hirshfeld_block, _parse_hirshfeld_lines
+
+        with open(self.fname, 'rb') as read_stream:
+            lines = _read_hirshfeld_block(read_stream, self.offsets['hirshfeld'][step])
+
+        return _parse_hirshfeld_lines(lines, self.natoms)
+
+    def get_series(self, name, steps=None):
+        '''
+        Description
+        Collects a quantity over several steps, reading only the blocks of those steps
+
+        Parameters:
+
+        name: String
+            One of 'positions', 'energy', 'forces', 'mulliken_charges' or 'mulliken_spins'
+        steps: List of Integers
+            Steps to include, all steps with this quantity by default
+
+        Returns:
+            numpy array with the quantity of each step along the first axis
+        '''
+        import numpy as np
+
+        getter = getattr(self, 'get_' + name)
+        if steps is None:
+            blocks = {'positions': 'geometry', 'mulliken_charges': 'mulliken charge', 'mulliken_spins': 'mulliken spin'}
+            steps = range(self.get_n_steps(blocks.get(name, name)))
+
+        return np.array([getter(step) for step in steps])
+
+    def _read_lines(self, name, step, nlines, offset=0):
+        '''
+        Reads nlines lines, offset lines after the start of block step of the kind name
+        '''
+        from carmm.analyse.mulliken import _read_lines_at
+
+        with open(self.fname, 'rb') as read_stream:
+            lines = _read_lines_at(read_stream, self.offsets[name][step], nlines, offset)
+
+        return lines
+
+    def _get_key(self):
+        '''
+        Size and modification time identifying the version of the output the index refers to
+        '''
+        from carmm.analyse.mulliken import _get_file_key
+
+        key = _get_file_key(self.fname, content_hash=False)
+
+        return [key['size'], key['mtime']]
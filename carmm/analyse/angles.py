@@ -1,6 +1,7 @@
 def analyse_all_angles(model, verbose=True):
     '''
     Returns a table of bond angle analysis for the supplied model.
+    All angles are found in a single pass over the connectivity of the model (see get_all_angles).
 
     Parameters:
 
@@ -10,15 +11,11 @@ def analyse_all_angles(model, verbose=True):
         Whether to print information to screen
     Returns:
         - list of all elemental combinations
-        - list of indices for each elemental combination
-        - list of all angle values for each combination of indices
+        - list of numpy arrays (nangles, 3) of indices for each elemental combination
+        - list of numpy arrays (nangles) of all angle values for each combination of indices
     '''
 
-    # set() to ensure unique chemical symbols list
-    list_of_symbols = list(set(model.get_chemical_symbols()))
-    # Product to get all possible arrangements
-    from itertools import product
-    angles_element_combinations = product(list_of_symbols, repeat=3)
+    angles = get_all_angles(model)
 
     # Table heading
     if verbose:
@@ -27,13 +24,12 @@ def analyse_all_angles(model, verbose=True):
     angles_elements = []
     angles_indices = []
     angles_values = []
-    # Iterate over all arrangements of chemical symbols
-    for angles in angles_element_combinations:
-        ABC_indices, ABC_values = analyse_angles(model, angles[0], angles[1], angles[2], verbose=verbose, multirow=True)
-        if len(ABC_indices[0]) > 0:
-            angles_elements.append(angles)
-            angles_indices.append(ABC_indices[0])
-            angles_values.append(ABC_values[0])
+    for label, (ABC_indices, ABC_values) in angles.items():
+        angles_elements.append(tuple(label.split("-")))
+        angles_indices.append(ABC_indices)
+        angles_values.append(ABC_values)
+        if verbose:
+            print_angles_table_row(label, ABC_values)
 
     return angles_elements, angles_indices, angles_values
 
@@ -51,65 +47,304 @@ def analyse_angles(model, A, B, C, verbose=True, multirow=False):
         Whether to print information to screen
     multirow: Boolean
         Whether we are returning multiple sets of results in a Table
-    '''
 
-    from ase.geometry.analysis import Analysis
-    analysis = Analysis(model)
+    Returns:
+        ABC_indices: List of list of tuples, with the A, B and C atom indices of each angle
+            (as ase Analysis.get_angles)
+        ABC_values: List of list of floats in degrees, or None if no A-B-C angles are present
+            (as ase Analysis.get_values)
+    '''
 
     print_ABC = A + "-" + B + "-" + C
-    # Retrieve bonds and values
-    ABC_indices = analysis.get_angles(A, B, C)
-    if len(ABC_indices[0]) == 0:
+    # Retrieve angles and values
+    angles = get_all_angles(model)
+    if print_ABC not in angles:
+        ABC_indices = [[]]
         ABC_values = None
     else:
-        ABC_values = analysis.get_values(ABC_indices)
+        ABC_indices = [[tuple(angle) for angle in angles[print_ABC][0].tolist()]]
+        ABC_values = [angles[print_ABC][1].tolist()]
 
     if verbose and ABC_values is not None:
         # Table header
         if not multirow:
             print_angles_table_header()
         # Table contents
-        import numpy as np
-        print('{:<9.8s}{:<6.0f}{:>4.4f}{:^12.4f}{:>4.4f}'.format(
-            print_ABC, len(ABC_indices[0]), np.average(ABC_values),
-            np.amin(ABC_values), np.amax(ABC_values)))
+        print_angles_table_row(print_ABC, ABC_values)
 
     return ABC_indices, ABC_values
 
+def get_all_angles(model, mult=1):
+    '''
+    Enumerates every A-B-C angle formed by two bonds of a common atom B and groups them by element triple.
+    Bonds are defined as in ase.geometry.analysis.Analysis, and the angles are evaluated from the shortest
+    periodic image of each bond, as ase Atoms.get_angle with mic=True. As in Analysis.get_angles,
+    A-B-A angles are listed once, while for A != C the angle is listed under both A-B-C and C-B-A.
+
+    Parameters:
+
+    model: Atoms object
+        The structure that needs to be interrogated
+    mult: Float
+        Multiplier for the natural cutoffs defining the bonds
+
+    Returns:
+        Dictionary keyed by angle label e.g. "H-O-H", with element triples ordered by chemical symbol.
+        Each entry is a tuple of a numpy array (nangles, 3) of A, B and C indices, sorted by B, A and C,
+        and a numpy array (nangles) of angle values in degrees.
+    '''
+    import numpy as np
+    from carmm.analyse.connectivity import get_connectivity
+
+    connectivity = get_connectivity(model, mult=mult)
+    adjacency = connectivity.adjacency
+
+    # Bonds of each atom as stored in the adjacency, ignoring bonds to an atom's own periodic image
+    centre = np.repeat(np.arange(len(model)), np.diff(adjacency.indptr))
+    neighbour = adjacency.indices
+    bonds = np.flatnonzero(centre != neighbour)
+    centre, neighbour, vectors = centre[bonds], neighbour[bonds], connectivity.vectors[bonds]
+    degree = np.bincount(centre, minlength=len(model))
+    start = np.concatenate(([0], np.cumsum(degree)))
+
+    # Every ordered pair of bonds (first, second) sharing the same centre atom
+    pairs_per_bond = degree[centre]
+    first = np.repeat(np.arange(len(centre)), pairs_per_bond)
+    block_start = np.cumsum(pairs_per_bond) - pairs_per_bond
+    second = start[centre[first]] + np.arange(len(first)) - np.repeat(block_start, pairs_per_bond)
+
+    symbols = sorted(set(model.get_chemical_symbols()))
+    symbol_index = np.searchsorted(symbols, model.get_chemical_symbols())
+    a, b, c = neighbour[first], centre[first], neighbour[second]
+
+    # A-B-A angles only once, with the lower index first
+    keep = (a < c) | (symbol_index[a] != symbol_index[c])
+    first, second, a, b, c = first[keep], second[keep], a[keep], b[keep], c[keep]
+
+    u, v = vectors[first], vectors[second]
+    cosines = np.einsum('ij,ij->i', u, v) / (np.linalg.norm(u, axis=1) * np.linalg.norm(v, axis=1))
+    values = np.degrees(np.arccos(np.clip(cosines, -1, 1)))
+
+    nsymbols = len(symbols)
+    keys = (symbol_index[a] * nsymbols + symbol_index[b]) * nsymbols + symbol_index[c]
+    order = np.argsort(keys, kind='stable')
+    unique_keys, group_start = np.unique(keys[order], return_index=True)
+    triples = np.column_stack((a, b, c))[order]
+
+    angles = {}
+    for key, indices, group_values in zip(unique_keys, np.split(triples, group_start[1:]),
+                                          np.split(values[order], group_start[1:])):
+        label = "-".join(symbols[k] for k in (key // nsymbols ** 2, key // nsymbols % nsymbols, key % nsymbols))
+        angles[label] = (indices, group_values)
+
+    return angles
+
 def print_angles_table_header():
     print("-" * 40)
     print('{:<9.8s}{:<6.5s}{:>4.10s}{:^13.10s}{:>4.10s}'.format(
         "Angle", "Count", "Average", "Minimum", "Maximum"))
     print("-" * 40)
 
-'''
-## not working as intended as specific indices are needed
-def analyse_dihedrals(model):
-    from itertools import product
-    if isinstance(model, str) is True: #read file or Atoms object
+def print_angles_table_row(print_ABC, ABC_values):
+    import numpy as np
+    # Undefined (NaN) values, e.g. of linear dihedrals, are counted but left out of the average, minimum and maximum
+    defined = np.asarray(ABC_values)[~np.isnan(ABC_values)]
+    if defined.size == 0:
+        defined = np.array([np.nan])
+    print('{:<9.8s}{:<6.0f}{:>4.4f}{:^12.4f}{:>4.4f}'.format(
+        print_ABC, np.size(ABC_values), np.average(defined),
+        np.amin(defined), np.amax(defined)))
+
+def analyse_dihedrals(model, verbose=True, mult=1):
+    '''
+    Returns a table of dihedral angle analysis for the supplied model, see get_all_dihedrals.
+
+    Parameters:
+
+    model: Atoms object or string
+        The structure that needs to be interrogated, or a filename to read it from
+    verbose: Boolean
+        Whether to print information to screen
+    mult: Float
+        Multiplier for the natural cutoffs defining the bonds
+
+    Returns:
+        - list of all elemental combinations
+        - list of numpy arrays (ndihedrals, 4) of indices for each elemental combination
+        - list of numpy arrays (ndihedrals) of all dihedral values for each combination of indices
+    '''
+    if isinstance(model, str):
         from ase.io import read
         model = read(model)
 
-    analysis = Analysis(model)
-    dash = "-"*40
-    list_of_symbols = list(set(model.get_chemical_symbols())) #set to ensure unique chemical symbols list
-    all_angles = product(list_of_symbols, repeat=4)
-
-    print(dash)     #Table heading
-    print('{:<6.5s}{:<6.5s}{:>4.10s}{:^13.10s}{:>4.10s}'.format("Angle","Count","Average", "Minimum", "Maximum"))
-    print(dash)
-
-    for angles in all_angles:     #iterate over all arrangements of chemical symbols
-        A = angles[0]
-        B = angles[1]
-        C = angles[2]
-        D = angles[3]
-
-        print_ABC = A+'-'+B+'-'+C+'-'+D
-        ABC_Angle = analysis.get_dihedrals(A,B,C,D)
-
-        if not ABC_Angle == [[]]:   #make sure angles exist before retrieving values
-            ABC_AngleValues = analysis.get_values(ABC_Angle)
-            print('{:<6.8s}{:<6.0f}{:>4.4f}{:^12.4f}{:>4.4f}'.format(
-            print_ABC,len(ABC_Angle[0]), np.average(ABC_AngleValues),np.amin(ABC_AngleValues),np.amax(ABC_AngleValues)))
-'''
+    dihedrals = get_all_dihedrals(model, mult=mult)
+
+    if verbose:
+        print_dihedrals_table_header()
+
+    dihedrals_elements = []
+    dihedrals_indices = []
+    dihedrals_values = []
+    for label, (ABCD_indices, ABCD_values) in dihedrals.items():
+        dihedrals_elements.append(tuple(label.split("-")))
+        dihedrals_indices.append(ABCD_indices)
+        dihedrals_values.append(ABCD_values)
+        if verbose:
+            print_angles_table_row(label, ABCD_values)
+
+    return dihedrals_elements, dihedrals_indices, dihedrals_values
+
+def get_all_dihedrals(model, mult=1):
+    '''
+    Enumerates every bonded A-B-C-D chain of the model and evaluates its dihedral angle, grouped by element
+    quadruple. Bonds are defined as in ase.geometry.analysis.Analysis and the dihedrals are evaluated from
+    the shortest periodic image of each bond. Each chain is listed once, under whichever of A-B-C-D and
+    D-C-B-A comes first when ordered by chemical symbol. Chains closing a three-membered ring are excluded.
+
+    Parameters:
+
+    model: Atoms object
+        The structure that needs to be interrogated
+    mult: Float
+        Multiplier for the natural cutoffs defining the bonds
+
+    Returns:
+        Dictionary keyed by dihedral label e.g. "H-C-C-O". Each entry is a tuple of a numpy array
+        (ndihedrals, 4) of A, B, C and D indices and a numpy array (ndihedrals) of dihedral angles
+        in degrees between 0 and 360, NaN if one of the inner angles is linear.
+    '''
+    import numpy as np
+    from carmm.analyse.connectivity import get_connectivity
+
+    connectivity = get_connectivity(model, mult=mult)
+    adjacency = connectivity.adjacency
+
+    # Bonds of each atom as stored in the adjacency, ignoring bonds to an atom's own periodic image
+    centre = np.repeat(np.arange(len(model)), np.diff(adjacency.indptr))
+    neighbour = adjacency.indices
+    bonds = np.flatnonzero(centre != neighbour)
+    centre, neighbour, vectors = centre[bonds], neighbour[bonds], connectivity.vectors[bonds]
+    degree = np.bincount(centre, minlength=len(model))
+    start = np.concatenate(([0], np.cumsum(degree)))
+
+    # Central bonds B->C combined with every bond B->A and then every bond C->D
+    central, outer_b = _pair_with_bonds_of(np.arange(len(centre)), centre, start, degree)
+    keep = neighbour[outer_b] != neighbour[central]
+    central, outer_b = central[keep], outer_b[keep]
+    chain, outer_c = _pair_with_bonds_of(np.arange(len(central)), neighbour[central], start, degree)
+    central, outer_b = central[chain], outer_b[chain]
+
+    a, b, c, d = neighbour[outer_b], centre[central], neighbour[central], neighbour[outer_c]
+    keep = (d != b) & (d != a)
+
+    symbols = sorted(set(model.get_chemical_symbols()))
+    symbol_index = np.searchsorted(symbols, model.get_chemical_symbols())
+    nsymbols = len(symbols)
+    forward = ((symbol_index[a] * nsymbols + symbol_index[b]) * nsymbols + symbol_index[c]) * nsymbols \
+        + symbol_index[d]
+    reverse = ((symbol_index[d] * nsymbols + symbol_index[c]) * nsymbols + symbol_index[b]) * nsymbols \
+        + symbol_index[a]
+    # List each chain in one direction only
+    keep &= (forward < reverse) | ((forward == reverse) & (b < c))
+
+    values = _get_dihedral_values(-vectors[outer_b[keep]], vectors[central[keep]], vectors[outer_c[keep]])
+    chains = np.column_stack((a, b, c, d))[keep]
+    keys = forward[keep]
+
+    order = np.argsort(keys, kind='stable')
+    unique_keys, group_start = np.unique(keys[order], return_index=True)
+
+    dihedrals = {}
+    for key, indices, group_values in zip(unique_keys, np.split(chains[order], group_start[1:]),
+                                          np.split(values[order], group_start[1:])):
+        label = "-".join(symbols[key // nsymbols ** k % nsymbols] for k in (3, 2, 1, 0))
+        dihedrals[label] = (indices, group_values)
+
+    return dihedrals
+
+def track_dihedrals(trajectory, reference=None, mult=1, mic=True):
+    '''
+    Follows the dihedral angles of a fixed set of A-B-C-D chains over a whole trajectory, e.g. an MD run.
+    The chains are determined once from the reference frame (as in get_all_dihedrals), after which frames are
+    read and processed one at a time, so only one frame is held in memory.
+
+    Parameters:
+
+    trajectory: String, Trajectory or List of Atoms objects
+        Filename of an ASE trajectory, or any sequence of Atoms objects with the same atom ordering
+    reference: Atoms object or None
+        Structure from which the chains are taken. If None, the first frame is used.
+    mult: Float
+        Multiplier for the natural cutoffs used to define bonds
+    mic: Boolean
+        Whether bond vectors follow the minimum image convention
+
+    Returns:
+        chain_indices: numpy array (n_dihedrals, 4)
+            Indices of the atoms in each chain, grouped by element quadruple as in get_all_dihedrals
+        dihedrals: numpy array (n_frames, n_dihedrals)
+            Dihedral angle of each chain in each frame, in degrees
+    '''
+    import numpy as np
+    from ase.geometry import find_mic
+
+    if isinstance(trajectory, str):
+        from ase.io.trajectory import Trajectory
+        with Trajectory(trajectory) as traj:
+            return track_dihedrals(traj, reference=reference, mult=mult, mic=mic)
+
+    if reference is None:
+        reference = trajectory[0]
+
+    groups = get_all_dihedrals(reference, mult=mult).values()
+    chain_indices = np.concatenate([indices for indices, values in groups]) if groups \
+        else np.empty((0, 4), dtype=int)
+    dihedrals = np.empty((len(trajectory), len(chain_indices)))
+
+    for frame, atoms in enumerate(trajectory):
+        positions = atoms.get_positions()
+        vectors = np.diff(positions[chain_indices], axis=1).reshape(-1, 3)
+        if mic and atoms.pbc.any():
+            vectors = find_mic(vectors, atoms.cell, atoms.pbc)[0]
+        vectors = vectors.reshape(-1, 3, 3)
+        dihedrals[frame] = _get_dihedral_values(vectors[:, 0], vectors[:, 1], vectors[:, 2])
+
+    return chain_indices, dihedrals
+
+def _pair_with_bonds_of(items, atoms, start, degree):
+    '''
+    Repeats every item once for each bond of its atom, returning the repeated item indices and the bond indices
+    '''
+    import numpy as np
+
+    counts = degree[atoms]
+    repeated = np.repeat(items, counts)
+    block_start = np.cumsum(counts) - counts
+    bonds = np.repeat(start[atoms], counts) + np.arange(len(repeated)) - np.repeat(block_start, counts)
+
+    return repeated, bonds
+
+def _get_dihedral_values(v0, v1, v2):
+    '''
+    Dihedral angles in degrees of the vectors a0->a1, a1->a2 and a2->a3, as ase.geometry.get_dihedrals,
+    but returning NaN rather than raising an error for undefined dihedrals
+    '''
+    import numpy as np
+
+    v1n = v1 / np.linalg.norm(v1, axis=1)[:, None]
+    # Projections of v0 and v2 onto the plane perpendicular to v1
+    v = -v0 + np.einsum('ij,ij->i', v0, v1n)[:, None] * v1n
+    w = v2 - np.einsum('ij,ij->i', v2, v1n)[:, None] * v1n
+
+    x = np.einsum('ij,ij->i', v, w)
+    y = np.einsum('ij,ij->i', np.cross(v1n, v), w)
+    dihedrals = np.degrees(np.arctan2(y, x)) % 360
+    dihedrals[(np.linalg.norm(v, axis=1) < 1e-8) | (np.linalg.norm(w, axis=1) < 1e-8)] = np.nan
+
+    return dihedrals
+
+def print_dihedrals_table_header():
+    print("-" * 40)
+    print('{:<9.8s}{:<6.5s}{:>4.10s}{:^13.10s}{:>4.10s}'.format(
+        "Dihedral", "Count", "Average", "Minimum", "Maximum"))
+    print("-" * 40)
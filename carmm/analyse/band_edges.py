@@ -0,0 +1,67 @@
+def get_band_edges(energies, occupancies, threshold=0.5):
+    '''
+    Description
+    Determines the band edges from the eigenvalues and occupation numbers of all spin channels and k-points
+    at once. In each spin channel and k-point the occupied states are those before the first state with an
+    occupation below the threshold, as in MullikenData.get_homo.
+
+    Parameters:
+
+    energies: numpy array (nspin, nkpts, nstates)
+        Eigenvalues in eV, in ascending order for each spin channel and k-point
+    occupancies: numpy array (nspin, nkpts, nstates)
+        Occupation numbers of the states
+    threshold: Float
+        Occupation below which a state is counted as unoccupied
+
+    Returns:
+        Dictionary with the entries
+        homo, lumo: Floats
+            Highest occupied and lowest unoccupied eigenvalue over all spin channels and k-points
+        gap: Float
+            Band gap, zero if the HOMO lies above the LUMO (metals)
+        homo_spin, lumo_spin, gap_spin: numpy arrays (nspin)
+            The same for each spin channel separately
+        direct_gap: Float
+            Smallest gap between the HOMO and LUMO at the same k-point, over all spin channels
+        indirect: Boolean
+            Whether the band gap is smaller than the direct gap, i.e. HOMO and LUMO are at different k-points
+        homo_kpt, lumo_kpt: Integers
+            Indices of the k-points of the HOMO and LUMO
+        fermi: Float
+            Estimate of the Fermi level, midway between the HOMO and the LUMO
+        If no state of a k-point is occupied (unoccupied), its HOMO (LUMO) is taken as -inf (+inf).
+    '''
+    import numpy as np
+
+    energies = np.asarray(energies)
+    nstates = energies.shape[-1]
+
+    # Number of occupied states for every spin channel and k-point
+    unoccupied = np.asarray(occupancies) < threshold
+    n_occupied = np.where(unoccupied.any(axis=-1), unoccupied.argmax(axis=-1), nstates)
+
+    homo_kpts = np.take_along_axis(energies, np.maximum(n_occupied - 1, 0)[..., None], axis=-1)[..., 0]
+    homo_kpts = np.where(n_occupied > 0, homo_kpts, -np.inf)
+    lumo_kpts = np.take_along_axis(energies, np.minimum(n_occupied, nstates - 1)[..., None], axis=-1)[..., 0]
+    lumo_kpts = np.where(n_occupied < nstates, lumo_kpts, np.inf)
+
+    homo_spin = homo_kpts.max(axis=1)
+    lumo_spin = lumo_kpts.min(axis=1)
+    homo = float(homo_spin.max())
+    lumo = float(lumo_spin.min())
+    gap = max(lumo - homo, 0.0)
+    # The direct gap takes the band edges of each k-point over both spin channels, as the overall gap does
+    direct_gap = max(float((lumo_kpts.min(axis=0) - homo_kpts.max(axis=0)).min()), 0.0)
+
+    return {'homo': homo,
+            'lumo': lumo,
+            'gap': gap,
+            'homo_spin': homo_spin,
+            'lumo_spin': lumo_spin,
+            'gap_spin': np.maximum(lumo_spin - homo_spin, 0.0),
+            'direct_gap': direct_gap,
+            'indirect': bool(gap < direct_gap),
+            'homo_kpt': int(np.unravel_index(homo_kpts.argmax(), homo_kpts.shape)[1]),
+            'lumo_kpt': int(np.unravel_index(lumo_kpts.argmin(), lumo_kpts.shape)[1]),
+            'fermi': (homo + lumo) / 2}
@@ -1,4 +1,4 @@
-def get_sorted_distances(model, atoms_to_include=None):
+def get_sorted_distances(model, atoms_to_include=None, r_max=None, bins=None):
     '''
     Returns a sorted list of atomic distances in the model, selecting only those atoms of interest
     Current usage is for molecules and periodic solids (through mic).
@@ -9,39 +9,98 @@ def get_sorted_distances(model, atoms_to_include=None):
         The model from which the RDF is to be plotted
     atoms_to_include: Integer or List of Integers
         Atoms that you want included in the RDF
+    r_max: Float or None
+        If set, only distances shorter than r_max are collected using a periodic neighbour list,
+        so the full N x N distance matrix is never built. Note that all periodic images within
+        r_max are counted, rather than only the minimum image.
+    bins: Integer, List of floats or None
+        Only used together with r_max. If set, the distances are binned between 0 and r_max
+        and the histogram is returned instead of the distances.
 
     Returns:
 
     individual_lengths: List of floats
-        An sorted list of all lengths of bonds between all atoms in the model
-
+        An sorted list of all lengths of bonds between all atoms in the model.
+        If r_max is set, a sorted numpy array is returned instead, or a tuple of
+        (counts, bin_edges) numpy arrays if bins is also set.
 
     '''
+    import numpy as np
+
+    if r_max is not None:
+        individual_lengths = np.sort(_get_pair_distances(model, r_max, atoms_to_include))
+        if bins is not None:
+            return np.histogram(individual_lengths, bins=bins, range=(0.0, r_max))
+        return individual_lengths
 
     # get all distances in the model
     distances = model.get_all_distances(mic=True, vector=False)
 
-    # Define atoms_to_include
+    # Collect the upper triangle for every pair involving an atom we want
+    include = _get_inclusion_mask(len(model), atoms_to_include)
+    i, j = np.triu_indices(len(distances), k=1)
+    selected = include[i] | include[j]
+
+    return sorted(distances[i[selected], j[selected]].tolist())
+
+def _get_inclusion_mask(natoms, atoms_to_include=None):
+    '''
+    Returns a boolean array flagging the atoms of interest, as used to select atoms in get_sorted_distances
+
+    Parameters:
+
+    natoms: Integer
+        Number of atoms in the model
+    atoms_to_include: Integer, List of Integers or None
+        Atoms that should be flagged. If None, all atoms are flagged.
+    '''
+    import numpy as np
+
     if atoms_to_include is None:
-        atoms_to_include = [i for i in range(len(distances))]
-    elif isinstance(atoms_to_include, int):
-        atoms_to_include = [atoms_to_include]
+        return np.ones(natoms, dtype=bool)
+
+    include = np.zeros(natoms, dtype=bool)
+    include[np.atleast_1d(atoms_to_include)] = True
+
+    return include
+
+def _get_pair_distances(model, r_max, atoms_to_include=None):
+    '''
+    Returns the distances of all atom pairs closer than r_max, found with the ASE cell-list based
+    neighbour list so time and memory scale linearly with the number of atoms.
+    Each pair (including pairs of an atom with its own periodic image) is counted once.
+
+    Parameters:
+
+    model: Atoms object
+        The model from which distances are collected
+    r_max: Float
+        Distance cutoff in Angstrom
+    atoms_to_include: Integer, List of Integers or None
+        Only pairs involving at least one of these atoms are returned
+
+    Returns:
+        numpy array of floats (unsorted)
+    '''
+    from ase.neighborlist import neighbor_list
+
+    i, j, d, S = neighbor_list('ijdS', model, r_max)
 
-    individual_lengths = []
-    # This should be condensed to one for loop.
-    for i in range(len(distances)):
-        for j in range(i+1, len(distances[i])):
-            # Check if we are on a row/column for an atom we want.
-            if i in atoms_to_include or j in atoms_to_include:
-                individual_lengths.append(distances[i][j])
+    # Pairs are returned both ways, so keep i < j, and only one of the two shifts for periodic self-images
+    positive_shift = (S[:, 0] > 0) | ((S[:, 0] == 0) & ((S[:, 1] > 0) | ((S[:, 1] == 0) & (S[:, 2] > 0))))
+    keep = (i < j) | ((i == j) & positive_shift)
 
-    return sorted(individual_lengths)
+    if atoms_to_include is not None:
+        include = _get_inclusion_mask(len(model), atoms_to_include)
+        keep &= include[i] | include[j]
+
+    return d[keep]
 
 def analyse_all_bonds(model, verbose=True, abnormal=True):
     '''
     Analyse bonds and return all abnormal bond types and list of these
-    TODO: Make this more bullet proof - what happens if abnormal bonds aren't requested.
     A table of bond distance analysis for the supplied model is also possible
+    The analysis is a thin layer on top of get_bond_census, so connectivity is only built once.
 
     Parameters:
 
@@ -51,14 +110,9 @@ def analyse_all_bonds(model, verbose=True, abnormal=True):
         Determines whether the output should be printed to screen
     abnormal: Boolean
         Collect information about rogue looking bond lengths.
-        (Does enabling this by default add a large time overhead?)
     '''
 
-    # set() to ensure unique chemical symbols list
-    list_of_symbols = list(set(model.get_chemical_symbols()))
-    # Combination as AB = BA for bonds, avoiding redundancy
-    from itertools import combinations_with_replacement
-    all_bonds = combinations_with_replacement(list_of_symbols, 2)
+    census = get_bond_census(model)
 
     # Define lists to collect abnormal observations
     abnormal_bonds = []
@@ -68,20 +122,14 @@ def analyse_all_bonds(model, verbose=True, abnormal=True):
     if verbose:
         print_bond_table_header()
 
-    from ase.data import chemical_symbols, covalent_radii
-    # Iterate over all arrangements of chemical symbols
-    for bonds in all_bonds:
-        print_AB, AB_Bonds, AB_BondsValues = analyse_bonds(model, bonds[0], bonds[1], verbose=verbose, multirow=True)
-
-        if abnormal and AB_BondsValues is not None:
-            sum_of_covalent_radii = covalent_radii[chemical_symbols.index(bonds[0])] + covalent_radii[chemical_symbols.index(bonds[1])]
-            abnormal_cutoff = max(0.4, sum_of_covalent_radii*0.75)
+    # Iterate over all element pairs found in the model
+    for print_AB, bond_data in census.items():
+        if verbose:
+            print_bond_table_row(print_AB, bond_data)
 
-            for values in AB_BondsValues:
-                abnormal_values = [i for i in values if i < abnormal_cutoff ]
-                if len(abnormal_values):
-                    abnormal_bonds.append(len(abnormal_values))
-                    list_of_abnormal_bonds.append(print_AB)
+        if abnormal and bond_data['abnormal'] > 0:
+            abnormal_bonds.append(bond_data['abnormal'])
+            list_of_abnormal_bonds.append(print_AB)
 
     # This now returns empty arrays if no abnormal bond checks are done,
     # or if genuinely there are no abnormal bonds.
@@ -93,7 +141,7 @@ def analyse_bonds(model, A, B, verbose=True, multirow=False):
 
     Parameters:
     model: Atoms object
-        XXX
+        Structure for which the analysis is to be conducted
     A: string, chemical symbol, e.g. "H"
     B: string, chemical symbol, e.g. "H"
     verbose: Boolean
@@ -101,40 +149,169 @@ def analyse_bonds(model, A, B, verbose=True, multirow=False):
     multirow: Boolean
         Whether we are working with analyse_all_bonds, so the output is multirow,
         or just one specific analysis of a bond, in which case the table header is needed.
+
+    Returns:
+        print_AB: String, the label of the bond e.g. "H-H"
+        AB_Bonds: List of list of tuples, with indices of the A and B atom in each bond (as ase Analysis.get_bonds)
+        AB_BondsValues: List of list of floats, or None if no A-B bonds are present (as ase Analysis.get_values)
     '''
 
-    from ase.geometry.analysis import Analysis
-    analysis = Analysis(model)
+    import numpy as np
+
+    census = get_bond_census(model)
 
     print_AB = A + "-" + B
+    bond_data = census.get(print_AB, census.get(B + "-" + A))
+
     # Retrieve bonds and values
-    AB_Bonds = analysis.get_bonds(A, B)
-    if AB_Bonds == [[]]:
+    if bond_data is None:
+        AB_Bonds = [[]]
         AB_BondsValues = None
     else:
-        AB_BondsValues = analysis.get_values(AB_Bonds)
+        indices = bond_data['indices']
+        # Orientate the bonds so the first index belongs to an atom of element A
+        if A != B and model.symbols[indices[0, 0]] != A:
+            indices = indices[:, ::-1]
+        order = np.lexsort((indices[:, 1], indices[:, 0]))
+        AB_Bonds = [[tuple(bond) for bond in indices[order].tolist()]]
+        AB_BondsValues = [bond_data['values'][order].tolist()]
 
     if verbose and AB_BondsValues is not None:
         if not multirow:
             print_bond_table_header()
         # Table contents
-        import numpy as np
-        print('{:<8.8s}{:<6.0f}{:>4.6f}{:^12.6f}{:>4.6f}'.format(
-            print_AB, len(AB_BondsValues[0]), np.average(AB_BondsValues),
-            np.amin(AB_BondsValues), np.amax(AB_BondsValues)))
+        print_bond_table_row(print_AB, bond_data)
 
     return print_AB, AB_Bonds, AB_BondsValues
 
-def search_abnormal_bonds(model, verbose=True):
+def get_bond_census(model, mult=1, skin=0.3):
+    '''
+    Collects every bond in the model in a single pass and groups them by element pair.
+    Bonds are defined as in ase.geometry.analysis.Analysis, i.e. shorter than the sum of the
+    natural cutoffs plus the skin of both atoms, with distances evaluated through mic.
+    An A-B bond is flagged as abnormal if it is shorter than max(0.4, 0.75 * (covalent radius of A + B)).
+
+    Parameters:
+
+    model: Atoms object
+        Structure for which the analysis is to be conducted
+    mult: Float
+        Multiplier for the natural cutoffs
+    skin: Float
+        Added to the cutoff of each atom. The default matches the ase NeighborList used by Analysis.
+
+    Returns:
+        census: Dictionary keyed by bond label e.g. "C-O", with element pairs ordered by atomic number.
+            Each entry is a dictionary containing:
+            'count': number of bonds
+            'average', 'minimum', 'maximum': bond length statistics
+            'abnormal_cutoff': distance below which a bond is considered abnormal
+            'abnormal': number of abnormal bonds
+            'indices': numpy array (count, 2) of the bonded atom indices
+            'values': numpy array (count) of the bond lengths
+    '''
+
+    import numpy as np
+    from ase.data import chemical_symbols
+
+    bond_indices, bond_lengths = _get_bonded_pairs(model, mult=mult, skin=skin)
+
+    # Orientate each bond so the lower atomic number comes first, then pack the element pair into one key
+    numbers = model.get_atomic_numbers()
+    swap = numbers[bond_indices[:, 0]] > numbers[bond_indices[:, 1]]
+    bond_indices[swap] = bond_indices[swap][:, ::-1]
+    Z_A = numbers[bond_indices[:, 0]]
+    Z_B = numbers[bond_indices[:, 1]]
+    pair_keys = Z_A * len(chemical_symbols) + Z_B
+
+    unique_keys, group = np.unique(pair_keys, return_inverse=True)
+    group = group.ravel()
+    ngroups = len(unique_keys)
+
+    # Reductions over all element pairs at once
+    counts = np.bincount(group, minlength=ngroups)
+    averages = np.bincount(group, weights=bond_lengths, minlength=ngroups) / np.maximum(counts, 1)
+    minima = np.full(ngroups, np.inf)
+    np.minimum.at(minima, group, bond_lengths)
+    maxima = np.full(ngroups, -np.inf)
+    np.maximum.at(maxima, group, bond_lengths)
+
+    Z_pairs = np.divmod(unique_keys, len(chemical_symbols))
+    abnormal_cutoffs = get_abnormal_bond_thresholds()[Z_pairs[0], Z_pairs[1]]
+    abnormal = np.bincount(group, weights=bond_lengths < abnormal_cutoffs[group], minlength=ngroups)
+
+    # Split the bond list into contiguous blocks per element pair
+    order = np.argsort(group, kind='stable')
+    split_points = np.cumsum(counts)[:-1]
+    indices_per_group = np.split(bond_indices[order], split_points)
+    values_per_group = np.split(bond_lengths[order], split_points)
+
+    census = {}
+    for g in range(ngroups):
+        print_AB = chemical_symbols[Z_pairs[0][g]] + "-" + chemical_symbols[Z_pairs[1][g]]
+        census[print_AB] = {'count': int(counts[g]),
+                            'average': averages[g],
+                            'minimum': minima[g],
+                            'maximum': maxima[g],
+                            'abnormal_cutoff': abnormal_cutoffs[g],
+                            'abnormal': int(abnormal[g]),
+                            'indices': indices_per_group[g],
+                            'values': values_per_group[g]}
+
+    return census
+
+def _get_bonded_pairs(model, mult=1, skin=0.3):
+    '''
+    Returns each bonded pair of atoms once, with the mic bond length, from the shared connectivity
+
+    Parameters:
+
+    model: Atoms object
+        Structure for which the bonds are to be found
+    mult: Float
+        Multiplier for the natural cutoffs
+    skin: Float
+        Added to the cutoff of each atom
+
+    Returns:
+        numpy array (nbonds, 2) of indices with i < j, numpy array (nbonds) of bond lengths
+    '''
+    from carmm.analyse.connectivity import get_connectivity
+
+    bond_indices, bond_lengths = get_connectivity(model, mult=mult, skin=skin).get_pairs()
+
+    # Bonds of an atom to its own periodic image are not considered
+    distinct = bond_indices[:, 0] != bond_indices[:, 1]
+
+    return bond_indices[distinct], bond_lengths[distinct]
+
+def search_abnormal_bonds(model, verbose=True, thresholds=None):
     '''
     Check all bond lengths in the model for abnormally
     short ones.
+    Without verbose output, or when custom thresholds are given, the check uses the
+    has_abnormal_bonds fast path, which stops at the first abnormal contact.
 
     Parameters:
     model: Atoms object or string. If string it will read a file
         in the same folder, e.g. "name.traj"
+    verbose: Boolean
+        Whether to print the bond table and the abnormal bonds found
+    thresholds: Dictionary or None
+        Minimum acceptable distances for specific element pairs, e.g. {"C-O": 1.0}.
+        See get_abnormal_bond_thresholds.
+
+    Returns:
+        True if no abnormal bonds are found, False otherwise
     '''
 
+    if isinstance(model, str):
+        from ase.io import read
+        model = read(model)
+
+    if not verbose or thresholds is not None:
+        return not has_abnormal_bonds(model, thresholds=thresholds)
+
     # Abnormality check
     abnormal_bonds, list_of_abnormal_bonds = analyse_all_bonds(model, verbose=verbose, abnormal=True)
 
@@ -160,10 +337,127 @@ def search_abnormal_bonds(model, verbose=True):
     else:
         return True
 
+def search_abnormal_bonds_batch(structures, thresholds=None, processes=None, chunksize=1):
+    '''
+    Checks many candidate structures for abnormally short bonds in a process pool,
+    e.g. as a screening step before submitting calculations.
+
+    Parameters:
+    structures: List of Atoms objects or strings
+        Structures to check. Filenames are read inside the worker processes.
+    thresholds: Dictionary or None
+        Minimum acceptable distances for specific element pairs, e.g. {"C-O": 1.0}.
+        See get_abnormal_bond_thresholds.
+    processes: Integer or None
+        Number of worker processes. None uses all available cores, 1 runs serially.
+    chunksize: Integer
+        Number of structures sent to a worker at a time
+
+    Returns:
+        numpy array of booleans, True for structures without abnormal bonds (as search_abnormal_bonds)
+    '''
+    import numpy as np
+    from functools import partial
+
+    check = partial(_search_abnormal_bonds_worker, thresholds=thresholds)
+
+    if processes == 1:
+        results = [check(structure) for structure in structures]
+    else:
+        from multiprocessing import Pool
+        with Pool(processes) as pool:
+            results = pool.map(check, structures, chunksize=chunksize)
+
+    return np.array(results, dtype=bool)
+
+def _search_abnormal_bonds_worker(structure, thresholds=None):
+    '''
+    Picklable wrapper for search_abnormal_bonds_batch, reading the structure if a filename is given
+    '''
+
+    return search_abnormal_bonds(structure, verbose=False, thresholds=thresholds)
+
+def get_abnormal_bond_thresholds(thresholds=None):
+    '''
+    Returns the minimum acceptable distance for every pair of elements, indexed by atomic numbers.
+    By default an A-B distance is abnormal below max(0.4, 0.75 * (covalent radius of A + B)).
+
+    Parameters:
+    thresholds: Dictionary or None
+        Custom values overriding the default for specific element pairs. Keys are either
+        bond labels, e.g. "C-O", or tuples of chemical symbols, e.g. ("C", "O").
+
+    Returns:
+        numpy array (len(chemical_symbols), len(chemical_symbols)), symmetric
+    '''
+    import numpy as np
+    from ase.data import atomic_numbers, covalent_radii
+
+    table = np.maximum(0.4, 0.75 * (covalent_radii[:, None] + covalent_radii[None, :]))
+
+    if thresholds is not None:
+        for pair, value in thresholds.items():
+            if isinstance(pair, str):
+                pair = pair.split("-")
+            Z_A, Z_B = atomic_numbers[pair[0]], atomic_numbers[pair[1]]
+            table[Z_A, Z_B] = value
+            table[Z_B, Z_A] = value
+
+    return table
+
+def has_abnormal_bonds(model, thresholds=None, chunk_size=1000):
+    '''
+    Fast check for any abnormally short contact in the model, including contacts through periodic images.
+    Only pairs closer than the largest relevant threshold are searched for with a KD-tree, and atoms are
+    processed in chunks so the search stops as soon as an abnormal contact is found.
+
+    Parameters:
+    model: Atoms object
+        Structure to check
+    thresholds: Dictionary or None
+        Minimum acceptable distances for specific element pairs, e.g. {"C-O": 1.0}.
+        See get_abnormal_bond_thresholds.
+    chunk_size: Integer
+        Number of atoms checked before testing for early exit
+
+    Returns:
+        True if an abnormal contact is present, False otherwise
+    '''
+    import numpy as np
+    from scipy.spatial import cKDTree
+    from carmm.analyse.connectivity import get_periodic_images
+
+    if len(model) < 2 and not model.pbc.any():
+        return False
+
+    numbers = model.get_atomic_numbers()
+    table = get_abnormal_bond_thresholds(thresholds)
+    present = np.unique(numbers)
+    r_max = table[np.ix_(present, present)].max()
+
+    positions, image_atoms = get_periodic_images(model, r_max)
+    image_tree = cKDTree(positions)
+
+    for start in range(0, len(model), chunk_size):
+        chunk = np.arange(start, min(start + chunk_size, len(model)))
+        pairs = cKDTree(positions[chunk]).sparse_distance_matrix(image_tree, r_max, output_type='ndarray')
+
+        # Remove each atom paired with itself, which sits at the same index in the images
+        i = chunk[pairs['i']]
+        not_self = i != pairs['j']
+        i = i[not_self]
+        j = image_atoms[pairs['j'][not_self]]
+
+        if (pairs['v'][not_self] < table[numbers[i], numbers[j]]).any():
+            return True
+
+    return False
+
 def compare_structures(atoms1, atoms2, label=None):
     '''
 
     Comparison of two input structures to identify equivalent atoms but incorrect index ordering
+    Atoms are matched to their nearest neighbour of the same element through match_structures.
 
     Parameters:
 
@@ -174,64 +468,184 @@ def compare_structures(atoms1, atoms2, label=None):
     label: String of elemental character
         Only necessary to limit search to specific atomic species
     '''
-    from math import sqrt
+    import numpy as np
 
     if len(atoms1) != len(atoms2):
         print("The inputs don't contain the same number of atoms.")
         exit()
 
-    # Configure arrays
-    differences = []
-    atoms2_indices = []
-
-    # Iterate over indices of all atoms in structure 1 and compare to structure 2.
-    for i in range(len(atoms1.positions)):
-        xyz = atoms1.positions[i]
-        distance_sq = 999999.9
-        temp_index = 0
-        for j in range(len(atoms2.positions)):
-            if atoms1.symbols[i] == atoms2.symbols[j] and (atoms1.symbols[i] == label or label == None):
-                temp_distance_sq = ((atoms2.positions[j][0] - xyz[0]) * (atoms2.positions[j][0] - xyz[0])
-                                    + (atoms2.positions[j][1] - xyz[1]) * (atoms2.positions[j][1] - xyz[1])
-                                    + (atoms2.positions[j][2] - xyz[2]) * (atoms2.positions[j][2] - xyz[2]))
-
-                if distance_sq > temp_distance_sq:
-                    distance_sq = temp_distance_sq
-                    temp_index = j
-
-        atoms2_indices.append(temp_index)
-        differences.append(sqrt(distance_sq))
-
-    return atoms2_indices, differences
-
-def comparing_bonds_lengths(atoms1, atoms2):                                   
-    '''                                                                               
-description: this function allows to compare difference in bonds lengths between two structures,    
-parameters:                                                                           
-     atoms1: Atoms object or trajectory of individual atoms                           
-     atoms2: a second atom object                                                     
-    '''                                                                               
-                                                                                      
-    import numpy as np                                                                
-                                                                                      
-    from ase.build import molecule                                                    
-    from ase import Atoms                                                             
-                                                                                      
-                                                                                      
-    distances_1 = atoms1.get_all_distances(mic=True, vector=False)                    
-    distances_2 = atoms2.get_all_distances(mic=True, vector=False)                    
-                                                                                      
-    d1=[]                                                                             
-    d2=[]                                                                             
-                                                                                      
-    for i in range(len(distances_1)):                                                 
-        for j in range(i+1, len(distances_1[i])):                                     
-            d1.append(distances_1[i][j])                                              
-            d2.append(distances_2[i][j])                                              
-                                                                                      
-    diff = np.abs(np.sort(d1) - np.sort(d2))                                          
-    return(diff)                                                                      
-                                                                                      
+    atoms2_indices, displacements, rmsd = match_structures(atoms1, atoms2, label=label, mic=False)
+    differences = np.linalg.norm(displacements, axis=1)
+
+    # Atoms excluded from the search retain the historical placeholder values
+    unmatched = atoms2_indices < 0
+    atoms2_indices[unmatched] = 0
+    differences[unmatched] = np.sqrt(999999.9)
+
+    return atoms2_indices.tolist(), differences.tolist()
+
+def match_structures(atoms1, atoms2, label=None, mic=True, optimal=False):
+    '''
+    Pairs every atom in atoms1 with an atom of the same element in atoms2, e.g. to compare
+    relaxed and initial structures or to recover the index ordering of a permuted structure.
+    By default each atom is matched to its nearest neighbour through a KD-tree. With optimal=True,
+    a one-to-one assignment minimising the total squared displacement is solved per element instead.
+
+    Parameters:
+
+    atoms1: Atoms object
+        Reference structure
+    atoms2: Atoms object
+        Structure to be matched against the reference
+    label: String of elemental character or None
+        Only necessary to limit the matching to a specific atomic species
+    mic: Boolean
+        Whether displacements follow the minimum image convention for periodic directions of atoms1
+    optimal: Boolean
+        Whether to solve the optimal (Hungarian) assignment per element rather than the nearest neighbour.
+        This guarantees unique pairs, but requires the per-element distance matrix.
+
+    Returns:
+        indices: numpy array of integers
+            Index of the matched atom in atoms2 for each atom in atoms1, -1 if the atom was not matched
+        displacements: numpy array (len(atoms1), 3)
+            Vector from each atom in atoms1 to its match in atoms2, NaN if the atom was not matched
+        rmsd: Dictionary
+            Root mean square displacement per chemical symbol and for all matched atoms ('total')
+    '''
+    import numpy as np
+    from carmm.analyse.connectivity import match_nearest
+
+    positions1 = atoms1.get_positions()
+    positions2 = atoms2.get_positions()
+    cell = atoms1.cell
+    pbc = atoms1.pbc if mic else np.zeros(3, dtype=bool)
+    if pbc.any():
+        positions1 = atoms1.get_positions(wrap=True)
+        positions2 = atoms2.get_positions(wrap=True)
+
+    symbols1 = np.array(atoms1.get_chemical_symbols())
+    symbols2 = np.array(atoms2.get_chemical_symbols())
+
+    indices = np.full(len(atoms1), -1, dtype=int)
+    displacements = np.full((len(atoms1), 3), np.nan)
+    rmsd = {}
+
+    for symbol in np.unique(symbols1):
+        if label is not None and symbol != label:
+            continue
+
+        idx1 = np.flatnonzero(symbols1 == symbol)
+        idx2 = np.flatnonzero(symbols2 == symbol)
+        if len(idx2) == 0:
+            continue
+
+        if optimal:
+            matched, vectors = _match_optimal(positions1[idx1], positions2[idx2], cell, pbc)
+        else:
+            matched, vectors = match_nearest(positions1[idx1], positions2[idx2], cell, pbc)
+
+        # The optimal assignment leaves atoms unmatched if atoms2 has fewer of this element
+        found = matched >= 0
+        indices[idx1[found]] = idx2[matched[found]]
+        displacements[idx1[found]] = vectors[found]
+        if found.any():
+            rmsd[str(symbol)] = np.sqrt(np.mean(np.sum(vectors[found]**2, axis=1)))
+
+    matched_atoms = indices >= 0
+    if matched_atoms.any():
+        rmsd['total'] = np.sqrt(np.mean(np.sum(displacements[matched_atoms]**2, axis=1)))
+
+    return indices, displacements, rmsd
+
+def _match_optimal(positions1, positions2, cell, pbc):
+    '''
+    One-to-one matching of positions1 onto positions2 minimising the sum of squared
+    (minimum image) displacements.
+
+    Returns:
+        numpy array of indices into positions2 (-1 if unmatched), numpy array of displacement vectors
+    '''
+    import numpy as np
+    from ase.geometry import get_distances
+    from scipy.optimize import linear_sum_assignment
+
+    vectors, distances = get_distances(positions1, positions2, cell=cell, pbc=pbc)
+    rows, columns = linear_sum_assignment(distances**2)
+
+    matched = np.full(len(positions1), -1, dtype=int)
+    matched[rows] = columns
+    displacements = np.full((len(positions1), 3), np.nan)
+    displacements[rows] = vectors[rows, columns]
+
+    return matched, displacements
+
+def comparing_bonds_lengths(atoms1, atoms2):
+    '''
+description: this function allows to compare difference in bonds lengths between two structures,
+parameters:
+     atoms1: Atoms object or trajectory of individual atoms
+     atoms2: a second atom object
+    '''
+
+    import numpy as np
+
+    distances_1 = atoms1.get_all_distances(mic=True, vector=False)
+    distances_2 = atoms2.get_all_distances(mic=True, vector=False)
+
+    # Upper triangle of both distance matrices
+    i, j = np.triu_indices(len(distances_1), k=1)
+    d1 = distances_1[i, j]
+    d2 = distances_2[i, j]
+
+    diff = np.abs(np.sort(d1) - np.sort(d2))
+    return(diff)
+
+def track_bond_lengths(trajectory, reference=None, mult=1, mic=True):
+    '''
+    Follows the bond lengths of a fixed set of bonds over a whole trajectory, e.g. an optimisation or MD run.
+    The bonds are determined once from the reference frame (as in get_bond_census), after which frames are
+    read and processed one at a time, so only one frame is held in memory.
+
+    Parameters:
+
+    trajectory: String, Trajectory or List of Atoms objects
+        Filename of an ASE trajectory, or any sequence of Atoms objects with the same atom ordering
+    reference: Atoms object or None
+        Structure from which the bonds are taken. If None, the first frame is used.
+    mult: Float
+        Multiplier for the natural cutoffs used to define bonds
+    mic: Boolean
+        Whether bond lengths follow the minimum image convention
+
+    Returns:
+        bond_indices: numpy array (n_bonds, 2)
+            Indices of the atoms in each bond
+        bond_lengths: numpy array (n_frames, n_bonds)
+            Length of each bond in each frame. Subtracting bond_lengths[0] gives the change along the trajectory.
+    '''
+    import numpy as np
+    from ase.geometry import find_mic
+
+    if isinstance(trajectory, str):
+        from ase.io.trajectory import Trajectory
+        with Trajectory(trajectory) as traj:
+            return track_bond_lengths(traj, reference=reference, mult=mult, mic=mic)
+
+    if reference is None:
+        reference = trajectory[0]
+
+    bond_indices = _get_bonded_pairs(reference, mult=mult)[0]
+    bond_lengths = np.empty((len(trajectory), len(bond_indices)))
+
+    for frame, atoms in enumerate(trajectory):
+        positions = atoms.get_positions()
+        vectors = positions[bond_indices[:, 1]] - positions[bond_indices[:, 0]]
+        if mic and atoms.pbc.any():
+            vectors = find_mic(vectors, atoms.cell, atoms.pbc)[0]
+        bond_lengths[frame] = np.linalg.norm(vectors, axis=1)
+
+    return bond_indices, bond_lengths
 
 def get_indices_of_elements(list_of_symbols, symbol):
     '''
@@ -254,6 +668,11 @@ def print_bond_table_header():
         "Bond", "Count", "Average", "Minimum", "Maximum"))
     print("-" * 40)
 
+def print_bond_table_row(print_AB, bond_data):
+    print('{:<8.8s}{:<6.0f}{:>4.6f}{:^12.6f}{:>4.6f}'.format(
+        print_AB, bond_data['count'], bond_data['average'],
+        bond_data['minimum'], bond_data['maximum']))
+
 def analyse_chelation(atoms, metal, ligand_atoms, mult=1):
     '''
     Returns information on the ligands in a mononuclear complex and their chelation type.
@@ -272,7 +691,7 @@ def analyse_chelation(atoms, metal, ligand_atoms, mult=1):
 
     ## Import modules
     from carmm.analyse.bonds import analyse_bonds, analyse_all_bonds
-    from ase.neighborlist import NeighborList, get_connectivity_matrix, natural_cutoffs
+    from carmm.analyse.connectivity import get_connectivity
     from scipy import sparse
     import collections
     from collections import Counter
@@ -280,11 +699,8 @@ def analyse_chelation(atoms, metal, ligand_atoms, mult=1):
     from ase.formula import Formula
 
     ## Defines cutoffs, connectivity matrix for ligands in the system
-    cutOff = natural_cutoffs(atoms, mult=mult)
-    neighborList = NeighborList(cutOff, skin=0, self_interaction=True, bothways=True)
-    neighborList.update(atoms)
     # defines matrix and removes entries from the metal, so the complex is not considered as one molecule.
-    connect_matrix = neighborList.get_connectivity_matrix(sparse=False)
+    connect_matrix = get_connectivity(atoms, mult=mult, skin=0).adjacency.toarray()
     metal_idx = [idx for idx in range(len(atoms)) if atoms.get_chemical_symbols()[idx] == metal] # gets index corresponding to metal atom
     for idx in range(len(connect_matrix[0])):
         connect_matrix[metal_idx[0]][idx] = 0
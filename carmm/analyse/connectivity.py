@@ -0,0 +1,253 @@
+'''
+Shared connectivity for the analysis tools. Neighbour searches for a given structure and set of cutoffs
+are performed once and kept in a small least-recently-used cache, so that several analysis functions
+called on the same structure (neighbours, molecules, bonds, surface coordination, ...) reuse one search.
+'''
+from collections import OrderedDict
+
+_connectivity_cache = OrderedDict()
+_connectivity_cache_size = 16
+
+
+class Connectivity:
+    '''
+    Description
+    Bonded pairs of a structure stored as a sparse CSR adjacency matrix. Each bonded pair (i, j) is stored in
+    both rows i and j, using the shortest periodic image. Bonds of an atom to its own periodic image are kept
+    on the diagonal. The distances and vectors arrays are aligned with the stored entries of the adjacency
+    matrix (adjacency.indices), i.e. the bonds of atom i are found at adjacency.indptr[i]:adjacency.indptr[i+1].
+    '''
+    def __init__(self, natoms, i, j, vectors):
+        '''
+        Parameters:
+
+        natoms: Integer
+            Number of atoms in the structure
+        i, j: numpy arrays of integers
+            Indices of the bonded atoms, sorted by i and then j, with every pair present in both directions
+        vectors: numpy array (nbonds, 3)
+            Bond vectors pointing from atom i to atom j
+        '''
+        import numpy as np
+        from scipy.sparse import csr_matrix
+
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(i, minlength=natoms))))
+        self.adjacency = csr_matrix((np.ones(len(j), dtype=np.int8), j, indptr), shape=(natoms, natoms))
+        self.vectors = vectors
+        self.distances = np.linalg.norm(vectors, axis=1)
+
+    def get_neighbors(self, index):
+        '''
+        Returns the indices of the atoms bonded to the atom index, in ascending order
+
+        Parameters:
+
+        index: Integer
+            Index of the atom of interest, negative values count from the end as for lists
+        '''
+        if index < 0:
+            index += self.adjacency.shape[0]
+
+        return self.adjacency.indices[self.adjacency.indptr[index]:self.adjacency.indptr[index + 1]]
+
+    def get_pairs(self, bothways=False):
+        '''
+        Returns all bonded pairs with their bond lengths
+
+        Parameters:
+
+        bothways: Boolean
+            Whether each pair is returned in both directions, or only once with i <= j
+
+        Returns:
+            numpy array (nbonds, 2) of atom indices, numpy array (nbonds) of bond lengths
+        '''
+        import numpy as np
+
+        i = np.repeat(np.arange(self.adjacency.shape[0]), np.diff(self.adjacency.indptr))
+        j = self.adjacency.indices
+        selection = np.ones(len(j), dtype=bool) if bothways else i <= j
+
+        return np.column_stack((i[selection], j[selection])), self.distances[selection]
+
+
+def get_connectivity(atoms, cutoffs=None, mult=1, skin=0.3):
+    '''
+    Returns the connectivity of the structure, reusing a previous neighbour search if the same structure
+    has already been analysed with the same cutoffs. Two atoms are bonded if they are closer than
+    the sum of their cutoffs plus skin, matching the ase NeighborList (which adds the skin to every cutoff).
+
+    Parameters:
+
+    atoms: Atoms object
+        Structure for which the connectivity is required
+    cutoffs: List of floats or None
+        Bond length cutoff for each atom in Angstrom. If None, natural_cutoffs multiplied by mult are used.
+    mult: Float
+        Multiplier for the natural cutoffs, only used if cutoffs is None
+    skin: Float
+        Added to the cutoff of each atom, 0.3 by default as in the ase NeighborList
+
+    Returns:
+        Connectivity object. This is shared between callers and should not be modified.
+    '''
+    import numpy as np
+    from ase.neighborlist import natural_cutoffs
+
+    if cutoffs is None:
+        cutoffs = natural_cutoffs(atoms, mult=mult)
+    radii = np.asarray(cutoffs, dtype=float) + skin
+
+    key = _get_connectivity_key(atoms, radii)
+    if key in _connectivity_cache:
+        _connectivity_cache.move_to_end(key)
+        return _connectivity_cache[key]
+
+    connectivity = _build_connectivity(atoms, radii)
+
+    _connectivity_cache[key] = connectivity
+    while len(_connectivity_cache) > _connectivity_cache_size:
+        _connectivity_cache.popitem(last=False)
+
+    return connectivity
+
+
+def clear_connectivity_cache():
+    '''
+    Removes all stored connectivity data
+    '''
+    _connectivity_cache.clear()
+
+
+def set_connectivity_cache_size(size):
+    '''
+    Sets the number of structures for which connectivity is kept, evicting the least recently used first
+
+    Parameters:
+
+    size: Integer
+        Maximum number of cached entries. 0 disables caching.
+    '''
+    global _connectivity_cache_size
+
+    _connectivity_cache_size = size
+    while len(_connectivity_cache) > _connectivity_cache_size:
+        _connectivity_cache.popitem(last=False)
+
+
+def get_periodic_images(atoms, r_max):
+    '''
+    Returns the positions of all atoms, wrapped into the cell, followed by those of their periodic
+    images lying within r_max of the cell, so that a spatial search of the returned points finds all
+    contacts shorter than r_max. The first len(atoms) points are the atoms themselves.
+
+    Parameters:
+
+    atoms: Atoms object
+        Structure for which images are generated
+    r_max: Float
+        Largest distance of interest in Angstrom
+
+    Returns:
+        numpy array (n_points, 3) of positions, numpy array (n_points) of the atom index of each point
+    '''
+    import numpy as np
+    from itertools import product
+
+    pbc = atoms.pbc
+    if not pbc.any():
+        return atoms.get_positions(), np.arange(len(atoms))
+
+    scaled = atoms.get_scaled_positions(wrap=True)
+    # Fractional distance corresponding to r_max along each periodic direction
+    margin = r_max * np.linalg.norm(atoms.cell.reciprocal(), axis=1)
+    repeats = np.where(pbc, np.ceil(margin), 0).astype(int)
+
+    shifts = np.array(list(product(*[range(-n, n + 1) for n in repeats])))
+    # Put the zero shift first, so the unshifted atoms come first
+    shifts = shifts[np.argsort(np.abs(shifts).sum(axis=1), kind='stable')]
+
+    image_scaled = scaled[None, :, :] + shifts[:, None, :]
+    inside = ((image_scaled > -margin) & (image_scaled < 1 + margin)) | ~pbc
+    inside = inside.all(axis=2)
+    inside[0] = True
+
+    image_atoms = np.broadcast_to(np.arange(len(atoms)), inside.shape)[inside]
+    positions = atoms.cell.cartesian_positions(image_scaled[inside])
+
+    return positions, image_atoms
+
+
+def _get_periodic_shifts(cell, pbc):
+    '''
+    Returns the Cartesian translations to the neighbouring periodic images (including zero),
+    only along periodic directions.
+    '''
+    import numpy as np
+    from itertools import product
+
+    ranges = [(-1, 0, 1) if periodic else (0,) for periodic in pbc]
+
+    return np.array(list(product(*ranges))) @ np.array(cell)
+
+
+def match_nearest(positions1, positions2, cell, pbc):
+    '''
+    Nearest neighbour matching of positions1 onto positions2 through a KD-tree, with the
+    periodic images of positions2 included so that displacements follow the minimum image convention.
+
+    Parameters:
+
+    positions1, positions2: numpy arrays (n, 3)
+        Cartesian positions to be matched
+    cell: Cell or numpy array (3, 3)
+        Unit cell of the structure
+    pbc: List of Booleans
+        Periodic directions of the cell
+
+    Returns:
+        numpy array of indices into positions2, numpy array of displacement vectors
+    '''
+    from scipy.spatial import cKDTree
+
+    shifts = _get_periodic_shifts(cell, pbc)
+    images = (positions2[None, :, :] + shifts[:, None, :]).reshape(-1, 3)
+
+    tree = cKDTree(images)
+    image_indices = tree.query(positions1, k=1)[1]
+
+    return image_indices % len(positions2), images[image_indices] - positions1
+
+
+def _get_connectivity_key(atoms, radii):
+    '''
+    Returns a hash of everything the connectivity depends on: positions, cell, pbc, atomic numbers and radii
+    '''
+    import hashlib
+    import numpy as np
+
+    digest = hashlib.sha1()
+    for array in (atoms.get_positions(), atoms.cell.array, atoms.pbc, atoms.get_atomic_numbers(), radii):
+        digest.update(np.ascontiguousarray(array).tobytes())
+
+    return digest.hexdigest()
+
+
+def _build_connectivity(atoms, radii):
+    '''
+    Performs the neighbour search with the ase cell-list neighbour list and keeps the
+    shortest periodic image of each bonded pair.
+    '''
+    import numpy as np
+    from ase.neighborlist import neighbor_list
+
+    i, j, D = neighbor_list('ijD', atoms, radii)
+    d = np.linalg.norm(D, axis=1)
+
+    # Sort by pair, then by distance, so the first entry of each pair is its shortest image
+    pair_keys = i.astype(np.int64) * len(atoms) + j
+    order = np.lexsort((d, pair_keys))
+    first = np.unique(pair_keys[order], return_index=True)[1]
+    shortest = order[first]
+
+    return Connectivity(len(atoms), i[shortest], j[shortest], D[shortest])
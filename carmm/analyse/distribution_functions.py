@@ -91,7 +91,7 @@ def element_radial_distribution_function(model, radius, element,position=None, v
 
     return sorted(distances)
 
-def average_distribution_function(trajectory, samples=10):
+def average_distribution_function(trajectory, samples=10, processes=1, r_max=None, bins=None, chunksize=1):
     '''
     Plots the average distribution function of the last N steps of an MD trajectory
     TODO: -This is distance based - can we adapt it to also allow radial?
@@ -100,40 +100,285 @@ def average_distribution_function(trajectory, samples=10):
     
     Parameters:
     
-    trajectory: List of Atoms objects
-        The pathway from which the ensemble RDF is to be plotted
+    trajectory: List of Atoms objects or string
+        The pathway from which the ensemble RDF is to be plotted. If the filename of an ase .traj file is
+        given, the sampled frames are read lazily by index, inside the worker processes if processes != 1.
     samples: Integer
         The number of samples to include in the ensemble, starting from the final image of the trajectory.
+    processes: Integer or None
+        Number of worker processes used to analyse the snapshots. None uses all available cores,
+        1 (default) runs serially.
+    r_max: Float or None
+        If given, only distances below r_max are included, using periodic boundary conditions
+        (see carmm.analyse.bonds.get_sorted_distances)
+    bins: Integer or None
+        If given together with r_max, each snapshot is reduced to a histogram of bins bins between 0 and
+        r_max in the worker, rather than returning all distances
+    chunksize: Integer
+        Number of snapshots sent to a worker at a time
 
     Returns:
 
     all_data: List of floats
-        A list containing _all_ of the distances encountered in the sampled trajectories
+        A list containing _all_ of the distances encountered in the sampled trajectories.
+        If bins and r_max are given, the histogram summed over the snapshots.
     snapshots: List of list of floats
-        A list containing the list of floats for distances measured in each specific snapshot analysed
+        A list containing the list of floats for distances measured in each specific snapshot analysed,
+        or the histogram of each snapshot if bins and r_max are given
 
     '''
+    import numpy as np
 
-    from carmm.analyse.bonds import get_sorted_distances
+    snapshots = _map_snapshots(_distribution_function_worker, trajectory, samples, processes, chunksize,
+                               r_max=r_max, bins=bins)
 
-    # snapshots[0-n] - Distance snapshots sorted from lowest to highest
-    snapshots = []
-    
-    # Read in all Atoms objects to be sampled
-    for i in range(samples):
-        model = trajectory[(-i)-1].copy()
-        # Remove any constraints, as these hamper analysis.
-        # Can't see why this is needed? A more verbose comment would help. TODO
-        del model.constraints
-        # Calculate distribution function
-        snapshots.append(get_sorted_distances(model))
-
-    # Plot mean. This need double checking with something known e.g. H2O
-    all_data = [item for atoms_object in snapshots for item in atoms_object]
+    if r_max is not None and bins is not None:
+        # Merge step, the histograms share the same edges
+        snapshots = [histogram for histogram, edges in snapshots]
+        all_data = np.sum(snapshots, axis=0)
+    else:
+        # Plot mean. This need double checking with something known e.g. H2O
+        all_data = [item for atoms_object in snapshots for item in atoms_object]
 
     # Returning the mean and the snapshot data.
     return all_data, snapshots
 
+def average_radial_distribution_function(trajectory, r_max, bins=200, pairs=None, samples=10, processes=1,
+                                         chunksize=1):
+    '''
+    Normalised g(r) averaged over the last N steps of an MD trajectory, with the snapshots analysed in a
+    process pool. Each worker returns the RDFAccumulator of its snapshot, which are merged in order,
+    so the result is identical to the serial one.
+
+    Parameters:
+
+    trajectory: List of Atoms objects or string
+        Periodic structures to analyse, or the filename of an ase .traj file read lazily by the workers
+    r_max: Float
+        Largest distance included in the RDF in Angstrom
+    bins: Integer
+        Number of histogram bins between 0 and r_max
+    pairs: List of tuples of strings or None
+        Element pairs for which partial RDFs are accumulated, see RDFAccumulator
+    samples: Integer or None
+        The number of samples to include, starting from the final image. None includes all frames.
+    processes: Integer or None
+        Number of worker processes. None uses all available cores, 1 runs serially.
+    chunksize: Integer
+        Number of snapshots sent to a worker at a time
+
+    Returns:
+        RDFAccumulator containing all sampled snapshots
+    '''
+    accumulators = _map_snapshots(_rdf_worker, trajectory, samples, processes, chunksize,
+                                  r_max=r_max, bins=bins, pairs=pairs)
+
+    rdf = RDFAccumulator(r_max, bins=bins, pairs=pairs)
+    for accumulator in accumulators:
+        rdf.merge(accumulator)
+
+    return rdf
+
+def _map_snapshots(worker, trajectory, samples, processes, chunksize, **kwargs):
+    '''
+    Applies worker to the last samples frames of the trajectory, starting from the final one, in a process pool.
+    Frames of a trajectory file are passed as indices and read by the worker, other frames are passed directly.
+    '''
+    from functools import partial
+
+    if isinstance(trajectory, str):
+        from ase.io.trajectory import Trajectory
+        with Trajectory(trajectory) as traj:
+            n_frames = len(traj)
+        tasks = [n_frames - i - 1 for i in range(n_frames if samples is None else samples)]
+        worker = partial(worker, filename=trajectory, **kwargs)
+    else:
+        n_frames = len(trajectory)
+        tasks = [trajectory[(-i)-1] for i in range(n_frames if samples is None else samples)]
+        worker = partial(worker, **kwargs)
+
+    if processes == 1:
+        return [worker(task) for task in tasks]
+
+    from multiprocessing import Pool
+    with Pool(processes) as pool:
+        return pool.map(worker, tasks, chunksize=chunksize)
+
+def _read_snapshot(task, filename=None):
+    '''
+    Returns a copy of the snapshot without constraints, reading it from the trajectory file if task is an index
+    '''
+    if filename is not None:
+        from ase.io.trajectory import Trajectory
+        with Trajectory(filename) as traj:
+            model = traj[task]
+    else:
+        model = task.copy()
+
+    # Remove any constraints, as these hamper analysis.
+    # Can't see why this is needed? A more verbose comment would help. TODO
+    del model.constraints
+
+    return model
+
+def _distribution_function_worker(task, filename=None, r_max=None, bins=None):
+    '''
+    Picklable worker for average_distribution_function
+    '''
+    from carmm.analyse.bonds import get_sorted_distances
+
+    return get_sorted_distances(_read_snapshot(task, filename), r_max=r_max, bins=bins)
+
+def _rdf_worker(task, filename=None, r_max=None, bins=None, pairs=None):
+    '''
+    Picklable worker for average_radial_distribution_function
+    '''
+    rdf = RDFAccumulator(r_max, bins=bins, pairs=pairs)
+    rdf.update(_read_snapshot(task, filename))
+
+    return rdf
+
+class RDFAccumulator:
+    '''
+    Description
+    Accumulates the radial distribution function g(r) of periodic structures frame by frame, so that long
+    trajectories can be analysed without keeping the distances in memory. Distances up to r_max are found
+    with the ase cell-list neighbour search and binned into a fixed histogram, which is normalised by the
+    shell volume and the number density of each frame. Partial RDFs of element pairs can be accumulated
+    alongside the total RDF, and accumulators built over different frames can be merged.
+    '''
+    def __init__(self, r_max, bins=200, pairs=None):
+        '''
+        Parameters:
+
+        r_max: Float
+            Largest distance included in the RDF in Angstrom
+        bins: Integer
+            Number of histogram bins between 0 and r_max
+        pairs: List of tuples of strings or None
+            Element pairs for which partial RDFs are accumulated, e.g. [("Cu", "Au")]. The partial RDF
+            of ("A", "B") is the distribution of B atoms around A atoms.
+        '''
+        import numpy as np
+
+        self.r_max = r_max
+        self.bins = bins
+        self.pairs = [tuple(pair) for pair in pairs] if pairs else []
+        self.edges = np.linspace(0, r_max, bins + 1)
+        self.r = 0.5 * (self.edges[1:] + self.edges[:-1])
+
+        # Row 0 is the total RDF, followed by one row per element pair
+        self.counts = np.zeros((len(self.pairs) + 1, bins), dtype=np.int64)
+        self._weighted_counts = np.zeros((len(self.pairs) + 1, bins))
+        self._frames = np.zeros(len(self.pairs) + 1, dtype=np.int64)
+        self.n_frames = 0
+
+    def update(self, atoms):
+        '''
+        Adds the distances of one structure to the histograms
+
+        Parameters:
+
+        atoms: Atoms object
+            Periodic structure, the cell volume is used to obtain the number density
+        '''
+        import numpy as np
+        from ase.neighborlist import neighbor_list
+
+        i, j, d = neighbor_list('ijd', atoms, self.r_max)
+        bin_index = np.minimum((d * (self.bins / self.r_max)).astype(int), self.bins - 1)
+        volume = atoms.get_volume()
+        symbols = np.array(atoms.get_chemical_symbols())
+
+        total = np.bincount(bin_index, minlength=self.bins)
+        self._add(0, total, len(atoms) * len(atoms), volume)
+
+        for k, (a, b) in enumerate(self.pairs, start=1):
+            is_a = symbols == a
+            is_b = symbols == b
+            partial = np.bincount(bin_index[is_a[i] & is_b[j]], minlength=self.bins)
+            self._add(k, partial, np.count_nonzero(is_a) * np.count_nonzero(is_b), volume)
+
+        self.n_frames += 1
+
+    def update_trajectory(self, trajectory, index=':'):
+        '''
+        Adds the frames of a trajectory one at a time
+
+        Parameters:
+
+        trajectory: List of Atoms objects, ase Trajectory or string
+            Frames to analyse, or the filename of a trajectory which is then read lazily
+        index: String or slice
+            Frames of the trajectory to include, ":" by default for all of them
+        '''
+        from ase.io import iread
+
+        if isinstance(trajectory, str):
+            frames = iread(trajectory, index=index)
+        else:
+            frames = trajectory[index if isinstance(index, slice) else _string_to_slice(index)]
+
+        for atoms in frames:
+            self.update(atoms)
+
+    def merge(self, other):
+        '''
+        Adds the histograms of another accumulator, e.g. one built over different frames by another process
+
+        Parameters:
+
+        other: RDFAccumulator
+            Accumulator with the same r_max, bins and pairs
+        '''
+        if (other.r_max, other.bins, other.pairs) != (self.r_max, self.bins, self.pairs):
+            raise ValueError("Only accumulators with the same r_max, bins and pairs can be merged")
+
+        self.counts += other.counts
+        self._weighted_counts += other._weighted_counts
+        self._frames += other._frames
+        self.n_frames += other.n_frames
+
+        return self
+
+    def get_rdf(self, pair=None):
+        '''
+        Returns the normalised g(r) averaged over all frames, on the bin centres stored in self.r
+
+        Parameters:
+
+        pair: Tuple of strings or None
+            Element pair of a partial RDF, as supplied on creation. If None, the total RDF is returned.
+        '''
+        import numpy as np
+
+        k = 0 if pair is None else self.pairs.index(tuple(pair)) + 1
+        shell_volumes = 4 / 3 * np.pi * np.diff(self.edges ** 3)
+
+        return self._weighted_counts[k] / (shell_volumes * max(self._frames[k], 1))
+
+    def _add(self, k, histogram, n_pairs, volume):
+        '''
+        Adds a histogram and its normalisation, V / (N_A * N_B), to row k
+        '''
+        if n_pairs == 0:
+            return
+
+        self.counts[k] += histogram
+        self._weighted_counts[k] += histogram * volume / n_pairs
+        self._frames[k] += 1
+
+
+def _string_to_slice(index):
+    '''
+    Converts an ase style index string such as ":" or "-10:" to a slice or integer
+    '''
+    if ':' not in index:
+        return slice(int(index), int(index) + 1 or None)
+
+    return slice(*[int(x) if x else None for x in index.split(':')])
+
+
 def plot_distribution_function(data, bins=None, bin_sampling=0.1, title=None, density=False, **kwargs):
     '''
     Generic plotter
@@ -183,28 +428,104 @@ def radius_of_gyration(model):
 
         radius_of_gyration^2 = SUM(mass_atom(atom_position - centre_mass_position)) / mass_of_molecule
 
-        TODO: - further tidying up
+        See get_radii_of_gyration for many frames or molecules at once.
      '''
+
+    return float(get_radii_of_gyration(model.get_positions(), masses=model.get_masses())[0])
+
+def get_radii_of_gyration(positions, masses=None, groups=None, cell=None, pbc=None):
+    '''
+    Radius of gyration of one or more groups of atoms in one or many frames, evaluated on arrays
+    without looping over atoms or frames.
+
+    Parameters:
+
+    positions: numpy array (n_frames, n_atoms, 3) or (n_atoms, 3)
+        Cartesian positions of every frame
+    masses: numpy array (n_atoms) or None
+        Atomic masses used as weights. If None, all atoms have the same weight.
+    groups: List of lists of integers or None
+        Indices of the atoms of each group, e.g. molecules from carmm.analyse.molecules.calculate_molecules.
+        If None, all atoms form a single group.
+    cell: numpy array (3, 3) or None
+        Unit cell. If given with pbc, groups broken across periodic boundaries are made whole with the
+        minimum image convention relative to their first atom.
+    pbc: List of Booleans or None
+        Periodic directions of the cell
+
+    Returns:
+        numpy array (n_frames, n_groups), or (n_groups) if positions of a single frame are given
+    '''
     import numpy as np
+    from scipy import sparse
+
+    positions = np.asarray(positions, dtype=float)
+    single_frame = positions.ndim == 2
+    if single_frame:
+        positions = positions[None]
+    n_frames, n_atoms = positions.shape[:2]
+
+    if groups is None:
+        groups = [np.arange(n_atoms)]
+    indices = np.concatenate([np.asarray(group, dtype=int) for group in groups])
+    sizes = np.array([len(group) for group in groups])
+    group_index = np.repeat(np.arange(len(groups)), sizes)
+    weights = np.ones(len(indices)) if masses is None else np.asarray(masses, dtype=float)[indices]
+
+    relative = positions[:, indices]
+    if cell is not None and pbc is not None and np.any(pbc):
+        from ase.geometry import find_mic
+        first = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        relative = relative - relative[:, first][:, group_index]
+        relative = find_mic(relative.reshape(-1, 3), cell, pbc)[0].reshape(relative.shape)
+
+    # Weighted sums over the atoms of each group, for all frames at once
+    membership = sparse.csr_matrix((weights, (group_index, np.arange(len(indices)))),
+                                   shape=(len(groups), len(indices)))
+    total_weight = np.asarray(membership.sum(axis=1)).ravel()
+
+    per_atom = relative.transpose(1, 0, 2).reshape(len(indices), n_frames * 3)
+    centres = (membership @ per_atom).reshape(len(groups), n_frames, 3) / total_weight[:, None, None]
+    squared = np.sum((relative.transpose(1, 0, 2) - centres[group_index]) ** 2, axis=2)
+    radii = np.sqrt(membership @ squared / total_weight[:, None]).T
+
+    return radii[0] if single_frame else radii
+
+def track_radius_of_gyration(trajectory, groups=None, mass_weighted=True, mic=True, mult=1):
+    '''
+    Time series of the radius of gyration along a trajectory, e.g. of adsorbates or polymer chains in MD.
+
+    Parameters:
 
-    # creating variables from calulations using ase atoms class
-    mass_array = model.get_masses()
-    position_array = model.get_positions()
-    center_mass = model.get_center_of_mass()
+    trajectory: String, Trajectory or List of Atoms objects
+        Filename of an ASE trajectory, or any sequence of Atoms objects with the same atom ordering
+    groups: List of lists of integers, "molecules" or None
+        Indices of the atoms of each group. "molecules" uses the molecules of the first frame found by
+        carmm.analyse.molecules.calculate_molecules. If None, all atoms form a single group.
+    mass_weighted: Boolean
+        Whether atoms are weighted by their masses
+    mic: Boolean
+        Whether groups broken across periodic boundaries are made whole, using the cell of the first frame
+    mult: Float
+        Multiplier for the natural cutoffs used to detect molecules
 
-    # calculates mass of molecule
-    mass_of_molecule = np.sum(mass_array)
+    Returns:
+        numpy array (n_frames, n_groups)
+    '''
+    import numpy as np
 
-    # calculate distance from centre of mass for all atoms and multiplies them by the mass of their respective atom
-    lg = len(position_array)
-    m = np.zeros(shape=(lg,3))
-    for i in range(lg):
-        m[i] = mass_array[i] * (position_array[i] - center_mass)**2
-		
-    # calculates the radius of gyration
-    rog2 = np.sum(m) / mass_of_molecule
-    radius_gyration = np.sqrt(rog2)
+    if isinstance(trajectory, str):
+        from ase.io.trajectory import Trajectory
+        with Trajectory(trajectory) as traj:
+            return track_radius_of_gyration(traj, groups=groups, mass_weighted=mass_weighted, mic=mic, mult=mult)
 
-    return radius_gyration
+    first = trajectory[0]
+    if isinstance(groups, str) and groups == "molecules":
+        from carmm.analyse.molecules import calculate_molecules
+        groups = calculate_molecules(first, mult=mult)
 
+    positions = np.array([atoms.positions for atoms in trajectory])
+    masses = first.get_masses() if mass_weighted else None
+    cell, pbc = (first.cell.array, first.pbc) if mic else (None, None)
 
+    return get_radii_of_gyration(positions, masses=masses, groups=groups, cell=cell, pbc=pbc)
@@ -1,5 +1,16 @@
 # Much recycled from mulliken.py, this should get Hirshfeld charges from aims.out
 
+# Labels of the Hirshfeld quantities in aims.out, with the text up to the colon identifying each line
+hirshfeld_ids = {
+    'charge': 'Hirshfeld charge        :',
+    'volume': 'Hirshfeld volume        :',
+    'volume f': 'Free atom volume        :',
+    'dipole vector': 'Hirshfeld dipole vector :',
+    'dipole moment': 'Hirshfeld dipole moment :',
+    'second': 'Hirshfeld second moments:'
+}
+
+
 def extract_hirshfeld(fname, natoms, data, write=True, outname='hirshfeld.txt'):
     """
 
@@ -11,43 +22,109 @@ def extract_hirshfeld(fname, natoms, data, write=True, outname='hirshfeld.txt'):
               Can be 'charge', 'volume', 'volume f', 'dipole vector', 'dipole moment' or 'second'
         write: bool of whether to write the hirshfeld data to a new file called hirshfeld.txt
 
-    Returns: hirsh. List of requested data
+    Returns: hirsh. List of requested data, from the last Hirshfeld analysis in the file if write is True
+             and from all Hirshfeld analyses in the file otherwise
 
     """
 
-    # Extracts data from an aims.out and writes it to a new file.
+    # Extracts data from an aims.out and optionally writes it to a new file.
     import sys
 
-    ids = {
-        'charge':'Hirshfeld charge        :',
-        'volume':'Hirshfeld volume        :',
-        'volume f':'Free atom volume        :',
-        'dipole vector':'Hirshfeld dipole vector :',
-        'dipole moment':'Hirshfeld dipole moment :',
-        'second':'Hirshfeld second moments:'
-    }
-
-    if data in ids:
-        identifier = ids.get(data)
-
-    else:
+    if data not in hirshfeld_ids:
         print('Requested data not recognised')
         sys.exit()
 
-        
-    with open(fname, 'r') as f:
-        output = f.readlines()
+    if write is not True:
+        return read_hirshfeld(fname, hirshfeld_ids[data])
 
-    hirshfeld_line = get_hirshfeld_line(output)
+    hirsh = parse_hirshfeld(fname, natoms, outname=outname)
+    if data not in hirsh:
+        raise ValueError("No Hirshfeld {} found for all {} atoms in {}".format(data, natoms, fname))
 
-    if write is True:
+    # Second moments are returned as a flat list of the 9 tensor elements for each atom
+    if data == 'second':
+        return hirsh[data].reshape(natoms, 9).tolist()
 
-        write_hirshfeld(output, natoms, hirshfeld_line, outname)
+    return hirsh[data].tolist()
+
+
+def parse_hirshfeld(fname, natoms, outname=None):
+    """
+
+    Args:
+        fname: Input file name, usually aims.out. str
+        natoms: number of atoms in the calculation. int
+        outname: if given, name of a file to which the per-atom lines of the Hirshfeld block are also written,
+                 as by write_hirshfeld. str
+
+    Returns: dictionary of numpy arrays with the quantities of the last Hirshfeld analysis in the file,
+             using the keys of hirshfeld_ids. 'dipole vector' has shape (natoms, 3), 'second' (natoms, 3, 3)
+             and the others (natoms,). Quantities that are not printed for every atom are left out.
+
+    """
 
-        hirsh = read_hirshfeld(outname, identifier)
+    from carmm.analyse.mulliken import _find_last
+
+    # Only the last Hirshfeld block is read, from its header line to the end of the per-atom data
+    with open(fname, 'rb') as read_stream:
+        position = _find_last(read_stream, b"Performing Hirshfeld analysis of fragment charges and moments.",
+                              2**16)
+        output = _read_hirshfeld_block(read_stream, position) if position is not None else []
+
+    if outname is not None:
+        with open(outname, 'w') as h:
+            h.writelines(output[2:])
+
+    return _parse_hirshfeld_lines(output, natoms)
+
+
+def _read_hirshfeld_block(read_stream, position):
+
+    # Internal function returning the lines of the Hirshfeld block starting at a byte position of a binary stream,
+    # i.e. the header and separator lines followed by the lines of all atoms, however many there are for each atom
+
+    read_stream.seek(position)
+    output = [read_stream.readline().decode(), read_stream.readline().decode()]
+    for line in iter(read_stream.readline, b""):
+        line = line.decode()
+        if not line.lstrip().startswith(('|', '---')):
+            break
+        output.append(line)
+
+    return output
+
+
+def _parse_hirshfeld_lines(output, natoms):
+
+    # Internal function converting the lines of a Hirshfeld block into the arrays returned by parse_hirshfeld
+    # output: list of lines of the block
+    # natoms: no. of atoms
 
-    else:
-        hirsh = read_hirshfeld(fname, identifier)
+    import numpy as np
+
+    # Values are collected by their label, lines without a label continue the previous quantity (second moments)
+    names = {identifier.split(':')[0].strip(): name for name, identifier in hirshfeld_ids.items()}
+    values = {name: [] for name in hirshfeld_ids}
+    name = None
+    for line in output:
+        text = line.strip()
+        if not text.startswith('|'):
+            name = None
+        elif ':' in text:
+            label, value = text.strip('| ').split(':', 1)
+            name = names.get(label.strip())
+            if name is not None:
+                values[name].append(value)
+        elif name is not None:
+            values[name][-1] += ' ' + text.strip('| ')
+
+    shapes = {'dipole vector': (natoms, 3), 'second': (natoms, 3, 3)}
+    hirsh = {}
+    for name in hirshfeld_ids:
+        numbers = ' '.join(values[name]).split()
+        shape = shapes.get(name, (natoms,))
+        if len(values[name]) == natoms and len(numbers) == np.prod(shape):
+            hirsh[name] = np.array(numbers, dtype=float).reshape(shape)
 
     return hirsh
 
@@ -17,19 +17,14 @@ def calculate_molecules(atoms,  mult=1, print_output=False):
         can view individual molecules via atoms[molecules[0]] ect
     '''
 
-    from ase.neighborlist import natural_cutoffs, NeighborList
+    from carmm.analyse.connectivity import get_connectivity
     from scipy import sparse
-    cutOff = natural_cutoffs(atoms, mult=mult)
-    neighborList = NeighborList(cutOff, self_interaction=False, bothways=True)
-    neighborList.update(atoms)
-    matrix = neighborList.get_connectivity_matrix()
+    matrix = get_connectivity(atoms, mult=mult).adjacency
     n_molecules, component_list = sparse.csgraph.connected_components(matrix)
 
-    molecules = []
-    for n in range(n_molecules):
-        atomsIdxs = [i for i in range(len(component_list)) if component_list[i] == n]
-        molecules.append(atomsIdxs) 
-        if (print_output):
+    molecules = [molecule.tolist() for molecule in _group_by_component(component_list, n_molecules)]
+    if (print_output):
+        for n, atomsIdxs in enumerate(molecules):
             print("The following atoms are part of molecule {}: {}".format(n, atomsIdxs))
 
     return molecules
@@ -51,20 +46,208 @@ def calculate_formula(atoms, mult=1):
     Hill's notation (CO2).
     '''
 
-    import collections
-    molecules = calculate_molecules(atoms, mult=mult)
-    molecule_formula = []
-    for i in range(len(molecules)):
-        # obtain chemical symbols. Ie: for CO2, they are returned as ['C', 'O', 'O'].
-        symbols = [atoms[j].symbol for j in molecules[i]]
-        # counters this list
-        c = collections.Counter(symbols)
-        # returns it in Hill notation.
-        chemical_formula = ''
-        for k, v in c.items():
-            entry = str(k) + str(v)
-            chemical_formula += entry
-        # appends chemical formula for molecule i to a list.
-        molecule_formula.append(chemical_formula)
-
-    return molecule_formula
+    from carmm.analyse.connectivity import get_connectivity
+    from scipy import sparse
+    matrix = get_connectivity(atoms, mult=mult).adjacency
+    n_molecules, component_list = sparse.csgraph.connected_components(matrix)
+
+    return _get_formulas(atoms.get_chemical_symbols(), component_list, n_molecules)
+
+class MoleculeTracker:
+    '''
+    Description
+    Follows the molecules of a system along a trajectory. Bonds are defined as in calculate_molecules, but are
+    evaluated on a Verlet list of candidate pairs which is only updated for atoms that moved by more than half
+    the skin since they were last checked, rather than repeating the neighbour search every frame.
+    Each molecule is identified by the lowest atom index it contains, so identities persist between frames
+    as long as the molecule keeps that atom.
+    '''
+    def __init__(self, mult=1, skin=1.0):
+        '''
+        Parameters:
+
+        mult: Float
+            Multiplier for the natural cutoffs defining the bonds
+        skin: Float
+            Verlet skin in Angstrom. Larger values make updates of the candidate pairs rarer but each frame slower.
+        '''
+        self.mult = mult
+        self.skin = skin
+        self.n_updates = 0
+        self._reference_positions = None
+
+    def update(self, atoms):
+        '''
+        Determines the molecules of the next frame
+
+        Parameters:
+
+        atoms: Atoms object
+            Frame of the trajectory, with the same atoms in the same order as the previous frames
+
+        Returns:
+            numpy array (natoms) with the molecule identity of each atom, i.e. the lowest index of its molecule
+        '''
+        import numpy as np
+        from scipy import sparse
+
+        positions = atoms.get_positions()
+        if self._reference_positions is None:
+            from ase.neighborlist import natural_cutoffs
+            # Same bond definition as get_connectivity, with its default skin of 0.3
+            self._radii = np.array(natural_cutoffs(atoms, mult=self.mult)) + 0.3
+            self._reference_positions = positions.copy()
+            self._pairs = np.empty((0, 2), dtype=int)
+            self._vectors = np.empty((0, 3))
+            moved = np.ones(len(atoms), dtype=bool)
+        else:
+            displacements = self._get_displacements(atoms)
+            moved = np.linalg.norm(displacements, axis=1) > self.skin / 2
+
+        if moved.any():
+            self._update_pairs(atoms, moved)
+
+        displacements = self._get_displacements(atoms)
+        i, j = self._pairs[:, 0], self._pairs[:, 1]
+        vectors = self._vectors + displacements[j] - displacements[i]
+        bonded = np.linalg.norm(vectors, axis=1) < self._radii[i] + self._radii[j]
+
+        matrix = sparse.csr_matrix((np.ones(np.count_nonzero(bonded), dtype=np.int8), (i[bonded], j[bonded])),
+                                   shape=(len(atoms), len(atoms)))
+        n_molecules, component_list = sparse.csgraph.connected_components(matrix)
+
+        # Identify each molecule by its lowest atom index
+        lowest_index = np.full(n_molecules, len(atoms))
+        np.minimum.at(lowest_index, component_list, np.arange(len(atoms)))
+
+        return lowest_index[component_list]
+
+    def _get_displacements(self, atoms):
+        '''
+        Displacements of all atoms from their reference positions, following the minimum image convention
+        '''
+        from ase.geometry import find_mic
+
+        displacements = atoms.get_positions() - self._reference_positions
+        if atoms.pbc.any():
+            displacements = find_mic(displacements, atoms.cell, atoms.pbc)[0]
+
+        return displacements
+
+    def _update_pairs(self, atoms, moved):
+        '''
+        Replaces the candidate pairs of the moved atoms by a new neighbour search around them.
+        The search radius includes 1.5 times the skin, as the reference positions of the two atoms of a pair
+        may have been set at different times, so their separation can change by up to 1.5 skins.
+        '''
+        import numpy as np
+        from scipy.spatial import cKDTree
+        from carmm.analyse.connectivity import get_periodic_images
+
+        margin = 1.5 * self.skin
+        r_max = 2 * self._radii.max() + margin
+        image_positions, image_atoms = get_periodic_images(atoms, r_max)
+        tree = cKDTree(image_positions)
+
+        centres = np.flatnonzero(moved)
+        found = tree.query_ball_point(image_positions[centres], self._radii[centres] + self._radii.max() + margin)
+        i = np.repeat(centres, [len(images) for images in found])
+        images = np.concatenate([np.asarray(x, dtype=int) for x in found] + [np.empty(0, dtype=int)])
+        j = image_atoms[images]
+        vectors = image_positions[images] - image_positions[i]
+        distances = np.linalg.norm(vectors, axis=1)
+
+        # Candidate pairs, excluding atoms themselves and listing pairs of two moved atoms once
+        keep = (distances < self._radii[i] + self._radii[j] + margin) & (distances > 0)
+        keep &= ~moved[j] | (i <= j)
+        i, j, vectors = i[keep], j[keep], vectors[keep]
+
+        # Reference positions of the moved atoms are reset, the stored vectors refer to the reference positions
+        displacements = self._get_displacements(atoms)
+        vectors = vectors - displacements[j] * ~moved[j][:, None]
+        self._reference_positions[moved] = atoms.get_positions()[moved]
+
+        unchanged = ~(moved[self._pairs[:, 0]] | moved[self._pairs[:, 1]])
+        self._pairs = np.concatenate((self._pairs[unchanged], np.column_stack((i, j))))
+        self._vectors = np.concatenate((self._vectors[unchanged], vectors))
+        self.n_updates += 1
+
+def track_molecules(trajectory, mult=1, skin=1.0):
+    '''
+    Follows molecule identities and formula counts over a trajectory, e.g. reactions or dissociation in MD.
+    Frames are processed one at a time with a MoleculeTracker, updating connectivity incrementally.
+
+    Parameters:
+    trajectory: String, Trajectory or List of Atoms objects
+        Filename of an ASE trajectory, or any sequence of Atoms objects with the same atom ordering
+    mult: Float
+        Multiplier for the natural cutoffs defining the bonds
+    skin: Float
+        Verlet skin in Angstrom, see MoleculeTracker
+
+    Returns:
+    molecule_ids: numpy array (n_frames, natoms)
+        Molecule identity of each atom in each frame, i.e. the lowest atom index of its molecule
+    formula_counts: Dictionary
+        Number of molecules of each formula (as calculate_formula) in each frame, as numpy arrays (n_frames)
+    '''
+    import numpy as np
+
+    if isinstance(trajectory, str):
+        from ase.io.trajectory import Trajectory
+        with Trajectory(trajectory) as traj:
+            return track_molecules(traj, mult=mult, skin=skin)
+
+    tracker = MoleculeTracker(mult=mult, skin=skin)
+    molecule_ids = []
+    formula_counts = {}
+    for frame, atoms in enumerate(trajectory):
+        ids = tracker.update(atoms)
+        molecule_ids.append(ids.astype(np.int32))
+
+        component_list = np.unique(ids, return_inverse=True)[1].ravel()
+        formulas, counts = np.unique(_get_formulas(atoms.get_chemical_symbols(), component_list,
+                                                   component_list.max() + 1), return_counts=True)
+        for formula, count in zip(formulas, counts):
+            formula_counts.setdefault(str(formula), np.zeros(len(trajectory), dtype=int))[frame] = count
+
+    return np.array(molecule_ids), formula_counts
+
+def _group_by_component(component_list, n_components):
+    '''
+    Splits the atom indices by component, keeping ascending order within each component
+    '''
+    import numpy as np
+
+    order = np.argsort(component_list, kind='stable')
+    sizes = np.bincount(component_list, minlength=n_components)
+
+    return np.split(order, np.cumsum(sizes)[:-1])
+
+def _get_formulas(symbols, component_list, n_components):
+    '''
+    Formula of every component, listing elements in order of first appearance within the component.
+    Each distinct combination of element counts and order is only converted to a string once.
+    '''
+    import numpy as np
+
+    elements, symbol_index = np.unique(symbols, return_inverse=True)
+    symbol_index = symbol_index.ravel()
+    nelements = len(elements)
+    flat = component_list * nelements + symbol_index
+
+    counts = np.bincount(flat, minlength=n_components * nelements).reshape(n_components, nelements)
+    first = np.full(n_components * nelements, len(symbols))
+    np.minimum.at(first, flat, np.arange(len(symbols)))
+    rank = np.argsort(np.argsort(first.reshape(n_components, nelements), axis=1), axis=1)
+
+    keys = np.concatenate((counts, np.where(counts > 0, rank, -1)), axis=1)
+    unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+
+    unique_formulas = []
+    for key in unique_keys:
+        present = np.flatnonzero(key[:nelements])
+        present = present[np.argsort(key[nelements:][present])]
+        unique_formulas.append(''.join(elements[k] + str(key[k]) for k in present))
+
+    return [unique_formulas[k] for k in inverse.ravel()]
@@ -1,4 +1,4 @@
-def extract_mulliken_charge(fn, natoms):
+def extract_mulliken_charge(fn, natoms, as_array=False):
     '''
     Function to extract and return the Mulliken charges from an FHI-aims output.
     A list of relative charges is returned, with +q meaning charge depletion and -q meaning charge accummulation
@@ -9,24 +9,27 @@ def extract_mulliken_charge(fn, natoms):
         Filename from which the Mulliken data should be extracted
     natoms: int
         Number of atoms in the calculation
+    as_array: bool
+        Whether the charges are returned as a numpy array of floats rather than a list of strings
 
     Returns:
         List of charges.
 
     '''
 
-    with open(fn, 'r') as f:
-        output = f.readlines()
-
-    # Focus on just the Mulliken charge data
-    mulliken_line = _get_mulliken_data_line(output, "Summary of the per-atom charge analysis:")
+    # Focus on just the Mulliken charge data, 3 lines after the label of the last block
+    output = read_last_block(fn, "Summary of the per-atom charge analysis:", natoms, offset=3)
 
     # Note that the 4th column of data is selected, which is the overall charge
-    mulliken_data = [q.split()[3] for q in output[mulliken_line:mulliken_line + natoms]]
+    mulliken_data = [q.split()[3] for q in output]
+
+    if as_array:
+        import numpy as np
+        return np.array(mulliken_data, dtype=float)
 
     return mulliken_data
 
-def extract_mulliken_spin(fn, natoms):
+def extract_mulliken_spin(fn, natoms, as_array=False):
     '''
     Function to extract and return the Mulliken spin from an FHI-aims output.
     A list of spin moments on is returned. The value at each index corresponds to the spin moment of each the atom at
@@ -38,52 +41,96 @@ def extract_mulliken_spin(fn, natoms):
         Filename from which the Mulliken data should be extracted
     natoms: int
         Number of atoms in the calculation
+    as_array: bool
+        Whether the spin moments are returned as a numpy array of floats rather than a list of strings
 
     Returns:
         List of spin moments.
 
     '''
 
-    with open(fn, 'r') as f:
-        output = f.readlines()
-
-    # Focus on just the Mulliken spin data
-    mulliken_line = _get_mulliken_data_line(output, "Summary of the per-atom spin analysis:")
+    # Focus on just the Mulliken spin data, 3 lines after the label of the last block
+    output = read_last_block(fn, "Summary of the per-atom spin analysis:", natoms, offset=3)
 
     # Return just the spin data, which is the 3rd column of data
-    mulliken_data = [q.split()[2] for q in output[mulliken_line:mulliken_line + natoms]]
+    mulliken_data = [q.split()[2] for q in output]
+
+    if as_array:
+        import numpy as np
+        return np.array(mulliken_data, dtype=float)
 
     return mulliken_data
 
-def _get_mulliken_data_line(text, data_identifier):
+def read_last_block(fname, identifier, nlines, offset=0, block_size=2**16):
     '''
-    Function to extract and return the Mulliken data block from an FHI-aims output.
-    Can return charges or spin, but should be accessed through wrapper functions and not directly.
-    This does not refine the data, and more than anything that is the reason to use the wrappers
+    Function to read the lines of the last block of data following an identifier in a (large) text file,
+    e.g. the final charge analysis of an FHI-aims output.
+    The file is searched backwards from its end in blocks of fixed size and only the requested lines are read,
+    so the time and memory needed do not depend on the length of the file.
 
     Parameters:
 
-    text: List of string
-        Content of the output file
-    data_identifier: string
+    fname: string
+        Filename of the output file
+    identifier: string
         Text that precedes the data desired
+    nlines: int
+        Number of lines of data to return
+    offset: int
+        Number of lines from the line of the identifier to the first line of data
+    block_size: int
+        Number of bytes read at a time while searching for the identifier
 
     Returns:
-        An integer value of the line number corresponding to the mulliken block in the output file.
+        List of strings with the lines of data, or an empty list if the identifier is not found.
     '''
 
-    # Focus on just the Mulliken data
-    mulliken_line = 0
-    output_line = len(text) - 1
-    while output_line and not mulliken_line:
-        if data_identifier in text[output_line]:
-            mulliken_line = output_line
-            # 8 lines from text label to start of data (spin-paired)
-            mulliken_line += 3
-        else:
-            output_line -= 1
+    with open(fname, 'rb') as read_stream:
+        position = _find_last(read_stream, identifier.encode(), block_size)
+        if position is None:
+            return []
+
+        lines = _read_lines_at(read_stream, position, nlines, offset)
 
-    return mulliken_line
+    return lines
+
+def _read_lines_at(read_stream, position, nlines, offset=0):
+    '''
+    Returns nlines lines, as strings, of a binary stream starting offset lines after the byte position
+    '''
+    read_stream.seek(position)
+    for n in range(offset):
+        read_stream.readline()
+
+    return [read_stream.readline().decode() for n in range(nlines)]
+
+def _find_last(read_stream, identifier, block_size):
+    '''
+    Returns the byte position of the start of the line containing the last occurrence of identifier in a binary
+    stream, or None. Consecutive blocks read backwards overlap so that occurrences spanning two blocks are found.
+    '''
+    read_stream.seek(0, 2)
+    end = read_stream.tell()
+    overlap = b""
+    while end > 0:
+        start = max(0, end - block_size)
+        read_stream.seek(start)
+        block = read_stream.read(end - start) + overlap
+        position = block.rfind(identifier)
+        if position >= 0:
+            # Continue backwards to the start of the line if it lies in an earlier block
+            line_start = block.rfind(b"\n", 0, position) + 1
+            while line_start == 0 and start > 0:
+                end = start
+                start = max(0, end - block_size)
+                read_stream.seek(start)
+                block = read_stream.read(end - start)
+                line_start = block.rfind(b"\n") + 1
+            return start + line_start
+        overlap = block[:len(identifier) - 1]
+        end = start
+
+    return None
 
 def write_dos_to_csv(fname, x, y):
     '''
@@ -115,122 +162,296 @@ def write_dos_to_csv(fname, x, y):
             for i in range(len(x)):
                 csv_writer.writerow([x[i], y[0][i], y[1][i]])
 
-def parse_mulliken_file(fname):
+def parse_mulliken_file(fname, chunk_size=2**24, cache=False):
     '''
 
     Description
     Extracting data from a Mulliken.out file. Iterates through each atom, spin-channel, k-points and eigenstates to
     extract the values of eigenvalues (energies), occupancies (occupation number), total angular momenta.
+    The file is streamed in chunks of whole lines, so memory use is bounded by chunk_size and the data arrays.
+    A first pass only searches for the atom, spin and k-point headers to size the arrays, the second pass
+    converts each block of states with a single numpy call.
 
     Parameters:
 
     fname: String
         Filename of the Mulliken.out file we are reading in and parsing.
+    chunk_size: Integer
+        Number of bytes read at a time
+    cache: Boolean
+        Whether to keep the parsed arrays in a binary cache next to the file (fname + '.cache'). If the cache
+        is up to date it is memory-mapped instead of parsing the text, so only the data used is read from disk.
+        Otherwise the file is parsed and the cache written for later calls.
 
     Returns:
         A MullikenData object containing the values of eigenvalues (energies), occupancies (occupation number),
         total angular momenta for each atom, spin-channel, k-point and eigenstate.
 
     '''
+    import re
+    import numpy as np
 
-    # Read in the Mulliken data
-    with open(fname, 'r') as read_stream:
-        lines = read_stream.readlines()
+    if cache:
+        md = _load_mulliken_cache(fname)
+        if md is not None:
+            return md
 
+    atom_pattern = re.compile(rb'Atom number\s+(\d+)')
+    kpt_pattern = re.compile(rb'k point number:\s+(\d+):(?:.*weight:\s+(\S+))?')
+
+    # Prescan Mulliken file for natoms, nspin, nkpts so we can then digest data.
     natoms = 1
     nspin = 1
     nkpts = 1
     nstates = 1
-    # Prescan Mulliken file for natoms, nspin, nkpts so we can then digest data.
-    for line in lines:
-        words = line.split()
-        if (len(words)) > 0:
-            if words[0] == "Atom":
-                # Outer loop for Mulliken is over each atom
-                current_atom = int(words[2].replace(":", ""))
-                if current_atom > natoms:
-                    natoms = current_atom
-            elif words[0] == "Spin":
-                # Middle loop is over spins. Keyword only present if spin is present
-                nspin = 2
-            elif words[0] == "k":
-                # Inside loop is over k-points.
-                current_k_point = int(words[3].replace(":",""))
-                if current_k_point > nkpts:
-                    nkpts = current_k_point
-            else:
-                try:
-                    current_state = int(words[0])
-                    if current_state > nstates:
-                        nstates = current_state
-                except ValueError:
-                    pass
+    with open(fname, 'rb') as read_stream:
+        for chunk in _read_line_chunks(read_stream, chunk_size):
+            for header, states in _split_state_blocks(chunk):
+                if header is not None:
+                    if header.startswith(b"Atom"):
+                        # Outer loop for Mulliken is over each atom
+                        natoms = max(natoms, int(atom_pattern.match(header).group(1)))
+                    elif header.startswith(b"Spin"):
+                        # Middle loop is over spins. Keyword only present if spin is present
+                        nspin = 2
+                    elif header.startswith(b"k point"):
+                        # Inside loop is over k-points.
+                        nkpts = max(nkpts, int(kpt_pattern.match(header).group(1)))
+
+                # Only the last state of each block is needed to get the number of states
+                states = states.rstrip()
+                if states:
+                    nstates = max(nstates, int(states[states.rfind(b"\n") + 1:].split(None, 1)[0]))
 
     # Setup all data structures containing all information for each atom
     md = MullikenData(natoms, nspin, nkpts, nstates)
 
-    current_atom = 1
+    current_atom = 0
     current_spin = 0
-    current_k_point = 1
-
-    # Spin keywords are different depending on whether included in the calculation
-    # For spin-paired systems, we won't hit a keyword and so need to force increment this value
-    if nspin == 1:
-        current_spin = 1
-
-    for line in lines:
-        words = line.split()
-        if len(words) > 0:
-            if words[0] == "Atom":
-                # Outer loop for Mulliken is over each atom
-                current_atom = int(words[2].replace(":", ""))
-            elif words[0] == "Spin":
-                current_spin += 1
-                if current_spin > 2:
-                    current_spin = 1
-            elif words[0] == "k":
-                # Inside loop is over k-points.
-                current_k_point = int(words[3].replace(":",""))
-                if len(words) > 9:
-                    md.atoms[current_atom-1].spin[current_spin-1].kpts[current_k_point-1].weight = float(words[10])
-            else:
-                try:
-                    current_state = int(words[0])
-                    md.atoms[current_atom-1].spin[current_spin-1].kpts[current_k_point-1].energies[
-                        current_state-1] =  float(words[1])
-                    md.atoms[current_atom-1].spin[current_spin-1].kpts[current_k_point-1].occupancies[
-                        current_state-1] = float(words[2])
-                    md.atoms[current_atom-1].spin[current_spin-1].kpts[current_k_point-1].all_mulliken[
-                        current_state-1] = float(words[3])
-                    for i in range(len(words) - 4):
-                        md.atoms[current_atom-1].spin[current_spin-1].kpts[current_k_point-1].orbitals[i][current_state-1] = float(words[i+4])
-                except ValueError:
-                    pass
+    current_k_point = 0
+
+    with open(fname, 'rb') as read_stream:
+        for chunk in _read_line_chunks(read_stream, chunk_size):
+            for header, states in _split_state_blocks(chunk):
+                if header is not None:
+                    if header.startswith(b"Atom"):
+                        # Outer loop for Mulliken is over each atom
+                        current_atom = int(atom_pattern.match(header).group(1)) - 1
+                    elif header.startswith(b"Spin"):
+                        # Middle loop is over spins. Keyword only present if spin is present
+                        current_spin = 1 if b"down" in header else 0
+                    elif header.startswith(b"k point"):
+                        # Inside loop is over k-points.
+                        k_point, weight = kpt_pattern.match(header).groups()
+                        current_k_point = int(k_point) - 1
+                        if weight is not None:
+                            md.weights[current_atom, current_spin, current_k_point] = float(weight)
+
+                states = states.strip()
+                if states:
+                    # The number of angular momentum columns depends on the species
+                    ncolumns = len(states.split(b"\n", 1)[0].split())
+                    rows = np.fromstring(states, sep=' ').reshape(-1, ncolumns)
+                    state = rows[:, 0].astype(int) - 1
+                    block = (current_atom, current_spin, current_k_point)
+                    md.energies[block + (state,)] = rows[:, 1]
+                    md.occupancies[block + (state,)] = rows[:, 2]
+                    md.all_mulliken[block + (state,)] = rows[:, 3]
+                    md.orbitals[block][:ncolumns - 4, state] = rows[:, 4:].T
+
+    if cache:
+        _write_mulliken_cache(fname, md)
 
     return md
 
+def _get_file_key(fname, content_hash=True):
+    '''
+    Returns the size, modification time and (optionally) SHA-1 of the content of a file, identifying its version
+    '''
+    import os
+    import hashlib
+
+    stat = os.stat(fname)
+    key = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+    if content_hash:
+        digest = hashlib.sha1()
+        with open(fname, 'rb') as read_stream:
+            for block in iter(lambda: read_stream.read(2**24), b""):
+                digest.update(block)
+        key['sha1'] = digest.hexdigest()
+
+    return key
+
+def _load_mulliken_cache(fname):
+    '''
+    Returns the MullikenData stored in the cache of fname, memory-mapped copy-on-write, or None if there is
+    no cache for the current version of the file. The content hash is only recomputed if the modification
+    time changed without a change in size, e.g. after copying the file, so up to date caches load immediately.
+    '''
+    import os
+    import json
+    import numpy as np
+
+    cache_dir = fname + '.cache'
+    key_file = os.path.join(cache_dir, 'key.json')
+    if not os.path.isfile(key_file):
+        return None
+
+    with open(key_file, 'r') as read_stream:
+        cached_key = json.load(read_stream)
+
+    key = _get_file_key(fname, content_hash=False)
+    if key['size'] != cached_key['size']:
+        return None
+    if key['mtime'] != cached_key['mtime']:
+        key = _get_file_key(fname)
+        if key['sha1'] != cached_key['sha1']:
+            return None
+        with open(key_file, 'w') as write_stream:
+            json.dump(key, write_stream)
+
+    arrays = [np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode='c') for name in MullikenData.array_names]
+
+    return MullikenData.from_arrays(*arrays)
+
+def _write_mulliken_cache(fname, md):
+    '''
+    Writes the arrays of md as uncompressed .npy files, which can be memory-mapped, to the cache of fname.
+    The key is written last, so an interrupted write leaves no valid cache behind.
+    '''
+    import os
+    import json
+    import numpy as np
+
+    cache_dir = fname + '.cache'
+    key_file = os.path.join(cache_dir, 'key.json')
+    os.makedirs(cache_dir, exist_ok=True)
+    if os.path.exists(key_file):
+        os.remove(key_file)
+
+    for name in MullikenData.array_names:
+        np.save(os.path.join(cache_dir, name + '.npy'), getattr(md, name))
+
+    with open(key_file, 'w') as write_stream:
+        json.dump(_get_file_key(fname), write_stream)
+
+def _read_line_chunks(stream, chunk_size):
+    '''
+    Yields the content of a binary stream in chunks of about chunk_size bytes, each ending at the end of a line
+    '''
+    remainder = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        chunk = remainder + chunk
+        end = chunk.rfind(b"\n") + 1
+        if end == 0:
+            remainder = chunk
+            continue
+        remainder = chunk[end:]
+        yield chunk[:end]
+
+    if remainder:
+        yield remainder
+
+def _split_state_blocks(chunk):
+    '''
+    Splits a chunk of Mulliken.out into (header line, numeric text following it) pairs.
+    The first pair has header None and holds any numeric text preceding the first header of the chunk.
+    Header lines are found with plain substring searches, which are much faster than a regular expression
+    over every line of the states.
+    '''
+    starts = []
+    for keyword in (b"Atom number", b"Spin channel", b"State", b"k point number", b"#"):
+        position = chunk.find(keyword)
+        while position >= 0:
+            starts.append(chunk.rfind(b"\n", 0, position) + 1)
+            position = chunk.find(keyword, position + 1)
+
+    blocks = []
+    header = None
+    position = 0
+    for start in sorted(set(starts)):
+        end = chunk.find(b"\n", start)
+        if end < 0:
+            end = len(chunk)
+        blocks.append((header, chunk[position:start]))
+        header = chunk[start:end].strip()
+        position = end
+    blocks.append((header, chunk[position:]))
+
+    return blocks
+
+class _ViewList:
+    '''
+    Description
+    Read-only sequence creating the views of the MullikenData arrays (Atom, Spin, Kpt) on access,
+    so that no per-state Python objects are stored.
+    '''
+    def __init__(self, view, args, length):
+        self._view = view
+        self._args = args
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("index out of range")
+        return self._view(*self._args, index)
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self[index]
+
+
+def _array_view(name):
+    '''
+    Property giving a view of the MullikenData array name for the atom, spin and k-point of a Kpt
+    '''
+    def getter(self):
+        return getattr(self._data, name)[self._atom, self._spin, self._kpt]
+
+    def setter(self, value):
+        getattr(self._data, name)[self._atom, self._spin, self._kpt] = value
+
+    return property(getter, setter)
+
+
 class Kpt:
     '''
     Description
     Class to represent data for a particular k-point. Data includes the number eigenstates for a given k-point, spin channel
-    and atom.
+    and atom. The attributes are views of the arrays stored in MullikenData, so modifying them modifies the data.
     '''
-    def __init__(self, nstates):
+    weight = _array_view('weights')
+    energies = _array_view('energies')
+    occupancies = _array_view('occupancies')
+    all_mulliken = _array_view('all_mulliken')
+    # Up to l = 4, which is g. Indexed as orbitals[l][state]
+    orbitals = _array_view('orbitals')
+
+    def __init__(self, data, atom, spin, kpt):
         '''
         Description
 
         Parameters:
 
-        nstates: Integer
-            Number of electronic states to be stored in the data object
+        data: MullikenData
+            Object holding the arrays
+        atom, spin, kpt: Integers
+            Indices of the atom, spin channel and k-point represented
         '''
-        # initialize each of the list with some number currently which will be modified with true numbers from
-        # the mulliken file obtained while parsing the data using parse_mulliken_file() function defined above
-        self.weight = 1.0
-        self.energies = [ 0.0 for i in range(nstates) ]
-        self.occupancies = [ 0.0 for i in range(nstates) ]
-        self.all_mulliken = [ 0.0 for i in range(nstates) ]
-        self.orbitals = [ [ 0.0 for i in range(nstates) ] for j in range(5) ] # Up to l = 4, which is g.
+        self._data = data
+        self._atom = atom
+        self._spin = spin
+        self._kpt = kpt
 
 class Spin:
     '''
@@ -238,19 +459,19 @@ class Spin:
     Class to represent data for a spin channel. Data includes the number of k-points and eigenstates for a given spin channel
     and atom.
     '''
-    def __init__(self, nkpts, nstates):
+    def __init__(self, data, atom, spin):
         '''
         Description
 
         Parameters:
 
-        nkpts: Integer
-            Number of k-points in the model
-        nstates: Integer
-            Number of electronic states to be stored in the data object
+        data: MullikenData
+            Object holding the arrays
+        atom, spin: Integers
+            Indices of the atom and spin channel represented
         '''
-        # create a nested list of objects of the Kpt class (defined above)
-        self.kpts = [ Kpt(nstates) for i in range(nkpts) ]
+        # sequence of views of the Kpt class (defined above)
+        self.kpts = _ViewList(Kpt, (data, atom, spin), data.energies.shape[2])
 
 
 class Atom:
@@ -259,27 +480,31 @@ class Atom:
     # TODO: Needs changing the name of the class as it might interfere with the 'Atom' class of ASE
     Class to represent data for a each atom. Data includes the number of spin-channel, k-points and eigenstates for each atom
     '''
-    def __init__(self, nspin, nkpts, nstates):
+    def __init__(self, data, atom):
         '''
         Description
 
         Parameters:
 
-        nspin: Integer
-            Number of spin channels in the data object
-        nkpts: Integer
-            Number of k-points in the model
-        nstates: Integer
-            Number of electronic states to be stored in the data object
+        data: MullikenData
+            Object holding the arrays
+        atom: Integer
+            Index of the atom represented
         '''
-        # create a nested list of objects of the Spin class (defined above)
-        self.spin = [ Spin(nkpts, nstates) for i in range(nspin) ]
+        # sequence of views of the Spin class (defined above)
+        self.spin = _ViewList(Spin, (data, atom), data.energies.shape[1])
 
 class MullikenData:
     '''
     Description
     Class representing the Mulliken data and store information pertinent to eigenvalues, occupation numbers, and angular
-    momentas for each atom, spin-channel, k-point and eigenstate
+    momentas for each atom, spin-channel, k-point and eigenstate.
+    The data is stored in numpy arrays:
+        energies, occupancies, all_mulliken: (natoms, nspin, nkpts, nstates)
+        orbitals: (natoms, nspin, nkpts, 5, nstates), with the l = 0 to 4 (s to g) contributions
+        weights: (natoms, nspin, nkpts), k-point weights
+    The atoms attribute gives the same data through per atom, spin and k-point views,
+    e.g. md.atoms[0].spin[1].kpts[0].energies
 
     Parameters:
 
@@ -292,6 +517,9 @@ class MullikenData:
         nstates: Integer
             Number of electronic states to be stored in the data object
     '''
+    # Arrays holding all the data, in the order taken by from_arrays
+    array_names = ['weights', 'energies', 'occupancies', 'all_mulliken', 'orbitals']
+
     def __init__(self, natoms, nspin, nkpts, nstates):
         '''
         Parameters:
@@ -305,58 +533,97 @@ class MullikenData:
         nstates: Integer
             Number of electronic states to be stored in the data object
         '''
-        # create a nested list of objects of the Atom class (defined above and not to be confused with ASE Atom class)
+        import numpy as np
+
+        # initialize the arrays which will be modified with true numbers from the mulliken file
+        # obtained while parsing the data using parse_mulliken_file() function defined above
+        self.weights = np.ones((natoms, nspin, nkpts))
+        self.energies = np.zeros((natoms, nspin, nkpts, nstates))
+        self.occupancies = np.zeros((natoms, nspin, nkpts, nstates))
+        self.all_mulliken = np.zeros((natoms, nspin, nkpts, nstates))
+        self.orbitals = np.zeros((natoms, nspin, nkpts, 5, nstates))
+
+        # views of the Atom class (defined above and not to be confused with ASE Atom class)
         # TODO: Needs changing the name of the class as it might interfere with the 'Atom' class of ASE
-        self.atoms = [ Atom(nspin, nkpts, nstates) for i in range(natoms) ]
+        self.atoms = _ViewList(Atom, (self,), natoms)
         self.homo = None
+        self.band_edges = None
+
+    @classmethod
+    def from_arrays(cls, weights, energies, occupancies, all_mulliken, orbitals):
+        '''
+        Description
+        Creates a MullikenData object holding existing arrays (e.g. memory-mapped ones) without copying them
+
+        Parameters:
+
+        weights, energies, occupancies, all_mulliken, orbitals: numpy arrays
+            Data with the shapes described for the class
+        '''
+        md = cls(0, 0, 0, 0)
+        md.weights = weights
+        md.energies = energies
+        md.occupancies = occupancies
+        md.all_mulliken = all_mulliken
+        md.orbitals = orbitals
+        md.atoms = _ViewList(Atom, (md,), energies.shape[0])
+
+        return md
 
     def get_natoms(self):
         '''
         Description
         Computes the number of atoms
         '''
-        return len(self.atoms)
+        return self.energies.shape[0]
 
     def get_nspin(self):
         '''
         Description
         Computes the number of spin channels. For spin paired the value is 1 whereas for spin polarised the value is 2
         '''
-        return len(self.atoms[0].spin)
+        return self.energies.shape[1]
 
     def get_nkpts(self):
         '''
         Description
         Computes the number of k-points
         '''
-        return len(self.atoms[0].spin[0].kpts)
+        return self.energies.shape[2]
 
     def get_nstates(self):
         '''
         Description
         Computes the number of eigenstates
         '''
-        return len(self.atoms[0].spin[0].kpts[0].energies)
+        return self.energies.shape[3]
+
+    def get_band_edges(self):
+        '''
+        Description
+        Computes the HOMO, LUMO, band gaps and Fermi level estimate with carmm.analyse.band_edges.get_band_edges.
+        The eigenvalues and occupations are the same for all atoms, so only those of the first atom are used.
+        The result is kept, so later calls (e.g. from get_homo and get_plot_data) do not recompute it.
+
+        Returns:
+            Dictionary of band edges, see get_band_edges
+        '''
+        from carmm.analyse.band_edges import get_band_edges
+
+        if self.band_edges is None:
+            self.band_edges = get_band_edges(self.energies[0], self.occupancies[0])
+
+        return self.band_edges
 
     def get_homo(self):
         '''
         Description
+        Returns the highest occupied eigenvalue, i.e. the last state before the first with an occupation
+        below 0.5, over all spin channels and k-points.
+        Note: This doesn't deal well with delocalised charge over degenerate states.
         '''
         if self.homo is None:
-            # Arbitrarily set the HOMO to the first state we can sample
-            self.homo = self.atoms[0].spin[0].kpts[0].energies[0]
-            # Iterate through all atoms, spins and k-points to get the true HOMO
-            for atom in range(self.get_natoms()):
-                for sp in range(self.get_nspin()):
-                    for kpt in range(self.get_nkpts()):
-                        # Get first value for this k-point where the occupancies are below 0.5
-                        # We then subtract one from this to get the last "occupied" state
-                        # Note: This doesn't deal well with delocalised charge over degenerate states.
-                        # TODO: Configure so it'll test subsequent states for degeneracy and split occupancy
-                        res = next(x for x, val in enumerate(self.atoms[atom].spin[sp].kpts[kpt].occupancies)
-                                if val < 0.5) - 1
-                        if self.atoms[atom].spin[sp].kpts[kpt].energies[res] > self.homo:
-                            self.homo = self.atoms[atom].spin[sp].kpts[kpt].energies[res]
+            self.homo = self.get_band_edges()['homo']
 
         # Even though we calculate the HOMO, for periodic systems the x-axis is shifted so
         # the HOMO is zero. Therefore return zero to match the x-axis returned.
@@ -419,7 +686,7 @@ class MullikenData:
         Description
         Obtains the arrays of data (x --> energy and y --> density) for plotting the density of states (dos).
         Can obtain data for total and individual contribution from the 's', 'p', 'd', and 'f' orbitals using the
-        'angular' keyword.
+        'angular' keyword. See get_batch_plot_data for the method used.
 
         Parameters:
 
@@ -441,47 +708,104 @@ class MullikenData:
             Variance for the Gaussian when added to each eigenfunction
 
         Returns:
-            1D array of x (energy) and 2D array of y (density). The density data is 2D to account for both spin-up and
-            spin-down channels
+            1D array of x (energy) and 2D array of y (density), with one row for each of the requested spin channels
+        '''
+
+        x, data = self.get_batch_plot_data([(atom_ind, angular)], spin, kpts, xmin=xmin, xmax=xmax,
+                                           npoints=npoints, variance=variance)
+
+        return x, data[0]
+
+    def get_batch_plot_data(self, selections, spin=None, kpts=None, xmin=-20, xmax=+20, npoints=1000,
+                            variance=0.02):
+        '''
+        Description
+        Obtains the density of states for several selections of atoms and angular momenta at once, e.g. the
+        projections on every element and orbital of a model.
+        The weighted projections of all eigenvalues are distributed onto a grid, sharing each between the two
+        nearest grid points, and the Gaussian broadening is then applied to all selections and spins as one
+        FFT convolution, instead of evaluating a Gaussian over the grid for each eigenvalue. The grid used is finer
+        than the x-axis where needed so that its spacing is at most a twentieth of the Gaussian width.
+
+        Parameters:
+
+        selections: List of (List of Integers, String) tuples
+            Indices of the atoms and angular momenta (as in get_plot_data) of each density of states required
+        spin: List of Integers
+            Indices of spins that are to be included, all spins by default
+        kpts: List of Integers
+            Indices of kpts to be included, all k-points by default
+        xmin: Float
+            Minimum on the x-axis for the energy range
+        xmax: Float
+            Maximum on the x-axis for the energy range
+        npoints: Integer
+            Number of points on the x-axis
+        variance: Float
+            Variance for the Gaussian when added to each eigenfunction
+
+        Returns:
+            1D array of x (energy) and 3D array of y (density) indexed as [selection, spin, point], with one
+            row for each of the requested spin channels
         '''
 
         import numpy as np
-        from scipy.stats import norm
+        from scipy.signal import fftconvolve
 
         # Dictionary to simplify pulling out the angular decomposition
         angular_momenta = {'s': 0, 'p': 1, 'd': 2, 'f': 3, 'g': 4}
 
+        if spin is None:
+            spin = range(self.get_nspin())
+        if kpts is None:
+            kpts = range(self.get_nkpts())
+        spin = np.asarray(spin, dtype=int)
+        kpts = np.asarray(kpts, dtype=int)
+
         # Make sure xmin and xmax are sane
         if xmin > xmax:
-            temp = xmax
-            xmax = xmin
-            xmin = temp
-        # Plotting variables
-        data = [ [ 0.0 ] * npoints ] * (len(spin))
+            xmin, xmax = xmax, xmin
         x = np.linspace(xmin, xmax, npoints)
         sigma = np.sqrt(variance)
+        # Subdivide the intervals of the x-axis for the broadening
+        subdivisions = max(1, int(np.ceil(20 * (xmax - xmin) / (npoints - 1) / sigma)))
+        nfine = (npoints - 1) * subdivisions + 1
+        spacing = (xmax - xmin) / (nfine - 1)
 
         # Check whether we have the HOMO; if not, calculate.
         if self.homo is None:
-            homo = self.get_homo()
-
-        # Collect information in data object. Note two sets of results, for spin up and down.
-        for atom in atom_ind:
-            for sp in spin:
-                for kpt in kpts:
-                    for e in range(self.get_nstates()):
-                        energy = self.atoms[atom].spin[sp].kpts[kpt].energies[e]
-
-                        if energy > xmin and energy < xmax:
-                            if angular == 'all':
-                                data[sp] += self.atoms[atom].spin[sp].kpts[kpt].all_mulliken[e] * \
-                                            self.atoms[atom].spin[sp].kpts[kpt].weight * \
-                                            norm.pdf(x, energy, sigma)
-                            else:
-                                for n in angular:
-                                    data[sp] += self.atoms[atom].spin[sp].kpts[kpt].orbitals[angular_momenta[n]][e] * \
-                                                self.atoms[atom].spin[sp].kpts[kpt].weight * \
-                                                norm.pdf(x, energy, sigma)
+            self.get_homo()
+
+        # Data of the requested spins and k-points, indexed as [atom, spin, kpt, state]
+        energies = self.energies[:, spin][:, :, kpts]
+        weights = self.weights[:, spin][:, :, kpts, None]
+        in_range = (energies > xmin) & (energies < xmax)
+
+        # Nearest grid points of each eigenvalue and the share of its weight on the upper one
+        position = (np.where(in_range, energies, xmin) - xmin) / spacing
+        lower = np.minimum(np.floor(position).astype(int), nfine - 2)
+        upper_share = position - lower
+        spin_offset = np.arange(len(spin))[None, :, None, None] * nfine
+
+        data = np.zeros((len(selections), len(spin) * nfine))
+        for n, (atom_ind, angular) in enumerate(selections):
+            atom_ind = np.asarray(atom_ind, dtype=int)
+            if angular == 'all':
+                projection = self.all_mulliken[atom_ind][:, spin][:, :, kpts]
+            else:
+                orbitals = self.orbitals[atom_ind][:, spin][:, :, kpts]
+                projection = sum(orbitals[:, :, :, angular_momenta[letter]] for letter in angular)
+            projection = projection * weights[atom_ind] * in_range[atom_ind]
+
+            index = (lower[atom_ind] + spin_offset).ravel()
+            data[n] = np.bincount(index, (projection * (1 - upper_share[atom_ind])).ravel(), minlength=data.shape[1])
+            data[n] += np.bincount(index + 1, (projection * upper_share[atom_ind]).ravel(), minlength=data.shape[1])
+
+        # Broaden with a Gaussian kernel extending to 6 standard deviations or the width of the grid
+        width = min(int(np.ceil(6 * sigma / spacing)), nfine)
+        kernel = np.exp(-0.5 * (np.arange(-width, width + 1) * spacing / sigma) ** 2) / (sigma * np.sqrt(2 * np.pi))
+        data = data.reshape(len(selections), len(spin), nfine)
+        data = fftconvolve(data, kernel[None, None, :], mode='same', axes=-1)[:, :, ::subdivisions]
 
         if self.get_nkpts() > 1:
             return x-self.homo, data
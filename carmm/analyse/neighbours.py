@@ -1,7 +1,6 @@
-def neighbour_cutout_sphere(atoms, centre, distance_cutoff=5.0):
+def neighbour_cutout_sphere(atoms, centre, distance_cutoff=5.0, periodic=False):
     '''
     Returns a spherical cutout of a structure
-    TODO: This doesn't work with periodic boundary conditions.
     TODO:Could probably integrate this with the neighbor function bellow
 
     Parameters:
@@ -12,29 +11,82 @@ def neighbour_cutout_sphere(atoms, centre, distance_cutoff=5.0):
         Index of central atom in cutout
     distance_cutoff: Float
         Distance which inside atoms are counted as neighbours
+    periodic: Boolean
+        Whether atoms inside the sphere through periodic images are included, see get_cutout_sphere_indices
+
+    Returns:
+        List of indices of the atoms inside the sphere
     '''
 
     import numpy as np
 
-    # Prevents unexpected editing of parent object in place
-    # Now ensures returned object is different to incoming atoms
-    atoms = atoms.copy()
-    selection = []
-
-    for i in range(len(atoms)):
+    indices = get_cutout_sphere_indices(atoms, [centre], distance_cutoff, periodic=periodic)[0]
 
-        # get distances between atom of interest and others
+    return np.unique(indices).tolist()
 
+def get_cutout_sphere_indices(atoms, centres, radii=5.0, periodic=False, return_positions=False, inclusive=False):
+    '''
+    Returns the atoms inside spheres around many centres at once. A KD-tree of the atoms, and of
+    their periodic images within the largest radius, is built once and queried for all centres.
+    Atoms count as inside if they are strictly closer than the radius to the centre, or also at exactly
+    the radius if inclusive.
 
-        #################### Edit atom tag ###############################
-        distance_ab = np.linalg.norm((atoms.positions[centre] - atoms.positions[i]))
-
-        ################ Edit distance in Angstrom here ###################
-        if distance_ab < distance_cutoff:
-            selection.append(i)
+    Parameters:
 
+    atoms: Atoms object
+        Input structure to cutout from
+    centres: List of integers or array of floats (n, 3)
+        Indices of the central atoms, or Cartesian positions of the centres
+    radii: Float or list of floats
+        Radius of the sphere, either shared or one for each centre
+    periodic: Boolean
+        Whether periodic images are included for the periodic directions of atoms. An atom can
+        then appear more than once for a centre if the sphere is larger than the cell.
+    return_positions: Boolean
+        Whether to also return the positions of the (image) atoms inside each sphere
+    inclusive: Boolean
+        Whether atoms at exactly the radius are inside, as in cutout_sphere
 
-    return selection
+    Returns:
+        List with a numpy array of atom indices for each centre, sorted by index,
+        and if return_positions a list of numpy arrays (n, 3) of the corresponding positions
+    '''
+    import numpy as np
+    from scipy.spatial import cKDTree
+    from carmm.analyse.connectivity import get_periodic_images
+
+    centres = np.asarray(centres)
+    if centres.ndim == 2:
+        points = centres.astype(float)
+    else:
+        points = atoms.positions[np.atleast_1d(centres)]
+    radii = np.broadcast_to(np.asarray(radii, dtype=float), (len(points),))
+
+    if periodic and atoms.pbc.any():
+        image_positions, image_atoms = get_periodic_images(atoms, radii.max())
+        # Centres are brought into the cell, which the images surround
+        cell_shift = np.where(atoms.pbc, np.floor(atoms.cell.scaled_positions(points)), 0)
+        offsets = cell_shift @ atoms.cell.complete()
+    else:
+        image_positions, image_atoms = atoms.get_positions(), np.arange(len(atoms))
+        offsets = np.zeros_like(points)
+
+    tree = cKDTree(image_positions)
+    # The KD-tree includes points at exactly the radius, the next smaller float excludes them
+    found = tree.query_ball_point(points - offsets, r=radii if inclusive else np.nextafter(radii, 0))
+
+    indices = []
+    positions = []
+    for k in range(len(points)):
+        images = np.sort(np.array(found[k], dtype=int))
+        images = images[np.argsort(image_atoms[images], kind='stable')]
+        indices.append(image_atoms[images])
+        positions.append(image_positions[images] + offsets[k])
+
+    if return_positions:
+        return indices, positions
+
+    return indices
 
 # Authors: Owain Beynon, Igor Kowalec
 def neighbours(atoms, centre, shell, cutoff=None, verbose=False):
@@ -59,7 +111,8 @@ def neighbours(atoms, centre, shell, cutoff=None, verbose=False):
         List of lists containing indices of atoms that make 0th, 1st (...) shell
     '''
 
-    from ase.neighborlist import natural_cutoffs, NeighborList
+    import numpy as np
+    from ase.neighborlist import natural_cutoffs
 
     if not cutoff:
         # Choose a cutoff to determine max bond distance, otherwise use natural cutoff
@@ -67,33 +120,74 @@ def neighbours(atoms, centre, shell, cutoff=None, verbose=False):
         if verbose:
             print("Default bond cutoffs selected:", set([(atoms[i].symbol, cutoff[i]) for i in range(len(atoms))]))
 
-    # Set object storing all neighbour information
-    all_neighbours = set(centre)
+    # Breadth-first search over the shared connectivity
+    shell_index = get_neighbour_shells(atoms, centre, shell, cutoff=cutoff)
+
     # List of lists storing each neighbour shell requested
     shell_list = [centre]
+    for n in range(1, shell + 1):
+        shell_list += [np.flatnonzero(shell_index == n).tolist()]
 
-    # Creates an empty list an appends atom indices whose distances are
-    # x amount nearest neighbours away from centre
-    for neighbors in range(shell):
-        # keep new neighbor indices in a set to avoid duplicates
-        new_neighbors = set()
-        for index in all_neighbours:
-            # find neighbors based on cutoff and connectivity matrix
-            nl = NeighborList(cutoff, self_interaction=False, bothways=True)
-            nl.update(atoms)
-            indices = nl.get_neighbors(index)[0]
-            for i in indices:
-                new_neighbors.add(i)
-
-        shell_list += [[i for i in new_neighbors if i not in all_neighbours]]
-        for i in new_neighbors:
-            all_neighbours.add(i)
+    # All atoms within the requested shells, keeping the centres as supplied
+    all_neighbours = sorted(set(centre).union(*shell_list[1:]))
 
-        if verbose:
-            for shell in range(len(shell_list)):
-                print("Shell", shell, "contains atoms with indices:", shell_list[shell])
+    if verbose:
+        for n in range(len(shell_list)):
+            print("Shell", n, "contains atoms with indices:", shell_list[n])
+
+    return all_neighbours, shell_list
+
+def get_neighbour_shells(atoms, centres, shell, cutoff=None, separate=False):
+    '''
+    Returns the neighbour shell of every atom with respect to the centre atom(s), i.e. the number of bonds
+    on the shortest path to a centre. The shells are found by a breadth-first search over the shared
+    sparse connectivity, one sparse matrix product per shell, for all centres at once.
+
+    Parameters:
+    atoms : Atoms object
+        Input structure to count neighbours
+    centres : Integer or list of integers
+        Indices of atom(s) to start counting from
+    shell : Integer
+        Number of neighbour shells to search
+    cutoff: list of floats or None
+        Bond length cutoff distance in Angstrom can be set for each atom individually
+        The list must contain exactly len(atoms) floats. If None, natural_cutoffs
+        are used by default.
+    separate: boolean
+        If True, shells are counted from each centre separately rather than from the nearest centre
+
+    Returns:
+        numpy array of integers (len(atoms)), or (len(centres), len(atoms)) if separate,
+        containing the shell of each atom (0 for the centres) or -1 if outside the requested shells
+    '''
+    import numpy as np
+    from carmm.analyse.connectivity import get_connectivity
+
+    adjacency = get_connectivity(atoms, cutoffs=cutoff).adjacency
+
+    centres = np.atleast_1d(centres).astype(int) % len(atoms)
+    if len(centres) == 0:
+        # No centres, so no atom lies in any shell
+        return np.full((0, len(atoms)) if separate else len(atoms), -1, dtype=int)
+
+    columns = np.arange(len(centres)) if separate else np.zeros(len(centres), dtype=int)
+
+    shell_index = np.full((len(atoms), columns.max() + 1), -1, dtype=int)
+    shell_index[centres, columns] = 0
 
-    return list(all_neighbours), shell_list
+    frontier = shell_index == 0
+    for n in range(1, shell + 1):
+        reached = (adjacency @ frontier.astype(np.int32)) > 0
+        frontier = reached & (shell_index < 0)
+        if not frontier.any():
+            break
+        shell_index[frontier] = n
+
+    if separate:
+        return shell_index.T
+
+    return shell_index[:, 0]
 
 
 # Authors: Igor Kowalec, Lara Kabalan, Jack Warren
@@ -127,12 +221,8 @@ def surface_coordination(atoms, cutoff=None, verbose=True):
     Returns:
         dict_CN, dict_surf_CN
             TODO: proper description of dictionary structure, writing csv files'''
-    from ase.neighborlist import natural_cutoffs, NeighborList
-    import numpy as np
-    from collections import Counter
-    from itertools import product
+    from ase.neighborlist import natural_cutoffs
 
-    dict_CN = {}
     if not cutoff:
         # Choose a cutoff to determine max bond distance
         cutoff = natural_cutoffs(atoms)
@@ -142,50 +232,32 @@ def surface_coordination(atoms, cutoff=None, verbose=True):
     # Create a symbols set based on all species present in the atoms
     symbols_set = sorted(list(set(atoms.symbols)))
 
-    for l in set(atoms.get_tags()):
-        index= [i.index for i in atoms if i.tag == l]
-        for i in index:
-            nl = NeighborList(cutoff, self_interaction=False, bothways=True)
-            nl.update(atoms)
-            indices, offsets = nl.get_neighbors(i)
-            # avoid duplicate atomic indices
-            indices_no_self = np.array(list(set([j for j in indices])))
-
-            cn_numbers = Counter(atoms[indices_no_self].symbols)
-
-            # create a dictionary of relevant values for cn calculations
-            dict_CN[i] = {"symbol":atoms[i].symbol, 'index':i, "layer":l}
-            for k in symbols_set:
-                dict_CN[i].update({k+"_neighbors":cn_numbers[k]})
-
-    # check all combinations of atomic symbols
-    pr = product(symbols_set, repeat=2)
-
-    dict_surf_CN= {}
-    for layer in set(atoms.get_tags()):
-        dict_surf_CN[layer] = {}
-        dict_surf_CN[layer].update({"layer":layer})
-
-        # extract data for all combinations of neighbors and put at the end of the dictionary
-        for p in product(symbols_set, repeat=2):
-            M_M_cn = [dict_CN[x][p[0] + "_neighbors"] for x in dict_CN if\
-                 dict_CN[x]["layer"] == layer and dict_CN[x]['symbol'] == p[1]]
-            if not M_M_cn == []:
-                M_M_avg_cn = np.average(M_M_cn)
-            else:
-                M_M_avg_cn = "0" # as the concentration of one of the metals is zero in the layer
-
-            dict_surf_CN[layer].update({p[0] + "_neighboring_w_" + p[1]: M_M_avg_cn})
+    # All reductions are done on arrays, the dictionaries below are only a view of the tables
+    cn_table, layer_table = get_coordination_table(atoms, cutoff=cutoff)
 
-        # Check concentrations of atoms per layer
-        for symbol in symbols_set:
-            atoms_per_layer = len([x for x in dict_CN if dict_CN[x]["layer"] == layer])
-            if atoms_per_layer > 0:
-                symbol_count_per_layer = len([symbol for x in dict_CN if dict_CN[x]["layer"] == layer and dict_CN[x]['symbol'] == symbol])
-                symbol_concentration_per_layer = symbol_count_per_layer / atoms_per_layer
+    dict_CN = {}
+    for row in cn_table:
+        i = int(row['index'])
+        dict_CN[i] = {"symbol": str(row['symbol']), 'index': i, "layer": row['layer']}
+        for k in symbols_set:
+            dict_CN[i].update({k+"_neighbors": int(row[k+"_neighbors"])})
+
+    dict_surf_CN = {}
+    for row in layer_table:
+        layer = row['layer']
+        dict_surf_CN[layer] = {"layer": layer}
+
+        # Combinations of neighbors, "0" if one of the metals is absent from the layer
+        for name in layer_table.dtype.names[1:]:
+            if name.endswith("_concentration_per_layer"):
+                dict_surf_CN[layer].update({name: float(row[name])})
             else:
-                symbol_concentration_per_layer = 0
-            dict_surf_CN[layer].update({symbol+"_concentration_per_layer":symbol_concentration_per_layer})
+                # symbol of the centre atom is the second one in the key
+                centre = name.split("_neighboring_w_")[1]
+                if row[centre+"_concentration_per_layer"] > 0:
+                    dict_surf_CN[layer].update({name: row[name]})
+                else:
+                    dict_surf_CN[layer].update({name: "0"})
 
     # Preparation for verbose
     cn_layer_list_dict = [dict_surf_CN[i] for i in range(len(dict_surf_CN))]
@@ -199,3 +271,98 @@ def surface_coordination(atoms, cutoff=None, verbose=True):
 
 
     return dict_CN, dict_surf_CN
+
+
+def get_coordination_table(atoms, cutoff=None):
+    '''
+    Array based version of surface_coordination, suitable for large slabs. The coordination of all atoms
+    is obtained from one sparse adjacency matrix and reduced per element and per layer with numpy,
+    avoiding loops over atoms.
+
+    Parameters:
+        atoms: Atoms object
+            Surface slab containing tagged atomic layers
+            e.g. using carmm.build.neb.symmetry.sort_z
+        cutoff: list of floats or None
+             Bond length cutoff distance in Angstrom for each atom. If None, natural_cutoffs
+             are used by default.
+
+    Returns:
+        cn_table: numpy structured array (natoms)
+            Fields 'index', 'symbol', 'layer' and '<X>_neighbors' with the number of neighbours of element X
+        layer_table: numpy structured array (nlayers)
+            Fields 'layer', '<A>_neighboring_w_<B>' with the average number of A neighbours of the
+            B atoms in the layer (0 if there are no B atoms in the layer) and '<X>_concentration_per_layer',
+            with the fields in the same order as in surface_coordination
+    '''
+    import numpy as np
+    from itertools import product
+    from carmm.analyse.connectivity import get_connectivity
+
+    natoms = len(atoms)
+    symbols_set = sorted(list(set(atoms.symbols)))
+    nsymbols = len(symbols_set)
+
+    symbols = np.array(atoms.get_chemical_symbols())
+    symbol_index = np.searchsorted(symbols_set, symbols)
+    layers, layer_index = np.unique(atoms.get_tags(), return_inverse=True)
+    layer_index = layer_index.ravel()
+    nlayers = len(layers)
+
+    # Each bond is stored in both rows of the adjacency, count neighbours of atom i by element of j
+    pairs = get_connectivity(atoms, cutoffs=cutoff).get_pairs(bothways=True)[0]
+    cn = np.bincount(pairs[:, 0] * nsymbols + symbol_index[pairs[:, 1]],
+                     minlength=natoms * nsymbols).reshape(natoms, nsymbols)
+
+    # Number of atoms of each element per layer, and sums of their coordination numbers
+    counts = np.bincount(layer_index * nsymbols + symbol_index,
+                         minlength=nlayers * nsymbols).reshape(nlayers, nsymbols)
+    cn_sums = np.zeros((nlayers, nsymbols, nsymbols))
+    np.add.at(cn_sums, (layer_index, symbol_index), cn)
+    # Average number of neighbours of element A (last axis) around atoms of element B (middle axis)
+    cn_averages = np.divide(cn_sums, counts[:, :, None], out=np.zeros_like(cn_sums), where=counts[:, :, None] > 0)
+    concentrations = counts / np.maximum(counts.sum(axis=1), 1)[:, None]
+
+    order = np.lexsort((np.arange(natoms), layer_index))
+    cn_table = np.zeros(natoms, dtype=[('index', int), ('symbol', 'U3'), ('layer', int)]
+                        + [(k + "_neighbors", int) for k in symbols_set])
+    cn_table['index'] = order
+    cn_table['symbol'] = symbols[order]
+    cn_table['layer'] = layers[layer_index[order]]
+    for a, k in enumerate(symbols_set):
+        cn_table[k + "_neighbors"] = cn[order, a]
+
+    pair_names = [a + "_neighboring_w_" + b for a, b in product(symbols_set, repeat=2)]
+    layer_table = np.zeros(nlayers, dtype=[('layer', int)] + [(name, float) for name in pair_names]
+                           + [(k + "_concentration_per_layer", float) for k in symbols_set])
+    layer_table['layer'] = layers
+    for name, (a, b) in zip(pair_names, product(range(nsymbols), repeat=2)):
+        layer_table[name] = cn_averages[:, b, a]
+    for a, k in enumerate(symbols_set):
+        layer_table[k + "_concentration_per_layer"] = concentrations[:, a]
+
+    return cn_table, layer_table
+
+
+def get_coordination_table_trajectory(trajectory, cutoff=None):
+    '''
+    Per layer coordination data of get_coordination_table for every frame of a trajectory.
+    The tags and composition of the frames are expected to stay the same.
+
+    Parameters:
+        trajectory: list of Atoms objects, ase Trajectory or string
+            Frames to analyse, or the filename of a trajectory
+        cutoff: list of floats or None
+             Bond length cutoff distance in Angstrom for each atom. If None, natural_cutoffs
+             are used by default.
+
+    Returns:
+        numpy structured array (nframes, nlayers) with the fields of the layer_table of get_coordination_table
+    '''
+    import numpy as np
+    from ase.io import iread
+
+    if isinstance(trajectory, str):
+        trajectory = iread(trajectory)
+
+    return np.stack([get_coordination_table(atoms, cutoff=cutoff)[1] for atoms in trajectory])
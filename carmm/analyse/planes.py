@@ -32,21 +32,66 @@ def get_close_contacts(A_mol, B_mol):
 
     Still very much a work in progress so go easy on it
     '''
-    import numpy as np
+    from scipy.spatial import cKDTree
 
-    # Loops measuring the shortest distance from every atom in A to B
-    measured = []
-    for a in A_mol:
-        bond_list_atom = []
-        for b in B_mol:
-            pos_diff = np.linalg.norm(a.position - b.position)
-            bond_list_atom += [pos_diff]
-        measured += [bond_list_atom]
-    close_contacts = [np.amin(i) for i in measured]
+    # Shortest distance from every atom in A to B
+    close_contacts = cKDTree(B_mol.get_positions()).query(A_mol.get_positions(), k=1)[0]
 
     # TODO: Document the return - this is a list of shortest distances from each atom in A
 
-    return close_contacts
+    return close_contacts.tolist()
+
+
+def get_group_close_contacts(atoms, group_a, group_b, cutoff=None, mic=True):
+    '''
+    Close contacts between two groups of atoms of the same structure, e.g. two molecules or layers of a framework,
+    found with a KD-tree rather than all A x B distances.
+
+    Parameters:
+    atoms: Atoms object
+        Structure containing both groups
+    group_a: List of integers
+        Indices of the atoms measured from
+    group_b: List of integers
+        Indices of the atoms measured to
+    cutoff: Float or None
+        If None, the closest atom of group_b is returned for every atom of group_a.
+        Otherwise all contacts shorter than cutoff (in Angstrom) are returned.
+    mic: Boolean
+        Whether distances follow the minimum image convention along the periodic directions
+
+    Returns:
+        If cutoff is None: numpy array (len(group_a)) with the index of the closest atom of group_b
+            for each atom of group_a, and numpy array (len(group_a)) of the corresponding distances
+        Otherwise: numpy array (ncontacts, 2) of (group_a, group_b) atom indices sorted by the group_a atom,
+            and numpy array (ncontacts) of distances
+    '''
+    import numpy as np
+    from scipy.spatial import cKDTree
+    from carmm.analyse.connectivity import get_periodic_images, match_nearest
+
+    group_a = np.asarray(group_a, dtype=int)
+    group_b = np.asarray(group_b, dtype=int)
+    pbc = atoms.pbc if mic else np.zeros(3, dtype=bool)
+    positions = atoms.get_positions(wrap=pbc.any())
+
+    if cutoff is None:
+        nearest, vectors = match_nearest(positions[group_a], positions[group_b], atoms.cell, pbc)
+        return group_b[nearest], np.linalg.norm(vectors, axis=1)
+
+    subset = atoms[group_b]
+    subset.pbc = pbc
+    image_positions, image_atoms = get_periodic_images(subset, cutoff)
+    contacts = cKDTree(positions[group_a]).sparse_distance_matrix(cKDTree(image_positions), cutoff,
+                                                                 output_type='ndarray')
+    i, j, d = contacts['i'], image_atoms[contacts['j']], contacts['v']
+
+    # Keep the shortest periodic image of every contact
+    keys = i.astype(np.int64) * len(group_b) + j
+    order = np.lexsort((d, keys))
+    shortest = order[np.unique(keys[order], return_index=True)[1]]
+
+    return np.column_stack((group_a[i[shortest]], group_b[j[shortest]])), d[shortest]
 
 
 def distance_between_centers_of_mass(A_mol, B_mol):
@@ -147,16 +192,10 @@ def plane_of_best_fit(model):
     ax.scatter(xs, ys, zs, color='blue')
 
     # do fit
-    tmp_A = []
-    tmp_b = []
-    for i in range(len(xs)):
-        tmp_A.append([xs[i], ys[i], 1])
-        tmp_b.append(zs[i])
-    b = np.matrix(tmp_b).T
-    A = np.matrix(tmp_A)
-    # Manual solution
-    fit = (A.T * A).I * A.T * b
-    errors = b - A * fit
+    A = np.column_stack((xs, ys, np.ones(len(xs))))
+    b = zs[:, None]
+    fit = np.linalg.lstsq(A, b, rcond=None)[0].ravel()
+    errors = b - A @ fit[:, None]
 
     print("solution: %f x + %f y + %f = z" % (fit[0], fit[1], fit[2]))
     print("errors: \n", errors)
@@ -166,10 +205,7 @@ def plane_of_best_fit(model):
     ylim = ax.get_ylim()
     X,Y = np.meshgrid(np.arange(xlim[0], xlim[1]),
                     np.arange(ylim[0], ylim[1]))
-    Z = np.zeros(X.shape)
-    for r in range(X.shape[0]):
-        for c in range(X.shape[1]):
-            Z[r,c] = fit[0] * X[r,c] + fit[1] * Y[r,c] + fit[2]
+    Z = fit[0] * X + fit[1] * Y + fit[2]
 
     ax.plot_wireframe(X,Y,Z, color='k')
     ax.set_xlabel('x')
@@ -177,3 +213,117 @@ def plane_of_best_fit(model):
     ax.set_zlabel('z')
 
     return plt, print("solution: %f x + %f y + %f = z" % (fit[0], fit[1], fit[2])), print("errors: \n", errors)
+
+
+def fit_planes(atoms, groups, mic=True):
+    '''
+    Fits a plane to each group of atoms, e.g. every aromatic ring or molecule of a layered framework, at once.
+    The plane of each group passes through its centroid, with the normal given by the direction of smallest
+    variance of the positions (equivalent to a total least squares / SVD fit).
+
+    Parameters:
+    atoms: Atoms object
+        Structure containing the groups
+    groups: List of lists of integers
+        Indices of the atoms in each group, groups can have different sizes (at least 3 atoms)
+    mic: Boolean
+        Whether groups broken across periodic boundaries are made whole before fitting
+
+    Returns:
+        centroids: numpy array (ngroups, 3)
+        normals: numpy array (ngroups, 3) of unit normals, oriented with a positive z component where possible
+        rms: numpy array (ngroups) of the root mean square distance of the atoms from their plane
+    '''
+    import numpy as np
+
+    indices, group_index, relative = _get_group_positions(atoms, groups, mic)
+    ngroups = len(groups)
+    sizes = np.bincount(group_index, minlength=ngroups)
+
+    centres = np.zeros((ngroups, 3))
+    np.add.at(centres, group_index, relative)
+    centres /= sizes[:, None]
+    deviations = relative - centres[group_index]
+
+    # Covariance of each group, whose eigenvector of lowest eigenvalue is the plane normal
+    covariance = np.zeros((ngroups, 3, 3))
+    np.add.at(covariance, group_index, deviations[:, :, None] * deviations[:, None, :])
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    normals = eigenvectors[:, :, 0]
+    normals *= np.where(normals[:, 2] < 0, -1, 1)[:, None]
+    rms = np.sqrt(np.maximum(eigenvalues[:, 0], 0) / sizes)
+
+    first = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    centroids = atoms.get_positions()[indices[first]] + centres
+
+    return centroids, normals, rms
+
+
+def track_plane_stacking(trajectory, groups, pairs=None, mic=True):
+    '''
+    Time series of the interplane distance and tilt angle between pairs of atom groups along a trajectory,
+    e.g. to follow the stacking of layers or aromatic rings in an MD run. Frames are processed one at a time.
+
+    Parameters:
+    trajectory: String, Trajectory or List of Atoms objects
+        Filename of an ASE trajectory, or any sequence of Atoms objects with the same atom ordering
+    groups: List of lists of integers
+        Indices of the atoms in each group, see fit_planes
+    pairs: List of tuples of integers or None
+        Pairs of groups (positions in groups) to compare. If None, all pairs of groups are used.
+    mic: Boolean
+        Whether the minimum image convention is used for groups and the separation between them
+
+    Returns:
+        distances: numpy array (n_frames, n_pairs)
+            Distance between the centroid of the second group and the plane of the first group
+        tilts: numpy array (n_frames, n_pairs)
+            Angle between the planes of the two groups in degrees, between 0 and 90
+    '''
+    import numpy as np
+    from itertools import combinations
+    from ase.geometry import find_mic
+
+    if isinstance(trajectory, str):
+        from ase.io.trajectory import Trajectory
+        with Trajectory(trajectory) as traj:
+            return track_plane_stacking(traj, groups, pairs=pairs, mic=mic)
+
+    if pairs is None:
+        pairs = list(combinations(range(len(groups)), 2))
+    pairs = np.array(pairs, dtype=int).reshape(-1, 2)
+
+    distances = np.empty((len(trajectory), len(pairs)))
+    tilts = np.empty((len(trajectory), len(pairs)))
+
+    for frame, atoms in enumerate(trajectory):
+        centroids, normals, rms = fit_planes(atoms, groups, mic=mic)
+        separation = centroids[pairs[:, 1]] - centroids[pairs[:, 0]]
+        if mic and atoms.pbc.any():
+            separation = find_mic(separation, atoms.cell, atoms.pbc)[0]
+        distances[frame] = np.abs(np.einsum('ij,ij->i', separation, normals[pairs[:, 0]]))
+        cosines = np.abs(np.einsum('ij,ij->i', normals[pairs[:, 0]], normals[pairs[:, 1]]))
+        tilts[frame] = np.degrees(np.arccos(np.clip(cosines, 0, 1)))
+
+    return distances, tilts
+
+
+def _get_group_positions(atoms, groups, mic):
+    '''
+    Flattens the groups and returns the atom indices, the group of each atom and the position of each atom
+    relative to the first atom of its group, following the minimum image convention if mic is True
+    '''
+    import numpy as np
+    from ase.geometry import find_mic
+
+    indices = np.concatenate([np.asarray(group, dtype=int) for group in groups])
+    sizes = np.array([len(group) for group in groups])
+    group_index = np.repeat(np.arange(len(groups)), sizes)
+    first = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+    positions = atoms.get_positions()
+    relative = positions[indices] - positions[indices[first]][group_index]
+    if mic and atoms.pbc.any():
+        relative = find_mic(relative, atoms.cell, atoms.pbc)[0]
+
+    return indices, group_index, relative
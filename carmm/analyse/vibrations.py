@@ -1,32 +1,75 @@
 import matplotlib.pyplot as plt
 from ase.io.trajectory import Trajectory
-from ase import Atoms
-from ase.io import read
 
 
 def vib_analysis(model):
     '''
     Returns a list displacement of bonds/atoms in a trajectory.
+    Only the distance between the first two atoms is returned, see get_pair_vibrations for all pairs.
 
     Parameters:
         model: Trajectory File
 
-    TODO: - Resolve for periodic systems - functionally currently doesn't work
+    '''
+
+    pairs, distances, amplitudes = get_pair_vibrations(model, pairs=[(0, 1)], rank=False)
+    dist_list = distances[:, 0].tolist()
+
+    return dist_list
+
 
+def get_pair_vibrations(model, pairs="bonded", mic=True, rank=True, mult=1):
+    '''
+    Distances between pairs of atoms in every frame of a vibrational mode trajectory (or any trajectory),
+    evaluated for all pairs and frames at once from a (frames x atoms x 3) array of positions.
+
+    Parameters:
+        model: String, Trajectory or List of Atoms objects
+            Trajectory of a vibration e.g. vib.1.traj written by ase Vibrations.write_mode
+        pairs: "bonded", "all" or List of tuples of integers
+            Pairs of atom indices to analyse. "bonded" uses the bonds of the first frame (see
+            carmm.analyse.connectivity.get_connectivity), "all" every pair of atoms.
+        mic: Boolean
+            Whether distances follow the minimum image convention, for periodic systems
+        rank: Boolean
+            Whether pairs are sorted by decreasing amplitude, so the most displaced bonds come first
+        mult: Float
+            Multiplier for the natural cutoffs used to define bonds
 
+    Returns:
+        pairs: numpy array (n_pairs, 2) of atom indices
+        distances: numpy array (n_frames, n_pairs)
+        amplitudes: numpy array (n_pairs) of the difference between the largest and shortest distance of each pair
     '''
-    atot = Atoms.get_chemical_symbols(self=read(model))
+    import numpy as np
 
-    traj = Trajectory(model)
+    if isinstance(model, str):
+        with Trajectory(model) as traj:
+            return get_pair_vibrations(traj, pairs=pairs, mic=mic, rank=rank, mult=mult)
 
-    for i in range(len(atot) - 1):
-        for j in range(i + 1, len(atot)):
-            distances = []
-            for atoms in traj:
-                dist = atoms.get_distances(i, j, mic=True)
-                distances.append(float(dist))
-            dist_list = distances
-            return dist_list
+    first = model[0]
+    positions = np.array([atoms.positions for atoms in model])
+
+    if isinstance(pairs, str) and pairs == "bonded":
+        from carmm.analyse.connectivity import get_connectivity
+        pairs = get_connectivity(first, mult=mult).get_pairs()[0]
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    elif isinstance(pairs, str) and pairs == "all":
+        pairs = np.column_stack(np.triu_indices(len(first), k=1))
+    pairs = np.array(pairs, dtype=int).reshape(-1, 2)
+
+    vectors = positions[:, pairs[:, 1]] - positions[:, pairs[:, 0]]
+    if mic and first.pbc.any():
+        from ase.geometry import find_mic
+        vectors = find_mic(vectors.reshape(-1, 3), first.cell, first.pbc)[0].reshape(vectors.shape)
+    distances = np.linalg.norm(vectors, axis=2)
+    amplitudes = np.ptp(distances, axis=0)
+
+    if rank:
+        order = np.argsort(-amplitudes, kind='stable')
+        pairs, distances, amplitudes = pairs[order], distances[:, order], amplitudes[order]
+
+    return pairs, distances, amplitudes
 
 
 class plot_vibration_data:
@@ -35,19 +78,43 @@ class plot_vibration_data:
 
     Parameters:
         x_axis: length of data returned from vib_analysis()
-        y_axis: data returned by vib_analysis()
+        y_axis: data returned by vib_analysis(), or the distances array (n_frames, n_pairs) returned by
+            get_pair_vibrations to plot every pair at once
         title: title for plot
+        labels: list of strings or None
+            Legend entry for each pair, e.g. from plot_vibration_data.get_pair_labels
 
     TODO: would be nice to able to plot atomic/elemental information on plot i.e which atoms are being displaced
     '''
 
 
-    def __init__(self,x_axis, y_axis, title):
+    def __init__(self,x_axis, y_axis, title, labels=None):
         self.x_axis = x_axis
         self.y_axis = y_axis
         self.title = title
+        self.labels = labels
 
     def plot_vib(self):
-        plt.plot(self.x_axis, self.y_axis)
+        lines = plt.plot(self.x_axis, self.y_axis)
         plt.title(self.title)
+        if self.labels is not None:
+            # One label for each column of y_axis, set on each line as older matplotlib does not accept a list
+            for line, label in zip(lines, self.labels):
+                line.set_label(label)
+            plt.legend()
         plt.show()
+
+    @staticmethod
+    def get_pair_labels(atoms, pairs):
+        '''
+        Returns labels such as "O0-H1" for the pairs returned by get_pair_vibrations
+
+        Parameters:
+            atoms: Atoms object
+                Any frame of the trajectory
+            pairs: numpy array (n_pairs, 2)
+                Atom indices of each pair
+        '''
+        symbols = atoms.get_chemical_symbols()
+
+        return ["{}{}-{}{}".format(symbols[i], i, symbols[j], j) for i, j in pairs]
@@ -4,11 +4,9 @@ A collection of scripts that can generate and manipulate Chemshell fragment and
 from ASE Atoms objects and can use either a large, non-periodic structure to cut out a spherical cluster or can
 make a cluster from a periodic model.
 '''
-def cutout_sphere(atoms, centre, distance_cutoff=5.0):
+def cutout_sphere(atoms, centre, distance_cutoff=5.0, periodic=False):
     '''
     Returns a spherical cutout of a structure
-    TODO: This doesn't work with periodic boundary conditions.
-    It'd be nice to get that working and update the regression to test this.
 
     Parameters:
 
@@ -17,31 +15,65 @@ def cutout_sphere(atoms, centre, distance_cutoff=5.0):
     centre: Integer
         Index of central atom in cutout
     distance_cutoff: Float
-        Distance outside of which atoms are removed
+        Distance beyond which atoms are removed, atoms at exactly this distance are kept
+    periodic: Boolean
+        If True, atoms inside the sphere through periodic images are included at their image positions
+        and a non-periodic cluster is returned, see cutout_spheres
     '''
 
+    if periodic:
+        return cutout_spheres(atoms, [centre], distance_cutoff, periodic=True)[0]
+
     import numpy as np
+    from carmm.analyse.neighbours import get_cutout_sphere_indices
 
     # Prevents unexpected editing of parent object in place
     # Now ensures returned object is different to incoming atoms
     atoms = atoms.copy()
-    atoms_to_delete = []
-    for i in range(len(atoms)):
-
-        # get distances between atom of interest and others - then removes
-        # all atoms beyond a certain radius
 
-        #################### Edit atom tag ###############################
-        distance_ab = np.linalg.norm((atoms.positions[centre] - atoms.positions[i]))
-
-        ################ Edit distance in Angstrom here ###################
-        if distance_ab > distance_cutoff:
-            atoms_to_delete.append(i)
+    # Removes all atoms beyond a certain radius
+    inside = get_cutout_sphere_indices(atoms, [centre], distance_cutoff, periodic=False, inclusive=True)[0]
+    atoms_to_delete = np.setdiff1d(np.arange(len(atoms)), inside)
 
     del atoms[atoms_to_delete]
 
     return atoms
 
+def cutout_spheres(atoms, centres, distance_cutoff=5.0, periodic=False):
+    '''
+    Returns spherical cluster cutouts around many centres of a (periodic) structure, e.g. for QM/MM
+    cluster models. The spatial index of the structure is built once for all centres.
+    If periodic, atoms inside a sphere through a periodic image are placed at the image position, so an atom
+    can appear more than once if the sphere is larger than the cell.
+
+    Parameters:
+
+    atoms: Atoms object
+        Input structure to cutout from
+    centres: List of integers or array of floats (n, 3)
+        Indices of the central atoms, or Cartesian positions of the centres
+    distance_cutoff: Float or list of floats
+        Radius of the spheres, either shared or one for each centre. Atoms at exactly this distance are kept.
+    periodic: Boolean
+        Whether periodic images are included for the periodic directions of atoms
+
+    Returns:
+        List of non-periodic Atoms objects, one for each centre
+    '''
+    from carmm.analyse.neighbours import get_cutout_sphere_indices
+
+    indices, positions = get_cutout_sphere_indices(atoms, centres, distance_cutoff, periodic=periodic,
+                                                   return_positions=True, inclusive=True)
+
+    clusters = []
+    for inside, inside_positions in zip(indices, positions):
+        cluster = atoms[inside]
+        cluster.positions = inside_positions
+        cluster.pbc = False
+        clusters.append(cluster)
+
+    return clusters
+
 def transpose(periodic,cluster, start, stop, centre_periodic, centre_cluster, file_name):
     ''' Returns a ChemShell cluster representation of a periodic model 
 
@@ -130,13 +130,11 @@ class GeodesicInterpolator:
 
     def get_atoms_bonds(self, image, scale_cutoffs=1., constraint=True):
 
-        from ase.neighborlist import natural_cutoffs, NeighborList, NewPrimitiveNeighborList
+        from ase.neighborlist import natural_cutoffs
+        from carmm.analyse.connectivity import get_connectivity
 
         cutoffs = np.array(natural_cutoffs(image)) * scale_cutoffs
-        nl_init = NeighborList(cutoffs, self_interaction=False, bothways=False, primitive=NewPrimitiveNeighborList)
-        nl_init.update(image)
-
-        conn_mat = nl_init.get_connectivity_matrix()
+        conn_pairs = get_connectivity(image, cutoffs=cutoffs).get_pairs()[0].tolist()
 
         # filter for constraints
         if constraint:
@@ -148,11 +146,11 @@ class GeodesicInterpolator:
             only allowing non-constrained atom to vary position in least squares 
             geodesic interpolation.
             '''
-            bond_idx = [tuple(sorted(bond)) for bond in conn_mat.keys() if
+            bond_idx = [tuple(bond) for bond in conn_pairs if
                         2 > len(list(set(self.fixed).intersection(set(bond))))
                         and bond[0] != bond[1]]
         else:
-            bond_idx = [tuple(sorted(bond)) for bond in conn_mat.keys()]
+            bond_idx = [tuple(bond) for bond in conn_pairs]
 
         return bond_idx
 
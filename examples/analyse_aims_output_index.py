@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+'''
+This is an example and QA test for indexing an FHI-aims output, so that the data of any step of a
+geometry optimisation or MD run can be read directly without scanning the whole file again.
+'''
+
+def test_aims_output_index():
+
+    import os
+    import numpy as np
+    from ase.io import read
+    from carmm.analyse.aims_output import AimsOutputIndex
+    from carmm.analyse.mulliken import extract_mulliken_charge
+
+    # Geometry optimisation of CO, with five force evaluations and a final Mulliken analysis
+    filename = "data/CO/co_light.log"
+    index = AimsOutputIndex(filename)
+
+    assert index.natoms == 2
+    assert index.get_n_steps() == 5
+    assert index.get_n_steps('geometry') == 5
+    assert index.get_n_steps('hirshfeld') == 0
+
+    # Time series over all steps agree with reading every step with ASE
+    trajectory = read(filename, index=':')
+    assert np.allclose(index.get_series('energy'), [atoms.get_potential_energy() for atoms in trajectory])
+    assert np.allclose(index.get_series('positions'), [atoms.get_positions() for atoms in trajectory])
+    assert np.allclose(index.get_forces(2), trajectory[2].get_forces())
+
+    # The last Mulliken analysis matches the other extraction tools
+    assert np.allclose(index.get_mulliken_charges(), extract_mulliken_charge(filename, 2, as_array=True))
+
+    # The index can be kept on disk and is reused while the output does not change
+    index = AimsOutputIndex(filename, cache=True)
+    assert os.path.exists(filename + ".index.npz")
+    cached_index = AimsOutputIndex(filename, cache=True)
+    assert cached_index.load()
+    assert np.array_equal(cached_index.offsets['energy'], index.offsets['energy'])
+    os.remove(filename + ".index.npz")
+
+def test_aims_output_index_hirshfeld():
+
+    import numpy as np
+    from carmm.analyse.aims_output import AimsOutputIndex
+    from carmm.analyse.hirshfeld import parse_hirshfeld
+
+    filename = "data/mgo/mgo_hirsh_aims.out"
+    index = AimsOutputIndex(filename)
+
+    hirsh = index.get_hirshfeld()
+    reference = parse_hirshfeld(filename, natoms=4)
+    for name in reference:
+        assert np.array_equal(hirsh[name], reference[name])
+
+    assert np.isclose(index.get_energy(), -15015.9608928361)
+
+def test_aims_output_index_md():
+
+    import numpy as np
+    from carmm.analyse.aims_output import AimsOutputIndex
+
+    # Abridged MD run of 16 Ar atoms over three time steps, where every structure is printed with velocities
+    # after the energy and forces it belongs to
+    filename = "data/md/aims_md.out"
+    index = AimsOutputIndex(filename)
+
+    assert index.natoms == 16
+    assert index.get_n_steps() == index.get_n_steps('geometry') == 3
+
+    # Geometry step n is the structure of energy step n, the input geometry repeats the first one
+    positions = index.get_series('positions')
+    assert positions.shape == (3, 16, 3)
+    assert np.allclose(positions[0, 15], [9.0, 9.0, 0.0])
+    assert np.allclose(positions[1, 0], [0.01, -0.005, 0.0025])
+    assert np.allclose(index.get_series('energy'), [-14385.0, -14385.1, -14385.2])
+    assert np.isclose(index.get_energy(0, free=True), -14385.01)
+    assert np.allclose(index.get_forces(2)[0], [0.003, -0.003, 0.0])
+
+    # A geometry block with fewer atoms than the output is an error rather than a short result
+    index.natoms = 17
+    try:
+        index.get_positions(0)
+        assert False
+    except ValueError:
+        pass
+
+# Run the example/test
+test_aims_output_index()
+test_aims_output_index_hirshfeld()
+test_aims_output_index_md()
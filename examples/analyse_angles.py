@@ -22,5 +22,76 @@ def test_analyse_angles():
     assert(len(indices) == 2 and len(indices[index_au]) == 648)
     assert(len(angles) == 2 and len(angles[index_au]) == 648)
 
-test_analyse_angles()
+def test_analyse_get_all_angles():
+
+    import numpy as np
+    from ase.build import molecule
+    from ase.geometry.analysis import Analysis
+    from carmm.analyse.angles import get_all_angles
+
+    ethanol = molecule('CH3CH2OH')
+    angles = get_all_angles(ethanol)
+
+    # Single pass gives the same angles as an ase Analysis per element triple
+    analysis = Analysis(ethanol)
+    for label in ['H-C-H', 'C-C-O', 'O-C-C', 'C-O-H']:
+        indices, values = angles[label]
+        ase_indices = analysis.get_angles(*label.split("-"))
+        assert [tuple(angle) for angle in indices.tolist()] == ase_indices[0]
+        assert np.allclose(values, analysis.get_values(ase_indices)[0])
+
+    assert 'H-O-H' not in angles
+    assert abs(angles['C-O-H'][1][0] - 107.68) < 0.01
+
+def test_analyse_dihedrals():
+
+    import numpy as np
+    from ase.build import molecule
+    from carmm.analyse.angles import analyse_dihedrals, track_dihedrals
+
+    butane = molecule('trans-butane')
+    elements, indices, dihedrals = analyse_dihedrals(butane, verbose=True)
 
+    assert elements == [('C', 'C', 'C', 'C'), ('C', 'C', 'C', 'H'), ('H', 'C', 'C', 'H')]
+    assert [len(i) for i in indices] == [1, 10, 16]
+    # Carbon backbone in the trans conformation
+    assert abs(dihedrals[0][0] - 180.0) < 1e-6
+    for chain, value in zip(indices[1], dihedrals[1]):
+        assert abs(butane.get_dihedral(*chain) - value) < 1e-6
+
+    # Chains fixed from the first frame, followed along a rotation of one methyl group
+    frames = []
+    for angle in [180, 120, 60]:
+        frame = butane.copy()
+        frame.set_dihedral(0, 1, 2, 3, angle, indices=[3, 5, 8, 9])
+        frames.append(frame)
+    chain_indices, values = track_dihedrals(frames)
+    assert values.shape == (3, 27)
+    assert np.allclose(values[:, 0], [180, 120, 60])
+
+def test_analyse_dihedrals_linear():
+
+    import io
+    import contextlib
+    import numpy as np
+    from ase import Atoms
+    from carmm.analyse.angles import analyse_dihedrals
+
+    # Carbon chain whose last three atoms are collinear, so the second of its two dihedrals is undefined
+    chain = Atoms('C5', positions=[[-0.75, 1.3, 0], [0, 0, 0], [1.5, 0, 0], [2.25, -1.3, 0], [3.0, -2.6, 0]])
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        elements, indices, dihedrals = analyse_dihedrals(chain, verbose=True)
+
+    assert elements == [('C', 'C', 'C', 'C')]
+    assert np.isclose(np.nanmax(dihedrals[0]), 180.0) and np.isnan(dihedrals[0]).sum() == 1
+    # The table row only averages the defined dihedral
+    row = output.getvalue().splitlines()[-1].split()
+    assert row[:2] == ['C-C-C-C', '2'] and 'nan' not in row
+    assert np.allclose([float(value) for value in row[2:]], 180.0)
+
+test_analyse_angles()
+test_analyse_get_all_angles()
+test_analyse_dihedrals()
+test_analyse_dihedrals_linear()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+'''
+This is an example and QA test for determining the band edges (HOMO, LUMO, band gaps and Fermi level)
+from the eigenvalues and occupations of a calculation, e.g. those read from a Mulliken.out file
+'''
+
+def test_band_edges():
+
+    import numpy as np
+    from carmm.analyse.band_edges import get_band_edges
+
+    # Two k-points of a model semiconductor with one spin channel, where the valence band maximum is at the
+    # first k-point and the conduction band minimum at the second
+    energies = np.array([[[-5.0, -1.0, 2.0, 4.0],
+                          [-6.0, -2.0, 1.5, 3.0]]])
+    occupancies = np.array([[[2.0, 2.0, 0.0, 0.0],
+                             [2.0, 2.0, 0.0, 0.0]]])
+
+    band_edges = get_band_edges(energies, occupancies)
+    assert band_edges['homo'] == -1.0
+    assert band_edges['lumo'] == 1.5
+    assert band_edges['gap'] == 2.5
+    assert band_edges['direct_gap'] == 3.0
+    assert band_edges['indirect']
+    assert band_edges['homo_kpt'] == 0 and band_edges['lumo_kpt'] == 1
+    assert band_edges['fermi'] == 0.25
+
+    # Spin-polarised molecule (a single k-point), with the HOMO in the spin up and the LUMO in the spin down
+    # channel. The gap is between the two channels, but still direct.
+    energies = np.array([[[-6.0, -2.0, 3.0]],
+                         [[-5.0, 1.0, 2.0]]])
+    occupancies = np.array([[[1.0, 1.0, 0.0]],
+                            [[1.0, 0.0, 0.0]]])
+
+    band_edges = get_band_edges(energies, occupancies)
+    assert band_edges['homo'] == -2.0
+    assert band_edges['lumo'] == 1.0
+    assert np.allclose(band_edges['gap_spin'], [5.0, 6.0])
+    assert band_edges['gap'] == band_edges['direct_gap'] == 3.0
+    assert not band_edges['indirect']
+
+def test_mulliken_band_edges():
+
+    import numpy as np
+    from carmm.analyse.mulliken import parse_mulliken_file
+
+    mulliken_data = parse_mulliken_file("data/Fe-CO/Mulliken.out")
+    band_edges = mulliken_data.get_band_edges()
+
+    # The HOMO is in the spin up channel, the gap of the spin down channel is much larger
+    assert band_edges['homo'] == mulliken_data.get_homo() == -4.22285
+    assert band_edges['lumo'] == -4.02359
+    assert np.allclose(band_edges['gap_spin'], [0.19926, 2.61887])
+    assert not band_edges['indirect']
+
+    # The result is kept on the object
+    assert mulliken_data.get_band_edges() is band_edges
+
+# Run the example/test
+test_band_edges()
+test_mulliken_band_edges()
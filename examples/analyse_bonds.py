@@ -21,6 +21,54 @@ def test_analyse_bonds():
 
     assert(len(abnormal_count) == 1)
 
+def test_analyse_search_abnormal_bonds():
+    from ase.build import molecule
+    from carmm.analyse.bonds import search_abnormal_bonds, search_abnormal_bonds_batch, has_abnormal_bonds
+
+    #Build a model
+    from data.model_gen import get_example_slab as slab
+    slab = slab(adsorbate=True)
+    deformed = slab.copy()
+    # Deform the z-coordinate for C so the Au-C bond length is too short
+    deformed.positions[-3][2] -= 1.5
+
+    # Fast path agrees with the full bond table
+    assert(search_abnormal_bonds(slab, verbose=True))
+    assert(search_abnormal_bonds(slab, verbose=False))
+    assert(not search_abnormal_bonds(deformed, verbose=True))
+    assert(not search_abnormal_bonds(deformed, verbose=False))
+
+    # Per element pair thresholds, here flagging any O-H bond as too short
+    water = molecule('H2O')
+    assert(not has_abnormal_bonds(water))
+    assert(has_abnormal_bonds(water, thresholds={'O-H': 1.0}))
+
+    # Screening of many candidate structures in a process pool
+    passed = search_abnormal_bonds_batch([slab, deformed, water], processes=2)
+    assert(passed.tolist() == [True, False, True])
+
+def test_analyse_bond_census():
+    from carmm.analyse.bonds import get_bond_census, analyse_bonds
+
+    #Build a model
+    from data.model_gen import get_example_slab as slab
+    slab = slab(adsorbate=True)
+    slab.positions[-3][2] -= 1.5
+
+    # All element pairs are collected from a single neighbour list
+    census = get_bond_census(slab)
+    assert(sorted(census.keys()) == ['Au-Au', 'C-Au', 'C-O'])
+    assert(census['Au-Au']['count'] == 81)
+    assert(census['C-Au']['abnormal'] == 1)
+    assert(census['C-O']['abnormal'] == 0)
+    assert(1e-5 > abs(census['C-O']['average'] - 1.907678))
+
+    # Single pair analysis is served by the census, with bonds orientated as requested
+    print_AB, AB_Bonds, AB_BondsValues = analyse_bonds(slab, 'Au', 'C', verbose=False)
+    assert(print_AB == 'Au-C')
+    assert(AB_Bonds == [[(17, 18)]])
+    assert(1e-5 > abs(AB_BondsValues[0][0] - 1.5))
+
 def test_analyse_get_sorted_distances():
     from carmm.analyse.bonds import get_sorted_distances
 
@@ -39,6 +87,33 @@ def test_analyse_get_sorted_distances():
     plt = plot_distribution_function(distances, title='Radial Distribution Function')
     #plt.show()
 
+def test_analyse_get_sorted_distances_cutoff():
+    import numpy as np
+    from carmm.analyse.bonds import get_sorted_distances
+
+    #Build a model
+    from data.model_gen import get_example_slab as slab
+    slab = slab(adsorbate=True)
+
+    # Below half the in-plane cell width, the neighbour list and mic give the same pairs
+    r_max = 3.5
+    reference = [d for d in get_sorted_distances(slab, atoms_to_include=[18, 19, 20]) if d < r_max]
+    distances = get_sorted_distances(slab, atoms_to_include=[18, 19, 20], r_max=r_max)
+    assert(len(distances) == len(reference))
+    assert(np.allclose(distances, reference))
+
+    # Pre-binned histogram of the same distances
+    counts, bin_edges = get_sorted_distances(slab, atoms_to_include=[18, 19, 20], r_max=r_max, bins=35)
+    assert(counts.sum() == len(reference))
+    assert(1e-8 > abs(bin_edges[-1] - r_max))
+
+    # Periodic self-images are counted in a small bulk cell
+    from ase.build import bulk
+    copper = bulk('Cu', 'fcc', a=3.6)
+    distances = get_sorted_distances(copper, r_max=3.0)
+    assert(len(distances) == 6)
+    assert(1e-5 > abs(distances[0] - 3.6/np.sqrt(2)))
+
 def test_analyse_comparing_bond_lengths():
     import numpy as np
     from ase.build import fcc111, fcc110
@@ -57,6 +132,60 @@ def test_analyse_comparing_bond_lengths():
     #print("maximium distance difference is :", difference[np.argmax(difference)])
     #print("minimum distance difference is :", difference[np.argmin(difference)])
 
+def test_analyse_track_bond_lengths():
+    import numpy as np
+    from ase.io import read
+    from carmm.analyse.bonds import track_bond_lengths
+
+    # Proton transfer from NH4+ to H2O, bonds are taken from the first frame
+    filename = 'data/NH3-H3O_traj/nh3-h3o.traj'
+    bond_indices, bond_lengths = track_bond_lengths(filename)
+    assert(bond_indices.tolist() == [[0, 1], [0, 2], [0, 3], [3, 4], [4, 5], [4, 6], [4, 7]])
+    assert(bond_lengths.shape == (41, 7))
+
+    # The transferred proton leaves N and binds to O
+    change = bond_lengths[-1] - bond_lengths[0]
+    assert(1e-5 > abs(bond_lengths[-1][2] - 1.779135))
+    assert(change[2] > 0.7 and change[3] < -0.4)
+
+    # Same result when the frames are supplied as a list of Atoms objects
+    frames = read(filename, index=':')
+    assert(np.allclose(track_bond_lengths(frames)[1], bond_lengths))
+
+def test_analyse_match_structures():
+    import numpy as np
+    from carmm.analyse.bonds import match_structures, compare_structures
+
+    #Build a model and a shuffled, slightly displaced copy
+    from data.model_gen import get_example_slab as slab
+    initial = slab(adsorbate=True)
+    relaxed = initial.copy()
+    relaxed.rattle(0.05, seed=1)
+    permutation = np.random.RandomState(0).permutation(len(relaxed))
+    relaxed = relaxed[permutation]
+
+    # Nearest neighbour matching recovers the original ordering
+    indices, displacements, rmsd = match_structures(initial, relaxed)
+    assert((permutation[indices] == np.arange(len(initial))).all())
+    assert(displacements.shape == (len(initial), 3))
+    assert(sorted(rmsd.keys()) == ['Au', 'C', 'O', 'total'])
+
+    # The optimal assignment agrees for small displacements
+    optimal_indices, optimal_displacements, optimal_rmsd = match_structures(initial, relaxed, optimal=True)
+    assert((optimal_indices == indices).all())
+    assert(1e-8 > abs(optimal_rmsd['total'] - rmsd['total']))
+
+    # Atoms moved across the periodic boundary are matched through the minimum image
+    shifted = initial.copy()
+    shifted.positions[0] += shifted.cell[0] + [0.1, 0.0, 0.0]
+    indices, displacements, rmsd = match_structures(initial, shifted)
+    assert(indices[0] == 0)
+    assert(np.allclose(displacements[0], [0.1, 0.0, 0.0]))
+
+    # Legacy interface, limited to a single element
+    atoms2_indices, differences = compare_structures(initial, relaxed, label='O')
+    assert(atoms2_indices[19] == int(np.flatnonzero(permutation == 19)[0]))
+
 def test_analyse_chelation():
     ## Initialises modules
     from carmm.analyse.bonds import analyse_chelation
@@ -78,6 +207,11 @@ def test_analyse_chelation():
     assert(ligands.get("complex") == "Mn(κ1-H2O)6")
 
 test_analyse_bonds()
+test_analyse_bond_census()
+test_analyse_search_abnormal_bonds()
 test_analyse_get_sorted_distances()
+test_analyse_get_sorted_distances_cutoff()
 test_analyse_comparing_bond_lengths()
+test_analyse_track_bond_lengths()
+test_analyse_match_structures()
 test_analyse_chelation()
@@ -0,0 +1,46 @@
+'''
+Example of the shared connectivity used by the analysis tools.
+
+Several analysis functions called on the same structure reuse one neighbour search,
+which is useful when analysing large models with many of the carmm.analyse tools.
+'''
+
+def test_connectivity():
+    import numpy as np
+    from ase.neighborlist import NeighborList, natural_cutoffs
+    from carmm.analyse.connectivity import get_connectivity, clear_connectivity_cache, set_connectivity_cache_size
+    from carmm.analyse.molecules import calculate_molecules
+    from carmm.analyse.neighbours import neighbours
+
+    # Build model
+    from data.model_gen import get_example_slab as slab
+    slab = slab(adsorbate=True)
+
+    clear_connectivity_cache()
+    connectivity = get_connectivity(slab)
+
+    # Same adjacency as the ase NeighborList
+    nl = NeighborList(natural_cutoffs(slab), self_interaction=False, bothways=True)
+    nl.update(slab)
+    assert((connectivity.adjacency.toarray() > 0).sum() == (nl.get_connectivity_matrix().toarray() > 0).sum())
+    assert(connectivity.get_neighbors(13).tolist() == [1, 2, 4, 10, 11, 12, 14, 15, 16])
+
+    # Distances are aligned with the stored bonds
+    bonds, lengths = connectivity.get_pairs()
+    assert(np.allclose(lengths, [slab.get_distance(i, j, mic=True) for i, j in bonds]))
+
+    # The same structure is served from the cache, a modified one is not
+    calculate_molecules(slab)
+    neighbours(slab, [13], 2)
+    assert(get_connectivity(slab) is connectivity)
+    moved = slab.copy()
+    moved.positions[0] += 0.1
+    assert(get_connectivity(moved) is not connectivity)
+
+    # Least recently used entries are evicted
+    set_connectivity_cache_size(1)
+    get_connectivity(moved)
+    assert(get_connectivity(slab) is not connectivity)
+    set_connectivity_cache_size(16)
+
+test_connectivity()
@@ -80,7 +80,100 @@ def test_radius_of_gyration():
     rog = radius_of_gyration(model=water)
     assert(1e-5 > abs(rog-0.317063))
 
+def test_rdf_accumulator():
+    from carmm.analyse.distribution_functions import RDFAccumulator
+    from ase.build import bulk
+    import numpy as np
+
+    # Cu3Au with Au on the corners of the conventional fcc cell
+    model = bulk('Cu', 'fcc', a=3.6, cubic=True).repeat(3)
+    model.symbols[::4] = 'Au'
+    frames = [model.copy() for i in range(4)]
+    for i, atoms in enumerate(frames):
+        atoms.rattle(0.05, seed=i)
+
+    rdf = RDFAccumulator(r_max=6.0, bins=120, pairs=[('Au', 'Cu')])
+    rdf.update_trajectory(frames)
+    assert rdf.n_frames == 4
+
+    # Integrating g(r) over the first shell recovers the fcc coordination number
+    shell_volumes = 4 / 3 * np.pi * np.diff(rdf.edges ** 3)
+    first_shell = rdf.r < 3.0
+    density = len(model) / model.get_volume()
+    assert abs(np.sum(rdf.get_rdf()[first_shell] * shell_volumes[first_shell]) * density - 12) < 1e-8
+    cu_density = np.count_nonzero(model.symbols == 'Cu') / model.get_volume()
+    au_cu = rdf.get_rdf(('Au', 'Cu'))
+    assert abs(np.sum(au_cu[first_shell] * shell_volumes[first_shell]) * cu_density - 12) < 1e-8
+
+    # Accumulators over separate frames merge to the same result
+    first_half = RDFAccumulator(r_max=6.0, bins=120, pairs=[('Au', 'Cu')])
+    first_half.update_trajectory(frames, index='0:2')
+    second_half = RDFAccumulator(r_max=6.0, bins=120, pairs=[('Au', 'Cu')])
+    second_half.update_trajectory(frames, index='2:')
+    first_half.merge(second_half)
+    assert np.allclose(first_half.get_rdf(), rdf.get_rdf())
+    assert np.array_equal(first_half.counts, rdf.counts)
+
+def test_average_distribution_function_parallel():
+    from carmm.analyse.distribution_functions import average_distribution_function, \
+        average_radial_distribution_function
+    from ase.build import bulk
+    from ase.io import write
+    import numpy as np
+    import os
+
+    frames = [bulk('Cu', 'fcc', a=3.6, cubic=True).repeat(2) for i in range(6)]
+    for i, atoms in enumerate(frames):
+        atoms.rattle(0.05, seed=i)
+    write("rdf_example.traj", frames)
+
+    # Frames read lazily from file by the workers, histograms merged after
+    all_data, snapshots = average_distribution_function(frames, samples=4, r_max=5.0, bins=50)
+    all_data_parallel, snapshots_parallel = average_distribution_function("rdf_example.traj", samples=4,
+                                                                          processes=2, r_max=5.0, bins=50)
+    assert len(snapshots_parallel) == 4
+    assert np.array_equal(all_data, all_data_parallel)
+
+    rdf = average_radial_distribution_function(frames, r_max=5.0, bins=50, samples=None, processes=1)
+    rdf_parallel = average_radial_distribution_function("rdf_example.traj", r_max=5.0, bins=50, samples=None,
+                                                        processes=2)
+    assert rdf_parallel.n_frames == 6
+    assert np.allclose(rdf.get_rdf(), rdf_parallel.get_rdf())
+
+    os.remove("rdf_example.traj")
+
+def test_track_radius_of_gyration():
+    from carmm.analyse.distribution_functions import radius_of_gyration, get_radii_of_gyration, \
+        track_radius_of_gyration
+    from ase.build import molecule
+    import numpy as np
+
+    # Ethanol and water in a periodic box, with ethanol broken across the boundary
+    water = molecule('H2O')
+    water.translate([3, 3, 3])
+    model = molecule('CH3CH2OH') + water
+    model.cell = [7, 7, 7]
+    model.pbc = True
+    model.wrap()
+
+    frames = [model.copy() for i in range(3)]
+    frames[2].positions[9:] += [0.5, 0, 0]
+
+    rog = track_radius_of_gyration(frames, groups="molecules")
+    assert rog.shape == (3, 2)
+    assert np.allclose(rog[:, 0], radius_of_gyration(molecule('CH3CH2OH')))
+    assert np.allclose(rog[:, 1], radius_of_gyration(molecule('H2O')))
+
+    # Stack of frames as a single array, without mass weighting
+    positions = np.array([molecule('H2O').positions] * 4)
+    unweighted = get_radii_of_gyration(positions)
+    assert unweighted.shape == (4, 1)
+    assert np.allclose(unweighted, np.sqrt(np.mean(np.sum((positions[0] - positions[0].mean(axis=0)) ** 2, axis=1))))
+
 test_analyse_radial_distribution_function()
 test_analyse_element_radial_distribution_function()
 test_analyse_average_distribution_function()
 test_radius_of_gyration()
+test_rdf_accumulator()
+test_average_distribution_function_parallel()
+test_track_radius_of_gyration()
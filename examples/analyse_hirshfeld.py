@@ -70,7 +70,76 @@ def test_analyse_hirshfeld():
         lines = vmd.readlines()
     assert(lines == ['0.34094559\n', '-0.34020775\n', '0.34094559\n', '-0.34020775\n'])
 
-test_analyse_hirshfeld()
+def test_parse_hirshfeld():
+
+    import os
+    import numpy as np
+    from carmm.analyse import hirshfeld
+
+    # All quantities are read from the output at once, without writing any file
+    hirsh = hirshfeld.parse_hirshfeld(fname='data/mgo/mgo_hirsh_aims.out', natoms=4)
+
+    assert np.allclose(hirsh['charge'], [0.34094559, -0.34020775, 0.34094559, -0.34020775])
+    assert hirsh['dipole vector'].shape == (4, 3)
+    assert hirsh['second'].shape == (4, 3, 3)
+    # The second moments are symmetric tensors
+    assert np.allclose(hirsh['second'], hirsh['second'].transpose(0, 2, 1))
+    assert np.allclose(hirsh['second'][1].diagonal(), [-0.00625081, -0.00625081, -0.00618102])
 
+    # Writing the Hirshfeld block to disk is optional
+    hirshfeld.parse_hirshfeld(fname='data/mgo/mgo_hirsh_aims.out', natoms=4, outname='data/mgo/hirshfeld_export.txt')
+    with open('data/mgo/hirshfeld_export.txt', 'r') as export:
+        lines = export.readlines()
+    assert len(lines) == 40
+    assert hirshfeld.read_hirshfeld('data/mgo/hirshfeld_export.txt', 'Hirshfeld volume        :') == \
+        hirsh['volume'].tolist()
+    os.remove('data/mgo/hirshfeld_export.txt')
 
+def test_parse_hirshfeld_layouts():
 
+    import os
+    import numpy as np
+    from carmm.analyse import hirshfeld
+
+    with open('data/mgo/mgo_hirsh_aims.out', 'r') as aims_out:
+        lines = aims_out.readlines()
+
+    # An extra line for each atom, as for the spin moments of spin-polarised calculations, and no dipole vectors
+    with open('data/mgo/hirsh_layout.out', 'w') as layout:
+        for line in lines:
+            if 'Hirshfeld dipole vector :' in line:
+                continue
+            layout.write(line)
+            if 'Hirshfeld charge        :' in line:
+                layout.write('  |   Hirshfeld spin moment   :      0.10000000\n')
+
+    hirsh = hirshfeld.parse_hirshfeld(fname='data/mgo/hirsh_layout.out', natoms=4)
+    assert np.allclose(hirsh['charge'], [0.34094559, -0.34020775, 0.34094559, -0.34020775])
+    assert np.allclose(hirsh['second'][1].diagonal(), [-0.00625081, -0.00625081, -0.00618102])
+    assert 'dipole vector' not in hirsh
+
+    # Only a quantity that is actually missing is an error
+    assert hirshfeld.extract_hirshfeld('data/mgo/hirsh_layout.out', 4, 'volume', outname='data/mgo/hirsh_layout.txt') \
+        == [84.98662789, 22.60472263, 84.98662789, 22.60472263]
+    try:
+        hirshfeld.extract_hirshfeld('data/mgo/hirsh_layout.out', 4, 'dipole vector',
+                                    outname='data/mgo/hirsh_layout.txt')
+        assert False
+    except ValueError:
+        pass
+
+    # Without writing, the values of all Hirshfeld analyses in the file are returned, otherwise of the last one
+    with open('data/mgo/hirsh_layout.out', 'w') as layout:
+        layout.writelines(lines + lines)
+
+    charge = [0.34094559, -0.34020775, 0.34094559, -0.34020775]
+    assert hirshfeld.extract_hirshfeld('data/mgo/hirsh_layout.out', 4, 'charge', write=False) == charge + charge
+    assert hirshfeld.extract_hirshfeld('data/mgo/hirsh_layout.out', 4, 'charge',
+                                       outname='data/mgo/hirsh_layout.txt') == charge
+
+    os.remove('data/mgo/hirsh_layout.out')
+    os.remove('data/mgo/hirsh_layout.txt')
+
+test_analyse_hirshfeld()
+test_parse_hirshfeld()
+test_parse_hirshfeld_layouts()
@@ -25,5 +25,31 @@ def test_molecules():
 
 
 
+def test_track_molecules():
+    '''
+    Test molecule tracking along the proton transfer between H3O+ and NH3
+    '''
+    import numpy as np
+    from ase.io import read
+    from carmm.analyse.molecules import track_molecules, calculate_molecules, MoleculeTracker
+
+    trajectory = read("data/NH3-H3O_traj/nh3-h3o.traj", ":")
+    molecule_ids, formula_counts = track_molecules(trajectory, skin=0.5)
+
+    assert molecule_ids.shape == (41, 8)
+    # The hydrogen bonded complex separates into water and ammonium
+    assert formula_counts['O1H6N1'][0] == 1
+    assert formula_counts['O1H2'][-1] == 1 and formula_counts['H4N1'][-1] == 1
+    assert list(molecule_ids[-1]) == [0, 0, 0, 3, 3, 3, 3, 3]
+
+    # Incremental connectivity gives the same molecules as a full search
+    tracker = MoleculeTracker(skin=0.5)
+    for atoms in trajectory:
+        ids = tracker.update(atoms)
+        molecules = calculate_molecules(atoms)
+        assert sorted(np.flatnonzero(ids == ids[i]).tolist() for i in np.unique(ids)) == sorted(molecules)
+    assert tracker.n_updates < len(trajectory)
+
 
-test_molecules()
\ No newline at end of file
+test_molecules()
+test_track_molecules()
\ No newline at end of file
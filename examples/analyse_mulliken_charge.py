@@ -38,5 +38,24 @@ def test_analyse_mulliken_charge():
     # Confirm we are reading the Mulliken Charge correctly
     assert(mulliken_charge == ['0.088700', '-0.088700'])
 
+def test_read_last_block():
+
+    from carmm.analyse.mulliken import read_last_block, extract_mulliken_charge
+
+    # The output is searched backwards from the end, so only the final charge analysis is read.
+    # Small blocks split the identifier and its line between reads, which must not change the result.
+    for block_size in [16, 100, 2**16]:
+        lines = read_last_block("data/CO/co_light.log", "Summary of the per-atom charge analysis:", 2, offset=3,
+                                block_size=block_size)
+        assert [line.split()[3] for line in lines] == ['0.088700', '-0.088700']
+
+    assert read_last_block("data/CO/co_light.log", "Not in the file", 2) == []
+
+    # The charges can also be returned as a numpy array of floats
+    charges = extract_mulliken_charge("data/CO/co_light.log", 2, as_array=True)
+    assert charges.dtype == float
+    assert charges.tolist() == [0.0887, -0.0887]
+
 # Run the example
 test_analyse_mulliken_charge()
+test_read_last_block()
@@ -57,5 +57,98 @@ def test_mulliken_outline():
     plt.legend()
     #plt.show()
 
+def test_mulliken_arrays():
+
+    import numpy as np
+    from carmm.analyse.mulliken import parse_mulliken_file
+
+    mulliken_data = parse_mulliken_file("data/Fe-CO/Mulliken.out")
+
+    # Data is held in arrays of (natoms, nspin, nkpts, nstates)
+    assert mulliken_data.energies.shape == (3, 2, 1, 32)
+    assert mulliken_data.orbitals.shape == (3, 2, 1, 5, 32)
+    # Orbital contributions add up to the total of each state
+    assert np.allclose(mulliken_data.orbitals.sum(axis=3), mulliken_data.all_mulliken, atol=1e-4)
+
+    # Per atom, spin and k-point access gives views of the same arrays
+    kpt = mulliken_data.atoms[2].spin[1].kpts[0]
+    assert np.shares_memory(kpt.energies, mulliken_data.energies)
+    assert kpt.orbitals[1][5] == mulliken_data.orbitals[2, 1, 0, 1, 5]
+    kpt.weight = 0.5
+    assert mulliken_data.weights[2, 1, 0] == 0.5
+
+def test_mulliken_streaming_parser():
+
+    import numpy as np
+    from carmm.analyse.mulliken import parse_mulliken_file
+
+    # Reading the file in very small chunks splits blocks of states, which must give identical data
+    mulliken_data = parse_mulliken_file("data/Fe-CO/Mulliken.out")
+    chunked_data = parse_mulliken_file("data/Fe-CO/Mulliken.out", chunk_size=100)
+
+    for name in ['energies', 'occupancies', 'all_mulliken', 'orbitals', 'weights']:
+        assert np.array_equal(getattr(mulliken_data, name), getattr(chunked_data, name))
+
+    # Species with fewer angular momentum channels leave the higher l contributions empty
+    assert mulliken_data.energies[1, 1, 0, 0] == -7054.18994
+    assert np.all(mulliken_data.orbitals[1, :, :, 3:] == 0)
+    assert mulliken_data.orbitals[0, 0, 0, 3, 28] == -0.00141
+
+def test_mulliken_batch_plot_data():
+
+    import numpy as np
+    from carmm.analyse.mulliken import parse_mulliken_file
+
+    mulliken_data = parse_mulliken_file("data/Fe-CO/Mulliken.out")
+
+    # Densities of states for every atom and angular momentum in one call
+    selections = [([atom], angular) for atom in range(mulliken_data.get_natoms()) for angular in 'spdf']
+    x, batch = mulliken_data.get_batch_plot_data(selections)
+    assert batch.shape == (12, 2, 1000)
+
+    # Each selection matches the separate calculation, and the spin channels are independent arrays
+    x, fe_d = mulliken_data.get_plot_data([0], range(2), range(1), 'd')
+    assert np.allclose(batch[2], fe_d)
+    assert not np.allclose(fe_d[0], fe_d[1])
+    x, fe_d_down = mulliken_data.get_plot_data([0], [1], range(1), 'd')
+    assert np.allclose(fe_d_down[0], fe_d[1])
+
+    # The projections add up to the total density of states, which integrates to the number of states
+    x, data = mulliken_data.get_all_plot_data()
+    assert np.allclose(batch.sum(axis=0), data, atol=1e-3)
+    assert np.allclose(data.sum(axis=1) * (x[1] - x[0]), 20.0, atol=1e-3)
+
+def test_mulliken_cache():
+
+    import os
+    import shutil
+    import numpy as np
+    from carmm.analyse.mulliken import parse_mulliken_file
+
+    # Work on a copy so the cache is not written into the data folder
+    shutil.copy("data/Fe-CO/Mulliken.out", "Mulliken_cache_example.out")
+
+    # The first call parses the text and writes the cache, later calls memory-map it
+    mulliken_data = parse_mulliken_file("Mulliken_cache_example.out", cache=True)
+    assert os.path.exists("Mulliken_cache_example.out.cache/key.json")
+    cached_data = parse_mulliken_file("Mulliken_cache_example.out", cache=True)
+    assert isinstance(cached_data.energies, np.memmap)
+    for name in cached_data.array_names:
+        assert np.array_equal(getattr(mulliken_data, name), getattr(cached_data, name))
+    assert cached_data.get_homo() == -4.22285
+
+    # Changing the file invalidates the cache
+    with open("Mulliken_cache_example.out", "a") as append_stream:
+        append_stream.write("\n")
+    reparsed_data = parse_mulliken_file("Mulliken_cache_example.out", cache=True)
+    assert not isinstance(reparsed_data.energies, np.memmap)
+
+    os.remove("Mulliken_cache_example.out")
+    shutil.rmtree("Mulliken_cache_example.out.cache")
+
 # Run the example/test
-test_mulliken_outline()
\ No newline at end of file
+test_mulliken_outline()
+test_mulliken_arrays()
+test_mulliken_streaming_parser()
+test_mulliken_batch_plot_data()
+test_mulliken_cache()
@@ -37,5 +37,8 @@ def test_analyse_mulliken_spin():
     # Assertion test to confirm the code works correctly.
     assert(mulliken_spin == ['-2.242867', '0.164614', '0.078252'])
 
+    # The same data as a numpy array of floats
+    assert(extract_mulliken_spin(filename, len(atoms), as_array=True).tolist() == [-2.242867, 0.164614, 0.078252])
+
 # Run the example
 test_analyse_mulliken_spin()
\ No newline at end of file
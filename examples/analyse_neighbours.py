@@ -14,4 +14,56 @@ def test_neighbours():
     assert(all_neighbour_atoms == [1, 2, 4, 10, 11, 12, 13, 14, 15, 16])
     assert(shell_list == [[13], [1, 2, 4, 10, 11, 12, 14, 15, 16]])
 
+def test_neighbour_shells():
+    '''
+    Test neighbour shells of several centres from one breadth-first search
+    '''
+    from carmm.analyse.neighbours import neighbours, get_neighbour_shells
+    # Build model
+    from data.model_gen import get_example_slab as slab
+    slab = slab(adsorbate=True)
+
+    # Several shells agree with the lists returned by neighbours
+    all_neighbour_atoms, shell_list = neighbours(slab, [13], 2)
+    shells = get_neighbour_shells(slab, [13], 2)
+    for n in range(3):
+        assert(shell_list[n] == [i for i in range(len(slab)) if shells[i] == n])
+    assert(len(all_neighbour_atoms) == 18)
+
+    # Shells counted from the nearest of several centres, or from each centre separately
+    shells = get_neighbour_shells(slab, [0, 20], 1)
+    assert(shells[20] == 0 and shells[18] == 1 and shells[19] == -1)
+    shells = get_neighbour_shells(slab, [0, 20], 1, separate=True)
+    assert(shells.shape == (2, len(slab)))
+    assert(shells[0][18] == -1 and shells[1][18] == 1)
+
+    # Without centres no atom is in any shell
+    assert((get_neighbour_shells(slab, [], 1) == -1).all())
+    assert(get_neighbour_shells(slab, [], 1, separate=True).shape == (0, len(slab)))
+
+def test_cutout_sphere_indices():
+    '''
+    Test spherical selections around many centres with periodic images
+    '''
+    from carmm.analyse.neighbours import neighbour_cutout_sphere, get_cutout_sphere_indices
+    # Build model
+    from data.model_gen import get_example_slab as slab
+    slab = slab(adsorbate=True)
+
+    # All centres in one call, agreeing with the single centre selection
+    indices = get_cutout_sphere_indices(slab, range(len(slab)), 4.0, periodic=False)
+    assert(indices[13].tolist() == neighbour_cutout_sphere(slab, 13, 4.0))
+
+    # Periodic images in the surface plane add atoms to the selection
+    periodic_indices = get_cutout_sphere_indices(slab, [13], 5.0, periodic=True)[0]
+    assert(len(periodic_indices) > len(neighbour_cutout_sphere(slab, 13, 5.0)))
+    assert(len(set(periodic_indices)) == len(neighbour_cutout_sphere(slab, 13, 5.0, periodic=True)))
+
+    # Atoms at exactly the cutoff distance are outside the sphere
+    from ase import Atoms
+    chain = Atoms('H3', positions=[[0, 0, 0], [2, 0, 0], [1.5, 0, 0]])
+    assert(neighbour_cutout_sphere(chain, 0, 2.0) == [0, 2])
+
 test_neighbours()
+test_neighbour_shells()
+test_cutout_sphere_indices()
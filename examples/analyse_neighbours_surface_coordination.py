@@ -23,4 +23,33 @@ def test_analyse_neighbours_surface_coordination():
     assert cn_per_layer[0]["Au_neighboring_w_Cu"] == 3.0
     assert cn_per_layer[1]["Au_neighboring_w_Au"] == 9.0
 
+
+def test_analyse_coordination_table():
+
+    import numpy as np
+    from carmm.analyse.neighbours import get_coordination_table, get_coordination_table_trajectory
+    from examples.data.model_gen import get_example_slab
+
+    model = get_example_slab(adsorbate=True, type="2Cu")
+    model[-1].z -= 1
+    model[-2].z -= 1
+
+    cn_table, layer_table = get_coordination_table(model)
+
+    assert len(cn_table) == len(model)
+    assert layer_table.dtype.names == ('layer', 'Au_neighboring_w_Au', 'Au_neighboring_w_Cu', 'Cu_neighboring_w_Au',
+                                       'Cu_neighboring_w_Cu', 'Au_concentration_per_layer', 'Cu_concentration_per_layer')
+    assert layer_table[0]["Au_neighboring_w_Cu"] == 3.0
+    assert layer_table[1]["Au_neighboring_w_Au"] == 9.0
+    # Cu atoms only present in the adsorbate layer
+    assert np.all(cn_table[cn_table['symbol'] == 'Cu']['layer'] == 0)
+    assert np.allclose(layer_table['Au_concentration_per_layer'] + layer_table['Cu_concentration_per_layer'], 1)
+
+    # Time series over frames, one row of layers per frame
+    series = get_coordination_table_trajectory([model, model])
+    assert series.shape == (2, len(layer_table))
+    assert series[1, 1]["Au_neighboring_w_Au"] == 9.0
+
+
 test_analyse_neighbours_surface_coordination()
+test_analyse_coordination_table()
@@ -11,4 +11,56 @@ def test_analyse_planes():
     # As the adsorbate is 3 Angstrom above the surface, this should be the shortest distance
     assert(1e-5 > abs(3.0 - distances_sorted[0]))
 
+def test_analyse_group_close_contacts():
+
+    import numpy as np
+    from ase.geometry import get_distances
+    from carmm.analyse.planes import get_group_close_contacts
+    from data.model_gen import get_example_slab as slab
+    slab = slab(adsorbate=True)
+
+    surface = list(range(len(slab) - 2))
+    adsorbate = [len(slab) - 2, len(slab) - 1]
+    distances = get_distances(slab.positions[surface], slab.positions[adsorbate], cell=slab.cell, pbc=slab.pbc)[1]
+
+    closest, closest_distances = get_group_close_contacts(slab, surface, adsorbate)
+    assert np.allclose(closest_distances, distances.min(axis=1))
+    assert set(closest) <= set(adsorbate)
+
+    contacts, contact_distances = get_group_close_contacts(slab, surface, adsorbate, cutoff=5.0)
+    assert len(contacts) == np.count_nonzero(distances < 5.0)
+    assert np.allclose(np.sort(contact_distances), np.sort(distances[distances < 5.0]))
+
+def test_analyse_plane_stacking():
+
+    import numpy as np
+    from ase.build import molecule
+    from carmm.analyse.planes import fit_planes, track_plane_stacking
+
+    # Two stacked benzene rings, the upper one tilted by 10 degrees
+    lower = molecule('C6H6')
+    upper = molecule('C6H6')
+    upper.rotate(10, 'x')
+    upper.translate([0.5, 0, 3.4])
+    dimer = lower + upper
+    dimer.cell = [10, 10, 10]
+    dimer.pbc = True
+    rings = [range(12), range(12, 24)]
+
+    centroids, normals, rms = fit_planes(dimer, rings)
+    assert np.allclose(normals[0], [0, 0, 1])
+    assert np.allclose(rms, 0)
+
+    frames = []
+    for shift in [0.0, 0.2, 0.4]:
+        frame = dimer.copy()
+        frame.positions[12:, 2] += shift
+        frames.append(frame)
+    distances, tilts = track_plane_stacking(frames, rings)
+    assert distances.shape == (3, 1)
+    assert np.allclose(distances[:, 0], [3.4, 3.6, 3.8])
+    assert np.allclose(tilts, 10)
+
 test_analyse_planes()
+test_analyse_group_close_contacts()
+test_analyse_plane_stacking()
@@ -17,4 +17,34 @@ def test_vib_analysis():
     plot = plot_vibration_data(x,y,'example vib_analysis')
     plot.plot_vib()
 
+def test_pair_vibrations():
+    import numpy as np
+    from ase.io import read
+    from carmm.analyse.vibrations import get_pair_vibrations, plot_vibration_data
+
+    file = 'data/H2O_vib/vib.1.traj'
+    frames = read(file, ':')
+
+    # All pairs of atoms, ranked by the amplitude of their displacement
+    pairs, distances, amplitudes = get_pair_vibrations(file, pairs="all")
+    assert distances.shape == (len(frames), 3)
+    assert np.all(np.diff(amplitudes) <= 0)
+    for k, (i, j) in enumerate(pairs):
+        assert np.allclose(distances[:, k], [atoms.get_distance(i, j, mic=True) for atoms in frames])
+
+    # Only the O-H bonds of the first frame
+    bonds, bond_distances, bond_amplitudes = get_pair_vibrations(file)
+    assert len(bonds) == 2
+
+    import matplotlib.pyplot as plt
+    plt.figure()
+    labels = plot_vibration_data.get_pair_labels(frames[0], bonds)
+    plot = plot_vibration_data(range(len(bond_distances)), bond_distances, 'example pair vibrations', labels=labels)
+    plot.plot_vib()
+
+    # Each bond has its own legend entry
+    assert [text.get_text() for text in plt.gca().get_legend().get_texts()] == labels
+    plt.close()
+
 test_vib_analysis()
+test_pair_vibrations()
@@ -18,4 +18,30 @@ def test_build_cutout():
     cutout = cutout_sphere(slab, 13)
     assert(len(cutout) == 12)
 
+def test_build_cutout_spheres():
+
+    from ase.build import bulk
+    from carmm.build.cutout import cutout_sphere, cutout_spheres
+
+    # Periodic images are included, so a sphere can be larger than the cell
+    copper = bulk('Cu', 'fcc', a=3.6, cubic=True)
+    clusters = cutout_spheres(copper, [0, 1], [2.6, 3.7], periodic=True)
+
+    # First and second shell of fcc Cu around an atom
+    assert([len(cluster) for cluster in clusters] == [13, 19])
+    assert(not clusters[0].pbc.any())
+    assert(1e-5 > abs(max(clusters[0].get_distances(0, range(13))) - 3.6 / 2**0.5))
+
+    # Without periodic images the cell only holds 4 atoms
+    assert(len(cutout_sphere(copper, 0, 3.7)) == 4)
+    assert(len(cutout_sphere(copper, 0, 3.7, periodic=True)) == 19)
+    assert([len(cluster) for cluster in cutout_spheres(copper, [0, 1], 3.7)] == [4, 4])
+
+    # Atoms at exactly the cutoff are kept, as they always were
+    from ase import Atoms
+    chain = Atoms('H8', positions=[[2.0 * i, 0, 0] for i in range(8)])
+    assert(len(cutout_sphere(chain, 0, 4.0)) == 3)
+    assert(len(cutout_spheres(chain, [0], 4.0)[0]) == 3)
+
 test_build_cutout()
+test_build_cutout_spheres()